@@ -8,30 +8,57 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database.connection import DatabaseManager
-from sqlalchemy import text
+from database.models import StockDailyData, StockInfo
+from sqlalchemy import select, func, case, extract
 from datetime import datetime
 
-def generate_import_summary():
-    """生成数据导入总结报告"""
+# 按股票代码前缀划分的市场类型
+MARKET_TYPE = case(
+    (StockDailyData.symbol.like('60%'), '上海主板'),
+    (StockDailyData.symbol.like('68%'), '上海科创板'),
+    (StockDailyData.symbol.like('00%'), '深圳主板'),
+    (StockDailyData.symbol.like('30%'), '深圳创业板'),
+    (StockDailyData.symbol.like('87%') | StockDailyData.symbol.like('83%'), '北京交易所'),
+    else_='其他'
+)
+
+
+def _open_executor(engine: str):
+    """打开查询执行器：业务数据库会话或DuckDB分析引擎"""
+    if engine == 'duckdb':
+        from src.analytics import AnalyticsEngine
+        analytics = AnalyticsEngine()
+        analytics.sync()
+        return analytics
+    
+    # 初始化数据库连接
+    db_manager = DatabaseManager()
+    return db_manager.get_session()
+
+
+def generate_import_summary(engine: str = 'db'):
+    """
+    生成数据导入总结报告
+    
+    Args:
+        engine: 查询引擎，db为业务数据库，duckdb为同步后的DuckDB分析库
+    """
     print("=" * 80)
     print("深圳交易所和上海交易所股票历史数据导入总结报告")
     print("=" * 80)
     print(f"报告生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print()
     
-    # 初始化数据库连接
-    db_manager = DatabaseManager()
-    
-    with db_manager.get_session() as session:
+    with _open_executor(engine) as session:
         # 总体统计
-        result = session.execute(text('''
-            SELECT 
-                COUNT(*) as total_records,
-                COUNT(DISTINCT symbol) as unique_stocks,
-                MIN(trade_date) as earliest_date,
-                MAX(trade_date) as latest_date
-            FROM stock_daily_data
-        '''))
+        result = session.execute(
+            select(
+                func.count().label('total_records'),
+                func.count(StockDailyData.symbol.distinct()).label('unique_stocks'),
+                func.min(StockDailyData.trade_date).label('earliest_date'),
+                func.max(StockDailyData.trade_date).label('latest_date')
+            )
+        )
         
         stats = result.fetchone()
         print("📊 总体数据统计")
@@ -43,18 +70,18 @@ def generate_import_summary():
         print()
         
         # 按交易所统计
-        result = session.execute(text('''
-            SELECT 
-                s.market,
-                COUNT(*) as record_count,
-                COUNT(DISTINCT d.symbol) as stock_count,
-                MIN(d.trade_date) as earliest_date,
-                MAX(d.trade_date) as latest_date
-            FROM stock_daily_data d
-            JOIN stock_info s ON d.symbol = s.symbol
-            GROUP BY s.market
-            ORDER BY s.market
-        '''))
+        result = session.execute(
+            select(
+                StockInfo.market,
+                func.count().label('record_count'),
+                func.count(StockDailyData.symbol.distinct()).label('stock_count'),
+                func.min(StockDailyData.trade_date).label('earliest_date'),
+                func.max(StockDailyData.trade_date).label('latest_date')
+            )
+            .join(StockInfo, StockDailyData.symbol == StockInfo.symbol)
+            .group_by(StockInfo.market)
+            .order_by(StockInfo.market)
+        )
         
         market_stats = result.fetchall()
         print("🏢 按交易所统计")
@@ -68,16 +95,17 @@ def generate_import_summary():
             print()
         
         # 按年份统计
-        result = session.execute(text('''
-            SELECT 
-                YEAR(trade_date) as year,
-                COUNT(*) as record_count,
-                COUNT(DISTINCT symbol) as stock_count
-            FROM stock_daily_data
-            GROUP BY YEAR(trade_date)
-            ORDER BY year DESC
-            LIMIT 10
-        '''))
+        year = extract('year', StockDailyData.trade_date).label('year')
+        result = session.execute(
+            select(
+                year,
+                func.count().label('record_count'),
+                func.count(StockDailyData.symbol.distinct()).label('stock_count')
+            )
+            .group_by(year)
+            .order_by(year.desc())
+            .limit(10)
+        )
         
         yearly_stats = result.fetchall()
         print("📅 最近10年数据统计")
@@ -87,16 +115,21 @@ def generate_import_summary():
         print()
         
         # 数据质量统计
-        result = session.execute(text('''
-            SELECT 
-                COUNT(*) as total_records,
-                COUNT(CASE WHEN open_price > 0 THEN 1 END) as valid_open,
-                COUNT(CASE WHEN high_price > 0 THEN 1 END) as valid_high,
-                COUNT(CASE WHEN low_price > 0 THEN 1 END) as valid_low,
-                COUNT(CASE WHEN close_price > 0 THEN 1 END) as valid_close,
-                COUNT(CASE WHEN volume > 0 THEN 1 END) as valid_volume
-            FROM stock_daily_data
-        '''))
+        result = session.execute(
+            select(
+                func.count().label('total_records'),
+                *[
+                    func.count(case((column > 0, 1))).label(f'valid_{name}')
+                    for name, column in [
+                        ('open', StockDailyData.open_price),
+                        ('high', StockDailyData.high_price),
+                        ('low', StockDailyData.low_price),
+                        ('close', StockDailyData.close_price),
+                        ('volume', StockDailyData.volume),
+                    ]
+                ]
+            )
+        )
         
         quality_stats = result.fetchone()
         print("✅ 数据质量统计")
@@ -110,31 +143,17 @@ def generate_import_summary():
         print()
         
         # 股票代码分布
-        result = session.execute(text('''
-            SELECT 
-                CASE 
-                    WHEN symbol LIKE '60%' THEN '上海主板'
-                    WHEN symbol LIKE '68%' THEN '上海科创板'
-                    WHEN symbol LIKE '00%' THEN '深圳主板'
-                    WHEN symbol LIKE '30%' THEN '深圳创业板'
-                    WHEN symbol LIKE '87%' OR symbol LIKE '83%' THEN '北京交易所'
-                    ELSE '其他'
-                END as market_type,
-                COUNT(DISTINCT symbol) as stock_count,
-                COUNT(*) as record_count
-            FROM stock_daily_data d
-            JOIN stock_info s ON d.symbol = s.symbol
-            GROUP BY 
-                CASE 
-                    WHEN symbol LIKE '60%' THEN '上海主板'
-                    WHEN symbol LIKE '68%' THEN '上海科创板'
-                    WHEN symbol LIKE '00%' THEN '深圳主板'
-                    WHEN symbol LIKE '30%' THEN '深圳创业板'
-                    WHEN symbol LIKE '87%' OR symbol LIKE '83%' THEN '北京交易所'
-                    ELSE '其他'
-                END
-            ORDER BY stock_count DESC
-        '''))
+        market_type = MARKET_TYPE.label('market_type')
+        result = session.execute(
+            select(
+                market_type,
+                func.count(StockDailyData.symbol.distinct()).label('stock_count'),
+                func.count().label('record_count')
+            )
+            .join(StockInfo, StockDailyData.symbol == StockInfo.symbol)
+            .group_by(market_type)
+            .order_by(func.count(StockDailyData.symbol.distinct()).desc())
+        )
         
         market_type_stats = result.fetchall()
         print("📈 按市场类型统计")
@@ -144,15 +163,22 @@ def generate_import_summary():
         print()
         
         # 数据导入完成度
-        result = session.execute(text('''
-            SELECT 
-                s.market,
-                COUNT(DISTINCT d.symbol) as imported_stocks,
-                (SELECT COUNT(*) FROM stock_info WHERE market = s.market) as total_stocks
-            FROM stock_daily_data d
-            JOIN stock_info s ON d.symbol = s.symbol
-            GROUP BY s.market
-        '''))
+        stock_info_alias = StockInfo.__table__.alias('s')
+        total_stocks = (
+            select(func.count())
+            .select_from(StockInfo.__table__)
+            .where(StockInfo.market == stock_info_alias.c.market)
+            .scalar_subquery()
+        )
+        result = session.execute(
+            select(
+                stock_info_alias.c.market,
+                func.count(StockDailyData.symbol.distinct()).label('imported_stocks'),
+                total_stocks.label('total_stocks')
+            )
+            .join(stock_info_alias, StockDailyData.symbol == stock_info_alias.c.symbol)
+            .group_by(stock_info_alias.c.market)
+        )
         
         completion_stats = result.fetchall()
         print("🎯 数据导入完成度")
@@ -168,4 +194,11 @@ def generate_import_summary():
         print("=" * 80)
 
 if __name__ == "__main__":
-    generate_import_summary()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='数据导入总结报告')
+    parser.add_argument('--engine', choices=['db', 'duckdb'], default='db',
+                        help='查询引擎: db直接查询业务数据库, duckdb先增量同步再在DuckDB中查询')
+    
+    args = parser.parse_args()
+    generate_import_summary(args.engine)
@@ -3,7 +3,11 @@
 数据库模块
 """
 from .connection import db_manager, DatabaseManager
-from .models import StockInfo, StockDailyData, StockTransactionDetail, SystemLog
+from .models import (
+    StockInfo, StockDailyData, StockTransactionDetail, StockAdjFactor, StockMinuteBar,
+    StockOrderFlow, StockDailyFactor, TickArchiveIndex, DataQuarantine,
+    ImportJobUnit, JobRun, SystemLog
+)
 
 __all__ = [
     'db_manager',
@@ -11,5 +15,13 @@ __all__ = [
     'StockInfo',
     'StockDailyData', 
     'StockTransactionDetail',
+    'StockAdjFactor',
+    'StockMinuteBar',
+    'StockOrderFlow',
+    'StockDailyFactor',
+    'TickArchiveIndex',
+    'DataQuarantine',
+    'ImportJobUnit',
+    'JobRun',
     'SystemLog'
 ]
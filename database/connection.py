@@ -3,77 +3,305 @@
 数据库连接管理
 """
 import os
-from sqlalchemy import create_engine
+import threading
+from typing import Dict, List
+from sqlalchemy import create_engine, event, inspect, literal, text
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import QueuePool, StaticPool
 from dotenv import load_dotenv
 from loguru import logger
 
-# 加载环境变量
-load_dotenv()
 
 class DatabaseManager:
-    """数据库管理器"""
+    """数据库管理器（首次使用时才创建引擎和连接池）"""
     
-    def __init__(self):
-        self.engine = None
-        self.SessionLocal = None
-        self._init_database()
+    # 数据库后端 -> 引擎构建方法
+    _BACKENDS = {
+        'mysql': '_build_mysql_engine',
+        'sqlite': '_build_sqlite_engine',
+    }
+    
+    # SQLite连接参数调优
+    _SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'temp_store': 'MEMORY',
+        'cache_size': -65536,        # 64MB页缓存
+        'mmap_size': 268435456,      # 256MB内存映射
+        'busy_timeout': 30000,       # 写锁等待30秒
+    }
+    
+    # 批量写入时每条语句的最大行数
+    BULK_CHUNK_SIZE = 5000
+    
+    # 改名的索引: {(表名, 新索引名): 旧索引名}。SQLite 的索引名全库唯一，日线表和成交明细表的
+    # idx_trade_date 改为各自的名称；已有的 MySQL 库补齐新索引时删除同列的旧索引，避免重复索引
+    RENAMED_INDEXES = {
+        ('stock_daily_data', 'idx_daily_trade_date'): 'idx_trade_date',
+        ('stock_transaction_detail', 'idx_detail_trade_date'): 'idx_trade_date',
+    }
+    
+    def __init__(self, backend: str = None):
+        self._backend = backend
+        self._engine = None
+        self._session_factory = None
+        self._lock = threading.Lock()
+    
+    @property
+    def backend(self) -> str:
+        """数据库后端名称（mysql/sqlite）"""
+        if self._backend is None:
+            load_dotenv()
+            self._backend = os.getenv('DB_BACKEND', 'mysql').lower()
+        return self._backend
+    
+    @property
+    def engine(self):
+        """数据库引擎"""
+        if self._engine is None:
+            self._init_database()
+        return self._engine
+    
+    @property
+    def SessionLocal(self):
+        """会话工厂"""
+        if self._session_factory is None:
+            self._init_database()
+        return self._session_factory
     
     def _init_database(self):
         """初始化数据库连接"""
+        with self._lock:
+            if self._engine is not None:
+                return
+            self._create_engine()
+    
+    def _create_engine(self):
+        """创建数据库引擎和会话工厂"""
         try:
-            # 从环境变量获取数据库配置
-            db_host = os.getenv('DB_HOST', 'localhost')
-            db_port = os.getenv('DB_PORT', '3306')
-            db_user = os.getenv('DB_USER', 'root')
-            db_password = os.getenv('DB_PASSWORD', '')
-            db_name = os.getenv('DB_NAME', 'quantitative_finance')
+            # 加载环境变量
+            load_dotenv()
             
-            # 构建数据库连接URL
-            database_url = f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}?charset=utf8mb4"
+            builder = self._BACKENDS.get(self.backend)
+            if builder is None:
+                raise ValueError(f"不支持的数据库后端: {self.backend}")
             
-            # 创建数据库引擎
-            self.engine = create_engine(
-                database_url,
-                poolclass=QueuePool,
-                pool_size=10,
-                max_overflow=20,
-                pool_pre_ping=True,
-                pool_recycle=3600,
-                echo=False  # 设置为True可以看到SQL语句
-            )
+            engine, description = getattr(self, builder)()
             
             # 创建会话工厂
-            self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+            self._session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            self._engine = engine
             
-            logger.info(f"数据库连接初始化成功: {db_host}:{db_port}/{db_name}")
+            logger.info(f"数据库连接初始化成功: {description}")
             
         except Exception as e:
             logger.error(f"数据库连接初始化失败: {e}")
             raise
     
+    def _build_mysql_engine(self):
+        """创建MySQL引擎"""
+        # 从环境变量获取数据库配置
+        db_host = os.getenv('DB_HOST', 'localhost')
+        db_port = os.getenv('DB_PORT', '3306')
+        db_user = os.getenv('DB_USER', 'root')
+        db_password = os.getenv('DB_PASSWORD', '')
+        db_name = os.getenv('DB_NAME', 'quantitative_finance')
+        
+        # 构建数据库连接URL
+        database_url = f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}?charset=utf8mb4"
+        
+        # 创建数据库引擎
+        engine = create_engine(
+            database_url,
+            poolclass=QueuePool,
+            pool_size=10,
+            max_overflow=20,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            echo=False  # 设置为True可以看到SQL语句
+        )
+        return engine, f"{db_host}:{db_port}/{db_name}"
+    
+    def _build_sqlite_engine(self):
+        """创建SQLite引擎（WAL模式，适合单机和离线部署）"""
+        sqlite_path = os.getenv('SQLITE_PATH', 'data/quantitative_finance.db')
+        
+        if sqlite_path == ':memory:':
+            engine = create_engine(
+                'sqlite://',
+                connect_args={'check_same_thread': False},
+                poolclass=StaticPool,
+                echo=False
+            )
+        else:
+            db_dir = os.path.dirname(sqlite_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            
+            engine = create_engine(
+                f"sqlite:///{sqlite_path}",
+                connect_args={'check_same_thread': False, 'timeout': 30},
+                poolclass=QueuePool,
+                pool_size=5,
+                max_overflow=10,
+                echo=False
+            )
+        
+        @event.listens_for(engine, 'connect')
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in self._SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+        
+        return engine, f"sqlite:{sqlite_path}"
+    
     def get_session(self):
         """获取数据库会话"""
-        if self.SessionLocal is None:
-            raise Exception("数据库未初始化")
         return self.SessionLocal()
     
     def create_tables(self):
-        """创建所有表"""
+        """创建所有表，已有的表补齐模型中新增的列和索引"""
         try:
             from .models import Base
             Base.metadata.create_all(bind=self.engine)
+            self.ensure_schema(Base.metadata)
             logger.info("数据库表创建成功")
         except Exception as e:
             logger.error(f"创建数据库表失败: {e}")
             raise
     
+    def ensure_schema(self, metadata) -> List[str]:
+        """
+        已有的表补齐模型中新增的列和索引（create_all 只创建不存在的表，不修改已有的表），可重复执行
+        
+        新增的列按可为空添加，模型中有标量默认值时带上 DEFAULT（已有行取该值）；
+        创建改名的索引时删除列相同的旧索引
+        
+        Returns:
+            补齐的列和索引名称
+        """
+        dialect = self.engine.dialect
+        preparer = dialect.identifier_preparer
+        inspector = inspect(self.engine)
+        changes = []
+        with self.engine.begin() as conn:
+            for table in metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing:
+                        continue
+                    ddl = (f"ALTER TABLE {preparer.format_table(table)} "
+                           f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=dialect)}")
+                    if column.default is not None and column.default.is_scalar:
+                        default = literal(column.default.arg).compile(dialect=dialect,
+                                                                      compile_kwargs={'literal_binds': True})
+                        ddl += f" DEFAULT {default}"
+                    conn.execute(text(ddl))
+                    changes.append(f"{table.name}.{column.name}")
+                
+                existing_indexes = {index['name']: index['column_names'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing_indexes:
+                        continue
+                    legacy = self.RENAMED_INDEXES.get((table.name, index.name))
+                    if legacy and existing_indexes.get(legacy) == [column.name for column in index.columns]:
+                        self._drop_index(conn, table, legacy)
+                        logger.info(f"删除已改名的旧索引: {table.name}.{legacy}")
+                    index.create(conn)
+                    changes.append(f"{table.name}.{index.name}")
+        
+        if changes:
+            logger.info(f"已有数据库表补齐列和索引: {', '.join(changes)}")
+        return changes
+    
+    def _drop_index(self, conn, table, name: str):
+        """删除表上的索引（MySQL 的索引属于表，SQLite 的索引名全库唯一）"""
+        preparer = self.engine.dialect.identifier_preparer
+        ddl = f"DROP INDEX {preparer.quote(name)}"
+        if self.backend == 'mysql':
+            ddl += f" ON {preparer.format_table(table)}"
+        conn.execute(text(ddl))
+    
+    def bulk_insert(self, session, model, rows: List[Dict], chunk_size: int = None) -> int:
+        """批量插入（多行INSERT，不经过ORM对象）"""
+        if not rows:
+            return 0
+        
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        table = model.__table__
+        for start in range(0, len(rows), chunk_size):
+            session.execute(table.insert(), rows[start:start + chunk_size])
+        return len(rows)
+    
+    def upsert(self, session, model, rows: List[Dict], index_elements: List[str],
+               update_columns: List[str] = None, chunk_size: int = None) -> int:
+        """
+        批量插入或更新
+        
+        Args:
+            session: 数据库会话
+            model: ORM模型类
+            rows: 记录列表
+            index_elements: 唯一约束对应的列
+            update_columns: 冲突时更新的列，默认为除唯一约束外的全部列
+        """
+        if not rows:
+            return 0
+        
+        table = model.__table__
+        if update_columns is None:
+            update_columns = [col for col in rows[0] if col not in index_elements]
+        
+        if self.backend == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table)
+            stmt = stmt.on_duplicate_key_update({col: stmt.inserted[col] for col in update_columns})
+        elif self.backend == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=index_elements,
+                set_={col: stmt.excluded[col] for col in update_columns}
+            )
+        else:
+            raise ValueError(f"不支持的数据库后端: {self.backend}")
+        
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        for start in range(0, len(rows), chunk_size):
+            session.execute(stmt, rows[start:start + chunk_size])
+        return len(rows)
+    
+    def insert_ignore(self, session, model, rows: List[Dict], chunk_size: int = None) -> int:
+        """批量插入，与唯一约束冲突的记录跳过（不更新已有记录）"""
+        if not rows:
+            return 0
+        
+        table = model.__table__
+        if self.backend == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table).prefix_with('IGNORE')
+        elif self.backend == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table).on_conflict_do_nothing()
+        else:
+            raise ValueError(f"不支持的数据库后端: {self.backend}")
+        
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        for start in range(0, len(rows), chunk_size):
+            session.execute(stmt, rows[start:start + chunk_size])
+        return len(rows)
+    
     def close(self):
         """关闭数据库连接"""
-        if self.engine:
-            self.engine.dispose()
-            logger.info("数据库连接已关闭")
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+                self._session_factory = None
+                logger.info("数据库连接已关闭")
 
-# 全局数据库管理器实例
+# 全局数据库管理器实例（不会在导入时连接数据库）
 db_manager = DatabaseManager()
@@ -2,7 +2,7 @@
 """
 数据库模型定义
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Text, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, Text, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -20,6 +20,7 @@ class StockInfo(Base):
     market = Column(String(10), nullable=False, comment='市场类型(SH/SZ)')
     industry = Column(String(50), comment='所属行业')
     list_date = Column(Date, comment='上市日期')
+    delist_date = Column(Date, comment='退市日期（未退市为空）')
     created_at = Column(DateTime, default=func.now(), comment='创建时间')
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment='更新时间')
     
@@ -47,7 +48,8 @@ class StockDailyData(Base):
     
     __table_args__ = (
         Index('idx_symbol_date', 'symbol', 'trade_date'),
-        Index('idx_trade_date', 'trade_date'),
+        Index('idx_daily_trade_date', 'trade_date'),
+        Index('idx_daily_created_at', 'created_at'),
     )
 
 
@@ -67,7 +69,205 @@ class StockTransactionDetail(Base):
     
     __table_args__ = (
         Index('idx_symbol_date_time', 'symbol', 'trade_date', 'trade_time'),
-        Index('idx_trade_date', 'trade_date'),
+        Index('idx_detail_trade_date', 'trade_date'),
+    )
+
+
+class StockAdjFactor(Base):
+    """股票复权因子表（后复权因子，只记录因子变化的日期）"""
+    __tablename__ = 'stock_adj_factor'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    symbol = Column(String(10), nullable=False, comment='股票代码')
+    trade_date = Column(Date, nullable=False, comment='因子生效日期')
+    adj_factor = Column(Float, nullable=False, comment='后复权因子')
+    created_at = Column(DateTime, default=func.now(), comment='创建时间')
+    
+    __table_args__ = (
+        UniqueConstraint('symbol', 'trade_date', name='uk_adj_factor'),
+    )
+
+
+class StockMinuteBar(Base):
+    """股票分钟K线表（由成交明细聚合）"""
+    __tablename__ = 'stock_minute_bar'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    symbol = Column(String(10), nullable=False, comment='股票代码')
+    trade_date = Column(Date, nullable=False, comment='交易日期')
+    bar_time = Column(DateTime, nullable=False, comment='K线结束时间')
+    freq = Column(Integer, nullable=False, comment='K线周期(分钟)')
+    open_price = Column(Float, comment='开盘价')
+    high_price = Column(Float, comment='最高价')
+    low_price = Column(Float, comment='最低价')
+    close_price = Column(Float, comment='收盘价')
+    volume = Column(Integer, comment='成交量')
+    amount = Column(Float, comment='成交额')
+    vwap = Column(Float, comment='成交量加权均价')
+    buy_volume = Column(Integer, comment='主动买入量')
+    sell_volume = Column(Integer, comment='主动卖出量')
+    tick_count = Column(Integer, comment='成交笔数')
+    created_at = Column(DateTime, default=func.now(), comment='创建时间')
+    
+    __table_args__ = (
+        UniqueConstraint('symbol', 'freq', 'bar_time', name='uk_minute_bar'),
+        Index('idx_minute_bar_date', 'trade_date'),
+    )
+
+
+class StockOrderFlow(Base):
+    """股票日内资金流汇总表（成交明细入库时增量汇总）"""
+    __tablename__ = 'stock_order_flow'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    symbol = Column(String(10), nullable=False, comment='股票代码')
+    trade_date = Column(Date, nullable=False, comment='交易日期')
+    tick_count = Column(Integer, comment='成交笔数')
+    volume = Column(Integer, comment='成交量')
+    amount = Column(Float, comment='成交额')
+    buy_volume = Column(Integer, comment='主动买入量')
+    sell_volume = Column(Integer, comment='主动卖出量')
+    neutral_volume = Column(Integer, comment='中性成交量')
+    buy_amount = Column(Float, comment='主动买入额')
+    sell_amount = Column(Float, comment='主动卖出额')
+    buy_count = Column(Integer, comment='主动买入笔数')
+    sell_count = Column(Integer, comment='主动卖出笔数')
+    large_buy_amount = Column(Float, comment='大单买入额')
+    large_sell_amount = Column(Float, comment='大单卖出额')
+    large_buy_count = Column(Integer, comment='大单买入笔数')
+    large_sell_count = Column(Integer, comment='大单卖出笔数')
+    vwap = Column(Float, comment='成交量加权均价')
+    open_price = Column(Float, comment='首笔成交价')
+    high_price = Column(Float, comment='最高成交价')
+    low_price = Column(Float, comment='最低成交价')
+    close_price = Column(Float, comment='最新成交价')
+    order_imbalance = Column(Float, comment='买卖失衡度(买量-卖量)/(买量+卖量)')
+    volume_profile = Column(String(200), comment='日内成交量分布(每30分钟一档,逗号分隔)')
+    last_trade_time = Column(DateTime, comment='已汇总的最后成交时间')
+    last_time_count = Column(Integer, comment='最后成交时间上已汇总的笔数')
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment='更新时间')
+    
+    __table_args__ = (
+        UniqueConstraint('symbol', 'trade_date', name='uk_order_flow'),
+        Index('idx_order_flow_date', 'trade_date'),
+    )
+
+
+class StockDailyFactor(Base):
+    """股票日频技术指标表（由因子引擎增量计算，价格类指标为当日不复权口径）"""
+    __tablename__ = 'stock_daily_factor'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    symbol = Column(String(10), nullable=False, comment='股票代码')
+    trade_date = Column(Date, nullable=False, comment='交易日期')
+    ma5 = Column(Float, comment='5日均价')
+    ma10 = Column(Float, comment='10日均价')
+    ma20 = Column(Float, comment='20日均价')
+    ma60 = Column(Float, comment='60日均价')
+    ema12 = Column(Float, comment='12日指数均价')
+    ema26 = Column(Float, comment='26日指数均价')
+    macd_dif = Column(Float, comment='MACD DIF')
+    macd_dea = Column(Float, comment='MACD DEA')
+    rsi14 = Column(Float, comment='14日RSI')
+    atr14 = Column(Float, comment='14日ATR')
+    volatility20 = Column(Float, comment='20日年化波动率')
+    volume_ratio = Column(Float, comment='量比(当日成交量/前5日均量)')
+    amount_ma20 = Column(Float, comment='20日平均成交额')
+    created_at = Column(DateTime, default=func.now(), comment='创建时间')
+    
+    __table_args__ = (
+        UniqueConstraint('symbol', 'trade_date', name='uk_daily_factor'),
+        Index('idx_daily_factor_date', 'trade_date'),
+    )
+
+
+class TickArchiveIndex(Base):
+    """成交明细归档索引表（每只股票每月一个归档文件）"""
+    __tablename__ = 'tick_archive_index'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    symbol = Column(String(10), nullable=False, comment='股票代码')
+    month = Column(Date, nullable=False, comment='归档月份(当月1日)')
+    start_date = Column(Date, nullable=False, comment='首个交易日期')
+    end_date = Column(Date, nullable=False, comment='最后交易日期')
+    row_count = Column(Integer, nullable=False, comment='成交笔数')
+    file_path = Column(String(255), nullable=False, comment='归档文件路径(相对归档目录)')
+    file_size = Column(Integer, comment='文件大小(字节)')
+    version = Column(Integer, nullable=False, default=1, comment='归档版本')
+    created_at = Column(DateTime, default=func.now(), comment='创建时间')
+    
+    __table_args__ = (
+        UniqueConstraint('symbol', 'month', name='uk_tick_archive'),
+        Index('idx_tick_archive_month', 'month'),
+    )
+
+
+class DataQuarantine(Base):
+    """数据隔离表（入库前校验不合格的记录）"""
+    __tablename__ = 'data_quarantine'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_table = Column(String(50), nullable=False, comment='目标数据表')
+    symbol = Column(String(10), comment='股票代码')
+    trade_date = Column(Date, comment='交易日期')
+    reasons = Column(String(200), nullable=False, comment='不合格原因')
+    payload = Column(Text, nullable=False, comment='原始记录(JSON)')
+    created_at = Column(DateTime, default=func.now(), comment='创建时间')
+    
+    __table_args__ = (
+        Index('idx_quarantine_source_date', 'source_table', 'trade_date'),
+    )
+
+
+class ImportJobUnit(Base):
+    """批量导入任务单元表（断点续传和多主机分布式领取：每个单元为 股票 × 数据类型 × 日期范围）"""
+    __tablename__ = 'import_job_unit'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_name = Column(String(64), nullable=False, comment='导入任务名称')
+    data_type = Column(String(20), nullable=False, comment='数据类型(daily/transaction/adj_factor)')
+    symbol = Column(String(10), nullable=False, comment='股票代码')
+    start_date = Column(Date, nullable=False, comment='开始日期')
+    end_date = Column(Date, nullable=False, comment='结束日期')
+    status = Column(String(20), nullable=False, default='pending', comment='状态(pending/running/done/failed)')
+    row_count = Column(Integer, default=0, comment='保存的记录数')
+    attempts = Column(Integer, default=0, comment='已尝试次数')
+    last_error = Column(Text, comment='最近一次错误信息')
+    next_retry_at = Column(DateTime, comment='失败后的下次重试时间')
+    started_at = Column(DateTime, comment='最近一次开始时间')
+    finished_at = Column(DateTime, comment='完成时间')
+    lease_owner = Column(String(64), comment='领取该单元的工作进程(主机名:进程号)')
+    lease_expires_at = Column(DateTime, comment='租约到期时间，到期未续约的单元可被其他工作进程重新领取')
+    heartbeat_at = Column(DateTime, comment='最近一次心跳时间')
+    priority = Column(Float, default=0, comment='优先级，领取时优先级高的单元先领取')
+    created_at = Column(DateTime, default=func.now(), comment='创建时间')
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment='更新时间')
+    
+    __table_args__ = (
+        UniqueConstraint('job_name', 'data_type', 'symbol', 'start_date', 'end_date', name='uk_import_job_unit'),
+        Index('idx_import_job_status', 'job_name', 'data_type', 'status'),
+        Index('idx_import_job_lease', 'status', 'lease_expires_at'),
+        Index('idx_import_job_priority', 'status', 'priority'),
+    )
+
+
+class JobRun(Base):
+    """定时任务运行记录表"""
+    __tablename__ = 'job_run'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_name = Column(String(50), nullable=False, comment='任务名称')
+    status = Column(String(20), nullable=False, comment='状态(running/success/failed/timeout/skipped)')
+    scheduled_at = Column(DateTime, comment='计划执行时间')
+    started_at = Column(DateTime, comment='实际开始时间')
+    finished_at = Column(DateTime, comment='结束时间')
+    start_latency = Column(Float, comment='启动延迟(秒)')
+    duration = Column(Float, comment='运行时长(秒)')
+    error_message = Column(Text, comment='错误信息')
+    created_at = Column(DateTime, default=func.now(), comment='创建时间')
+    
+    __table_args__ = (
+        Index('idx_job_run_name_start', 'job_name', 'started_at'),
     )
 
 
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按交易所/板块并行导入历史日线数据
+
+示例: python import_stocks.py --markets SH SZ BSE --start-date 20200101
+"""
+import sys
+import os
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.exchange_importer import main
+
+if __name__ == "__main__":
+    main()
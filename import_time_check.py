@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行入口导入耗时检查
+
+使用 python -X importtime 在子进程中导入各入口模块，统计总导入耗时并与预算比较，
+超出预算时以非零状态码退出，便于在CI中发现重新引入的重量级导入。
+"""
+import sys
+import os
+import re
+import subprocess
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 入口模块及其导入耗时预算（毫秒），可通过环境变量 IMPORT_BUDGET_<模块名大写> 覆盖
+DEFAULT_BUDGETS = {
+    'main': 300,
+    'monitor': 1500,
+    'batch_import': 1500,
+}
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure_import(module: str) -> dict:
+    """在独立子进程中测量模块导入耗时"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败: {proc.stderr.strip().splitlines()[-1:]}")
+
+    total_us = 0
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules.append((name, int(self_us), int(cumulative_us)))
+        # 缩进为一个空格的是顶层导入，其累计耗时之和即总耗时
+        if len(indent) == 1:
+            total_us += int(cumulative_us)
+
+    slowest = sorted(modules, key=lambda m: m[2], reverse=True)[:10]
+    return {'module': module, 'total_ms': total_us / 1000, 'slowest': slowest}
+
+
+def measure_help(script: str) -> float:
+    """测量 `python <script> --help` 的墙钟耗时（毫秒）"""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, script, '--help'],
+        cwd=ROOT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='检查命令行入口的导入耗时')
+    parser.add_argument('--modules', nargs='+', default=list(DEFAULT_BUDGETS), help='要检查的入口模块')
+    parser.add_argument('--verbose', action='store_true', help='显示最慢的导入模块')
+
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        budget = float(os.getenv(f'IMPORT_BUDGET_{module.upper()}', DEFAULT_BUDGETS.get(module, 500)))
+        try:
+            result = measure_import(module)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            over_budget.append(module)
+            continue
+
+        status = '✅' if result['total_ms'] <= budget else '❌'
+        print(f"{status} {module}: 导入耗时 {result['total_ms']:.1f} ms (预算 {budget:.0f} ms)")
+
+        if args.verbose:
+            for name, self_us, cumulative_us in result['slowest']:
+                print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+
+        if result['total_ms'] > budget:
+            over_budget.append(module)
+
+    for script in ('main.py', 'batch_import.py'):
+        if os.path.splitext(script)[0] in args.modules:
+            print(f"   python {script} --help: {measure_help(script):.1f} ms")
+
+    if over_budget:
+        print(f"超出导入耗时预算: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
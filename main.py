@@ -11,13 +11,12 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from src.config import Config
-from src.scheduler import TaskScheduler
-from database import db_manager
 
 
 def init_database():
     """初始化数据库"""
     try:
+        from database import db_manager
         print("正在初始化数据库...")
         db_manager.create_tables()
         print("数据库初始化完成")
@@ -31,6 +30,7 @@ def run_scheduler():
     """运行定时调度器"""
     try:
         print("启动定时任务调度器...")
+        from src.scheduler import TaskScheduler
         scheduler = TaskScheduler()
         scheduler.run_scheduler()
     except KeyboardInterrupt:
@@ -39,17 +39,79 @@ def run_scheduler():
         print(f"调度器运行失败: {e}")
 
 
-def run_once():
-    """执行一次数据采集"""
+def run_once(stages=None):
+    """执行一次数据采集（stages指定时只执行收盘后流水线的这些阶段）"""
     try:
         print("执行一次性数据采集...")
+        from src.scheduler import TaskScheduler
         scheduler = TaskScheduler()
-        scheduler.run_once()
+        scheduler.run_once(stages)
         print("数据采集完成")
     except Exception as e:
         print(f"数据采集失败: {e}")
 
 
+def archive_ticks():
+    """归档历史成交明细"""
+    try:
+        print("归档历史成交明细...")
+        from src.tick_archive import TickArchive
+        results = TickArchive().archive()
+        print(f"归档完成: {results['files']} 个文件, {results['rows']} 条记录, 失败 {results['failed']} 个")
+    except Exception as e:
+        print(f"归档成交明细失败: {e}")
+
+
+def build_price_panel():
+    """全量重建价格面板"""
+    try:
+        print("构建价格面板...")
+        from src.price_panel import PanelBuilder
+        trade_days = PanelBuilder().build()
+        print(f"价格面板构建完成: {trade_days} 个交易日")
+    except Exception as e:
+        print(f"构建价格面板失败: {e}")
+
+
+def update_factors(rebuild: bool = False):
+    """增量计算技术指标"""
+    try:
+        print("计算技术指标...")
+        from src.factor_engine import FactorEngine
+        engine = FactorEngine()
+        if rebuild:
+            engine.reset()
+        trade_days = engine.update()
+        print(f"技术指标计算完成: {trade_days} 个交易日")
+    except Exception as e:
+        print(f"计算技术指标失败: {e}")
+
+
+def build_covariance(rebuild: bool = False):
+    """计算协方差矩阵（默认增量更新）"""
+    try:
+        print("计算协方差矩阵...")
+        from src.covariance import CovarianceEngine
+        engine = CovarianceEngine()
+        success = engine.build() if rebuild else engine.update() >= 0
+        print("协方差矩阵计算完成" if success else "协方差矩阵计算失败")
+    except Exception as e:
+        print(f"计算协方差矩阵失败: {e}")
+
+
+def run_screen(expression: str):
+    """按表达式在最新截面上选股"""
+    try:
+        from src.screener import Screener
+        screener = Screener()
+        result = screener.screen(expression, sort_by='pct_change')
+        print(f"选股日期: {screener.cross_section.trade_date}, 命中 {len(result)} 只股票")
+        if not result.empty:
+            print(result.to_string())
+    except Exception as e:
+        print(f"选股失败: {e}")
+
+
 def show_status():
     """显示系统状态"""
     try:
@@ -78,8 +140,20 @@ def main():
     parser = argparse.ArgumentParser(description='量化金融系统')
     parser.add_argument('--init', action='store_true', help='初始化数据库')
     parser.add_argument('--once', action='store_true', help='执行一次数据采集')
+    parser.add_argument('--stages', nargs='+', metavar='STAGE',
+                        help='配合 --once：只执行收盘后流水线的这些阶段，例如 --stages rollups exports')
     parser.add_argument('--status', action='store_true', help='显示系统状态')
     parser.add_argument('--scheduler', action='store_true', help='运行定时调度器')
+    parser.add_argument('--archive-ticks', action='store_true', help='归档保留期之前的成交明细')
+    parser.add_argument('--build-panel', action='store_true', help='全量重建价格面板')
+    parser.add_argument('--update-factors', action='store_true', help='增量计算技术指标')
+    parser.add_argument('--rebuild-factors', action='store_true', help='清除状态后重新计算全部技术指标')
+    parser.add_argument('--update-covariance', action='store_true', help='增量更新协方差矩阵')
+    parser.add_argument('--rebuild-covariance', action='store_true', help='全量重新计算协方差矩阵')
+    parser.add_argument('--screen', metavar='EXPR', help="按表达式选股，例如 \"close > ma20 and pct_change > 5\"")
+    parser.add_argument('--metrics-json', metavar='PATH', help='运行结束时把运行指标写入该JSON文件，默认 METRICS_JSON_PATH')
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=('cprofile', 'sample'),
+                        help='性能剖析（cprofile 或 sample，默认cprofile），结束时输出热点函数和各分段耗时')
     
     args = parser.parse_args()
     
@@ -94,6 +168,11 @@ def main():
         print(f"配置验证失败: {e}")
         return
     
+    from src.metrics import dump_metrics_on_exit
+    from src.tracing import setup_tracing
+    dump_metrics_on_exit(args.metrics_json)
+    setup_tracing(args.profile)
+    
     # 根据参数执行相应操作
     if args.init:
         if init_database():
@@ -101,11 +180,21 @@ def main():
         else:
             print("系统初始化失败！")
     elif args.once:
-        run_once()
+        run_once(args.stages)
     elif args.status:
         show_status()
     elif args.scheduler:
         run_scheduler()
+    elif args.archive_ticks:
+        archive_ticks()
+    elif args.build_panel:
+        build_price_panel()
+    elif args.update_factors or args.rebuild_factors:
+        update_factors(rebuild=args.rebuild_factors)
+    elif args.update_covariance or args.rebuild_covariance:
+        build_covariance(rebuild=args.rebuild_covariance)
+    elif args.screen:
+        run_screen(args.screen)
     else:
         # 默认运行调度器
         print("未指定操作，默认运行定时调度器...")
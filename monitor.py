@@ -9,9 +9,10 @@ from datetime import datetime, timedelta
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from sqlalchemy import select, func
 from src.config import Config
 from src.data_storage import DataStorage
-from database import db_manager
+from database import db_manager, StockDailyData, StockTransactionDetail, SystemLog
 
 
 def get_system_status():
@@ -48,27 +49,24 @@ def get_system_status():
         
         # 查询最近7天的日线数据
         seven_days_ago = today - timedelta(days=7)
-        from sqlalchemy import text
-        recent_daily = session.execute(text(f"""
-            SELECT trade_date, COUNT(*) as count 
-            FROM stock_daily_data 
-            WHERE trade_date >= '{seven_days_ago}' 
-            GROUP BY trade_date 
-            ORDER BY trade_date DESC
-        """)).fetchall()
+        recent_daily = session.execute(
+            select(StockDailyData.trade_date, func.count())
+            .where(StockDailyData.trade_date >= seven_days_ago)
+            .group_by(StockDailyData.trade_date)
+            .order_by(StockDailyData.trade_date.desc())
+        ).fetchall()
         
         print("日线数据:")
         for row in recent_daily:
             print(f"  {row[0]}: {row[1]} 条")
         
         # 查询最近7天的成交明细
-        recent_transaction = session.execute(text(f"""
-            SELECT trade_date, COUNT(*) as count 
-            FROM stock_transaction_detail 
-            WHERE trade_date >= '{seven_days_ago}' 
-            GROUP BY trade_date 
-            ORDER BY trade_date DESC
-        """)).fetchall()
+        recent_transaction = session.execute(
+            select(StockTransactionDetail.trade_date, func.count())
+            .where(StockTransactionDetail.trade_date >= seven_days_ago)
+            .group_by(StockTransactionDetail.trade_date)
+            .order_by(StockTransactionDetail.trade_date.desc())
+        ).fetchall()
         
         print("成交明细:")
         for row in recent_transaction:
@@ -93,9 +91,9 @@ def get_system_status():
             print("✅ 今日成交明细数据正常")
         
         # 检查最新数据时间
-        latest_daily = session.execute(text("""
-            SELECT MAX(trade_date) FROM stock_daily_data
-        """)).fetchone()
+        latest_daily = session.execute(
+            select(func.max(StockDailyData.trade_date))
+        ).fetchone()
         
         if latest_daily and latest_daily[0]:
             days_diff = (today - latest_daily[0]).days
@@ -119,27 +117,24 @@ def get_top_stocks():
         today = datetime.now().date()
         
         # 按成交量排序
-        from sqlalchemy import text
-        top_volume = session.execute(text(f"""
-            SELECT symbol, volume, amount 
-            FROM stock_daily_data 
-            WHERE trade_date = '{today}' 
-            ORDER BY volume DESC 
-            LIMIT 10
-        """)).fetchall()
+        top_volume = session.execute(
+            select(StockDailyData.symbol, StockDailyData.volume, StockDailyData.amount)
+            .where(StockDailyData.trade_date == today)
+            .order_by(StockDailyData.volume.desc())
+            .limit(10)
+        ).fetchall()
         
         print("成交量排行:")
         for i, row in enumerate(top_volume, 1):
             print(f"  {i:2d}. {row[0]} - 成交量: {row[1]:,} 成交额: {row[2]:,.2f}")
         
         # 按成交额排序
-        top_amount = session.execute(text(f"""
-            SELECT symbol, volume, amount 
-            FROM stock_daily_data 
-            WHERE trade_date = '{today}' 
-            ORDER BY amount DESC 
-            LIMIT 10
-        """)).fetchall()
+        top_amount = session.execute(
+            select(StockDailyData.symbol, StockDailyData.volume, StockDailyData.amount)
+            .where(StockDailyData.trade_date == today)
+            .order_by(StockDailyData.amount.desc())
+            .limit(10)
+        ).fetchall()
         
         print("\n成交额排行:")
         for i, row in enumerate(top_amount, 1):
@@ -159,14 +154,12 @@ def get_system_logs():
         session = db_manager.get_session()
         
         # 获取最近10条错误日志
-        from sqlalchemy import text
-        error_logs = session.execute(text("""
-            SELECT level, message, created_at 
-            FROM system_log 
-            WHERE level = 'ERROR' 
-            ORDER BY created_at DESC 
-            LIMIT 10
-        """)).fetchall()
+        error_logs = session.execute(
+            select(SystemLog.level, SystemLog.message, SystemLog.created_at)
+            .where(SystemLog.level == 'ERROR')
+            .order_by(SystemLog.created_at.desc())
+            .limit(10)
+        ).fetchall()
         
         if error_logs:
             print("错误日志:")
@@ -176,13 +169,12 @@ def get_system_logs():
             print("✅ 没有错误日志")
         
         # 获取最近10条信息日志
-        info_logs = session.execute(text("""
-            SELECT level, message, created_at 
-            FROM system_log 
-            WHERE level = 'INFO' 
-            ORDER BY created_at DESC 
-            LIMIT 10
-        """)).fetchall()
+        info_logs = session.execute(
+            select(SystemLog.level, SystemLog.message, SystemLog.created_at)
+            .where(SystemLog.level == 'INFO')
+            .order_by(SystemLog.created_at.desc())
+            .limit(10)
+        ).fetchall()
         
         if info_logs:
             print("\n信息日志:")
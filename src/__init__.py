@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 """
 量化金融系统核心模块
+
+子模块按需导入，避免仅使用配置时也加载pandas、数据源等重量级依赖
 """
-from .data_fetcher import StockDataFetcher
-from .data_storage import DataStorage
-from .scheduler import TaskScheduler
-from .config import Config
+import importlib
+
+_LAZY_ATTRS = {
+    'StockDataFetcher': 'src.data_fetcher',
+    'DataStorage': 'src.data_storage',
+    'TaskScheduler': 'src.scheduler',
+    'Config': 'src.config',
+}
 
 __all__ = [
     'StockDataFetcher',
@@ -13,3 +19,11 @@ __all__ = [
     'TaskScheduler',
     'Config'
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
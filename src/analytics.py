@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+DuckDB分析查询模块
+
+把 stock_daily_data、stock_transaction_detail 等表按自增id增量同步到本地DuckDB列式数据库，
+每次同步重新读取已同步最大id之前 ANALYTICS_SYNC_OVERLAP 个id的记录并按id去重
+（并发写入时id较小的事务可能较晚提交，只按 id > 已同步最大id 读取会漏掉这些记录），
+跨截面的研究查询（多年收益、按市场/板块分组、分位数排名）在DuckDB中执行，
+结果以pandas DataFrame或Arrow Table返回。
+"""
+import os
+from datetime import date
+from typing import Dict, List, Union
+import pandas as pd
+from loguru import logger
+from sqlalchemy import select, Integer, String, Float, Date, DateTime, Text
+from sqlalchemy.exc import CompileError
+from sqlalchemy.dialects.postgresql.base import PGDialect
+
+from src.config import Config
+from database.models import StockInfo, StockDailyData, StockTransactionDetail, StockAdjFactor
+
+
+class AnalyticsEngine:
+    """DuckDB分析引擎"""
+
+    # 按自增id增量同步的表
+    INCREMENTAL_MODELS = [StockDailyData, StockTransactionDetail]
+    # 数据量小、会被整体重写的表，每次全量同步
+    FULL_MODELS = [StockInfo, StockAdjFactor]
+    # 重新导入时在业务数据库中按业务键删除后重新插入（id改变）的表，同步时按业务键替换镜像表中的旧记录
+    REPLACE_KEYS = {StockDailyData: ('symbol', 'trade_date')}
+
+    _TYPE_MAPPING = [
+        (Integer, 'BIGINT'),
+        (Float, 'DOUBLE'),
+        (DateTime, 'TIMESTAMP'),
+        (Date, 'DATE'),
+        (Text, 'VARCHAR'),
+        (String, 'VARCHAR'),
+    ]
+
+    def __init__(self, duckdb_path: str = None, db_manager=None, read_only: bool = False):
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("分析模块需要安装duckdb: pip install duckdb pyarrow")
+
+        if db_manager is None:
+            from database import db_manager
+        self.db_manager = db_manager
+        self.duckdb_path = duckdb_path or Config.ANALYTICS_DB_PATH
+
+        if self.duckdb_path != ':memory:':
+            db_dir = os.path.dirname(self.duckdb_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+
+        self.con = duckdb.connect(self.duckdb_path, read_only=read_only)
+        # DuckDB的SQL方言与PostgreSQL兼容，Core语句按PostgreSQL编译
+        self._dialect = PGDialect(paramstyle='qmark')
+
+        if not read_only:
+            self._init_schema()
+        logger.info(f"分析引擎初始化完成: {self.duckdb_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _init_schema(self):
+        """创建同步状态表和镜像表"""
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS _sync_state (
+                table_name VARCHAR PRIMARY KEY,
+                last_id BIGINT NOT NULL
+            )
+        """)
+        for model in self.INCREMENTAL_MODELS + self.FULL_MODELS:
+            columns = ', '.join(
+                f"{column.name} {self._duckdb_type(column)}" for column in model.__table__.columns
+            )
+            self.con.execute(f"CREATE TABLE IF NOT EXISTS {model.__tablename__} ({columns})")
+
+    def _duckdb_type(self, column) -> str:
+        """SQLAlchemy列类型转换为DuckDB类型"""
+        for sa_type, duckdb_type in self._TYPE_MAPPING:
+            if isinstance(column.type, sa_type):
+                return duckdb_type
+        return 'VARCHAR'
+
+    def sync(self, chunk_size: int = 200000, overlap: int = None) -> Dict[str, int]:
+        """
+        从业务数据库增量同步数据
+
+        Args:
+            chunk_size: 每次读取的记录数
+            overlap: 重新读取的已同步id数，默认为 ANALYTICS_SYNC_OVERLAP
+
+        Returns:
+            每张表本次新同步的记录数
+        """
+        overlap = Config.ANALYTICS_SYNC_OVERLAP if overlap is None else overlap
+        results = {}
+
+        for model in self.FULL_MODELS:
+            data = pd.read_sql(select(model.__table__), self.db_manager.engine)
+            self.con.execute("BEGIN TRANSACTION")
+            self.con.execute(f"DELETE FROM {model.__tablename__}")
+            self._insert_frame(model, data)
+            self.con.execute("COMMIT")
+            results[model.__tablename__] = len(data)
+
+        for model in self.INCREMENTAL_MODELS:
+            table = model.__table__
+            last_id = self._get_last_id(model.__tablename__)
+            read_from = max(last_id - overlap, 0)
+            synced = 0
+
+            while True:
+                data = pd.read_sql(
+                    select(table).where(table.c.id > read_from).order_by(table.c.id).limit(chunk_size),
+                    self.db_manager.engine
+                )
+                if data.empty:
+                    break
+
+                read_from = int(data['id'].max())
+                self.con.execute("BEGIN TRANSACTION")
+                # 只有不超过已同步最大id的记录可能已在镜像表中
+                replaced = self._insert_frame(model, data, replace=int(data['id'].min()) <= last_id)
+                last_id = max(last_id, read_from)
+                self.con.execute(
+                    "INSERT OR REPLACE INTO _sync_state VALUES (?, ?)",
+                    [model.__tablename__, last_id]
+                )
+                self.con.execute("COMMIT")
+                synced += len(data) - replaced
+
+                if len(data) < chunk_size:
+                    break
+
+            results[model.__tablename__] = synced
+
+        logger.info(f"分析数据同步完成: {results}")
+        return results
+
+    def _get_last_id(self, table_name: str) -> int:
+        """获取已同步的最大id"""
+        row = self.con.execute(
+            "SELECT last_id FROM _sync_state WHERE table_name = ?", [table_name]
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _insert_frame(self, model, data: pd.DataFrame, replace: bool = False) -> int:
+        """
+        把DataFrame写入同名DuckDB表
+
+        Args:
+            replace: 是否先删除id相同的已有记录（REPLACE_KEYS 中的表总是先删除业务键相同的已有记录）
+
+        Returns:
+            删除的已有记录数
+        """
+        if data.empty:
+            return 0
+        columns = ', '.join(column.name for column in model.__table__.columns)
+        replaced = 0
+        self.con.register('_sync_frame', data)
+        try:
+            if replace:
+                # 镜像表按id顺序追加，id范围条件可以跳过前面的数据块
+                replaced = self.con.execute(
+                    f"DELETE FROM {model.__tablename__} WHERE id >= ? AND id IN (SELECT id FROM _sync_frame)",
+                    [int(data['id'].min())]
+                ).fetchone()[0]
+            keys = self.REPLACE_KEYS.get(model)
+            if keys:
+                condition = ' AND '.join(
+                    f"t.{key} = CAST(f.{key} AS {self._duckdb_type(model.__table__.c[key])})" for key in keys
+                )
+                replaced += self.con.execute(
+                    f"DELETE FROM {model.__tablename__} t USING _sync_frame f WHERE {condition}"
+                ).fetchone()[0]
+            self.con.execute(f"INSERT INTO {model.__tablename__} SELECT {columns} FROM _sync_frame")
+        finally:
+            self.con.unregister('_sync_frame')
+        return replaced
+
+    def execute(self, statement, params: Union[List, Dict] = None):
+        """
+        执行查询，返回支持fetchone/fetchall的游标
+
+        Args:
+            statement: SQL字符串或SQLAlchemy Core语句
+            params: SQL字符串的参数
+        """
+        if isinstance(statement, str):
+            return self.con.execute(statement, params or [])
+
+        # 参数内联渲染，保证SELECT和GROUP BY中的相同表达式能被DuckDB识别为同一个
+        try:
+            compiled = statement.compile(dialect=self._dialect, compile_kwargs={'literal_binds': True})
+            return self.con.execute(str(compiled))
+        except CompileError:
+            compiled = statement.compile(dialect=self._dialect)
+            positional = [compiled.params[name] for name in compiled.positiontup]
+            return self.con.execute(str(compiled), positional)
+
+    def query(self, statement, params: Union[List, Dict] = None) -> pd.DataFrame:
+        """执行查询，返回pandas DataFrame"""
+        return self.execute(statement, params).df()
+
+    def query_arrow(self, statement, params: Union[List, Dict] = None):
+        """执行查询，返回pyarrow Table"""
+        return self.execute(statement, params).fetch_arrow_table()
+
+    def period_returns(self, start_date: date, end_date: date, symbols: List[str] = None) -> pd.DataFrame:
+        """计算区间收益率（区间内首个到最后一个后复权收盘价）"""
+        symbol_filter = ""
+        params = [start_date, end_date]
+        if symbols:
+            symbol_filter = "AND d.symbol IN (SELECT unnest(?))"
+            params.append(list(symbols))
+
+        return self.query(f"""
+            WITH adjusted AS (
+                SELECT
+                    d.symbol,
+                    d.trade_date,
+                    d.close_price * coalesce(f.adj_factor, 1.0) AS adj_close
+                FROM stock_daily_data d
+                ASOF LEFT JOIN stock_adj_factor f
+                    ON d.symbol = f.symbol AND d.trade_date >= f.trade_date
+                WHERE d.trade_date BETWEEN ? AND ? {symbol_filter}
+            )
+            SELECT
+                symbol,
+                arg_min(adj_close, trade_date) AS start_close,
+                arg_max(adj_close, trade_date) AS end_close,
+                arg_max(adj_close, trade_date) / arg_min(adj_close, trade_date) - 1 AS period_return,
+                count(*) AS trade_days
+            FROM adjusted
+            GROUP BY symbol
+            ORDER BY period_return DESC
+        """, params)
+
+    def group_summary(self, trade_date: date, by: str = 'market') -> pd.DataFrame:
+        """按市场或板块汇总某个交易日的涨跌幅和成交额"""
+        if by == 'market':
+            group_expr = "s.market"
+        elif by == 'board':
+            group_expr = """
+                CASE
+                    WHEN d.symbol LIKE '60%' THEN '上海主板'
+                    WHEN d.symbol LIKE '68%' THEN '上海科创板'
+                    WHEN d.symbol LIKE '00%' THEN '深圳主板'
+                    WHEN d.symbol LIKE '30%' THEN '深圳创业板'
+                    WHEN d.symbol LIKE '87%' OR d.symbol LIKE '83%' THEN '北京交易所'
+                    ELSE '其他'
+                END
+            """
+        else:
+            raise ValueError(f"不支持的分组方式: {by}")
+
+        return self.query(f"""
+            SELECT
+                {group_expr} AS group_name,
+                count(*) AS stock_count,
+                avg(d.pct_change) AS avg_pct_change,
+                median(d.pct_change) AS median_pct_change,
+                sum(d.amount) AS total_amount,
+                count(*) FILTER (WHERE d.pct_change > 0) AS up_count,
+                count(*) FILTER (WHERE d.pct_change < 0) AS down_count
+            FROM stock_daily_data d
+            LEFT JOIN stock_info s ON d.symbol = s.symbol
+            WHERE d.trade_date = ?
+            GROUP BY group_name
+            ORDER BY total_amount DESC
+        """, [trade_date])
+
+    def percentile_rank(self, field: str, trade_date: date) -> pd.DataFrame:
+        """某个交易日全市场按指定字段的分位数排名"""
+        allowed = {'close_price', 'volume', 'amount', 'pct_change'}
+        if field not in allowed:
+            raise ValueError(f"不支持的排名字段: {field}")
+
+        return self.query(f"""
+            SELECT
+                symbol,
+                {field},
+                percent_rank() OVER (ORDER BY {field}) AS pct_rank
+            FROM stock_daily_data
+            WHERE trade_date = ? AND {field} IS NOT NULL
+            ORDER BY pct_rank DESC
+        """, [trade_date])
+
+    def close(self):
+        """关闭DuckDB连接"""
+        if self.con is not None:
+            self.con.close()
+            self.con = None
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+向量化回测模块
+
+输入与价格面板对齐的目标权重矩阵（交易日 × 股票），按A股交易规则模拟调仓：
+    - 第t日收盘产生的信号在第t+1日成交（开盘价或收盘价），每日最多调仓一次，
+      当日买入的股票最早在下一交易日卖出，满足T+1交收
+    - 以涨停价开盘（或收盘成交时收于涨停）的股票不能买入，跌停的不能卖出，维持原持仓
+    - 停牌股票不能交易，持仓按停牌前价格计值
+    - 佣金双边收取，印花税仅卖出收取，另计滑点；现金不足时按比例缩减买入
+价格使用面板中的后复权价格（分红再投资），逐日推进但每一步对全市场股票做向量化计算。
+参数扫描在进程池中执行，各进程通过内存映射共享同一份价格面板。
+"""
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Callable, Dict, List, Union
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.market_rules import price_limit, CHINEXT_REFORM_DATE
+from src.price_panel import PricePanel
+
+DEFAULT_COMMISSION = 0.00025   # 佣金（双边）
+DEFAULT_STAMP_DUTY = 0.0005    # 印花税（卖出）
+DEFAULT_SLIPPAGE = 0.0005      # 滑点（双边）
+
+TRADING_DAYS_PER_YEAR = 252
+
+# 判断涨跌停时允许的价格误差（元），涨跌停价四舍五入到分
+_LIMIT_PRICE_TOLERANCE = 0.01
+
+
+class Backtester:
+    """向量化回测引擎"""
+
+    def __init__(self, panel: PricePanel = None, commission: float = DEFAULT_COMMISSION,
+                 stamp_duty: float = DEFAULT_STAMP_DUTY, slippage: float = DEFAULT_SLIPPAGE,
+                 execution: str = 'open'):
+        if execution not in ('open', 'close'):
+            raise ValueError(f"不支持的成交价格: {execution}")
+        self.panel = panel or PricePanel()
+        self.commission = commission
+        self.stamp_duty = stamp_duty
+        self.slippage = slippage
+        self.execution = execution
+
+    def _align_weights(self, weights: Union[pd.DataFrame, np.ndarray], rows: slice) -> np.ndarray:
+        """目标权重对齐到面板的交易日和股票列，缺失为0"""
+        if isinstance(weights, pd.DataFrame):
+            index = pd.DatetimeIndex(self.panel.dates[rows])
+            weights = weights.reindex(index=index, columns=self.panel.symbols)
+        weights = np.nan_to_num(np.asarray(weights, dtype=np.float64), nan=0.0)
+
+        expected = (rows.stop - rows.start, len(self.panel.symbols))
+        if weights.shape != expected:
+            raise ValueError(f"权重矩阵形状 {weights.shape} 与面板 {expected} 不一致")
+        return weights
+
+    def run(self, weights: Union[pd.DataFrame, np.ndarray], start_date: date = None,
+            end_date: date = None, initial_capital: float = 1.0) -> pd.DataFrame:
+        """
+        执行回测
+
+        Args:
+            weights: 目标权重，行为信号日，列为股票；ndarray需与面板日期范围和股票列完全对齐
+            start_date: 回测开始日期
+            end_date: 回测结束日期
+            initial_capital: 初始资金
+
+        Returns:
+            每日结果，包含 nav（净值）、returns、turnover（换手率）、cost（交易成本）、cash（现金比例）
+        """
+        rows = self.panel.date_slice(start_date, end_date)
+        targets = self._align_weights(weights, rows)
+        dates = self.panel.dates[rows]
+        n_days, n_symbols = targets.shape
+
+        opens = self.panel.field('open')
+        closes = self.panel.field('close')
+        factors = self.panel.field('adj_factor')
+        # 创业板涨跌幅限制在2020-08-24由10%调整为20%
+        symbols = self.panel.symbols.astype(str)
+        limits_before = price_limit(symbols, np.full(n_symbols, CHINEXT_REFORM_DATE - 1))
+        limits_after = price_limit(symbols)
+
+        holdings = np.zeros(n_symbols)
+        cash = float(initial_capital)
+        last_close = np.full(n_symbols, np.nan)
+        # 前收盘对应的复权因子（除权除息日当天的因子已变化，不能用来还原前收盘价）
+        last_factor = np.full(n_symbols, np.nan)
+
+        nav = np.empty(n_days)
+        turnover = np.zeros(n_days)
+        costs = np.zeros(n_days)
+        cash_ratio = np.empty(n_days)
+
+        buy_cost_rate = self.commission + self.slippage
+        sell_cost_rate = self.commission + self.slippage + self.stamp_duty
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in range(n_days):
+                row = rows.start + i
+                limits = limits_after if dates[i] >= CHINEXT_REFORM_DATE else limits_before
+
+                close = np.asarray(closes[row], dtype=np.float64)
+                trade_price = close if self.execution == 'close' else np.asarray(opens[row], dtype=np.float64)
+                traded = np.isfinite(trade_price) & np.isfinite(close)
+
+                # 持仓按成交价计值（停牌股票价格不变）
+                holdings *= np.where(traded & np.isfinite(last_close), trade_price / last_close, 1.0)
+                nav_before = cash + holdings.sum()
+
+                if i > 0:
+                    desired = targets[i - 1] * nav_before
+                    delta = np.where(traded, desired - holdings, 0.0)
+
+                    # 涨跌停判断基于成交价相对前收盘的涨跌幅（后复权价格比即除权后的涨跌幅）
+                    move = trade_price / last_close - 1
+                    raw_prev = last_close / last_factor
+                    tolerance = _LIMIT_PRICE_TOLERANCE / raw_prev
+                    limit_up = move >= limits - tolerance
+                    limit_down = move <= -limits + tolerance
+                    delta[(delta > 0) & limit_up] = 0.0
+                    delta[(delta < 0) & limit_down] = 0.0
+
+                    buys = np.where(delta > 0, delta, 0.0)
+                    sells = np.where(delta < 0, -delta, 0.0)
+                    buy_value, sell_value = buys.sum(), sells.sum()
+
+                    # 现金不足时按比例缩减买入
+                    available = cash + sell_value * (1 - sell_cost_rate)
+                    if buy_value * (1 + buy_cost_rate) > available > 0:
+                        scale = available / (buy_value * (1 + buy_cost_rate))
+                        buys *= scale
+                        buy_value *= scale
+                    elif available <= 0:
+                        buys[:] = 0.0
+                        buy_value = 0.0
+
+                    cost = buy_value * buy_cost_rate + sell_value * sell_cost_rate
+                    holdings += buys - sells
+                    cash += sell_value - buy_value - cost
+
+                    costs[i] = cost / nav_before if nav_before > 0 else 0.0
+                    turnover[i] = (buy_value + sell_value) / nav_before if nav_before > 0 else 0.0
+
+                # 持仓按收盘价计值
+                holdings *= np.where(traded, close / trade_price, 1.0)
+                factor = np.asarray(factors[row], dtype=np.float64)
+                last_factor = np.where(np.isfinite(close) & np.isfinite(factor), factor, last_factor)
+                last_close = np.where(np.isfinite(close), close, last_close)
+
+                nav[i] = cash + holdings.sum()
+                cash_ratio[i] = cash / nav[i] if nav[i] > 0 else 0.0
+
+        result = pd.DataFrame({
+            'nav': nav / initial_capital,
+            'turnover': turnover,
+            'cost': costs,
+            'cash': cash_ratio,
+        }, index=pd.DatetimeIndex(dates, name='trade_date'))
+        result.insert(1, 'returns', result['nav'].pct_change().fillna(0.0))
+        return result
+
+    def sweep(self, strategy: Callable, param_grid: Dict[str, List], start_date: date = None,
+              end_date: date = None, max_workers: int = None) -> pd.DataFrame:
+        """
+        参数扫描：对参数网格中的每组参数生成权重并回测
+
+        Args:
+            strategy: 模块级函数 strategy(panel, **params) -> 权重矩阵（需可被pickle）
+            param_grid: {参数名: 取值列表}
+            max_workers: 进程数，默认为CPU核数
+
+        Returns:
+            每组参数一行，包含参数和绩效指标
+        """
+        names = list(param_grid)
+        combos = [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+        settings = {
+            'commission': self.commission,
+            'stamp_duty': self.stamp_duty,
+            'slippage': self.slippage,
+            'execution': self.execution,
+        }
+        tasks = [(self.panel.panel_dir, settings, strategy, params, start_date, end_date) for params in combos]
+
+        max_workers = max_workers or os.cpu_count() or 1
+        logger.info(f"开始参数扫描: {len(combos)} 组参数, {max_workers} 个进程")
+        if max_workers <= 1:
+            rows = [_sweep_task(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                rows = list(executor.map(_sweep_task, tasks))
+
+        return pd.DataFrame(rows).sort_values('sharpe', ascending=False).reset_index(drop=True)
+
+
+def performance_summary(result: pd.DataFrame) -> Dict[str, float]:
+    """回测绩效指标：总收益、年化收益、年化波动、夏普比率、最大回撤、日均换手率"""
+    if result.empty:
+        return {}
+
+    nav = result['nav']
+    returns = result['returns']
+    years = len(nav) / TRADING_DAYS_PER_YEAR
+    volatility = returns.std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+    annual_return = nav.iloc[-1] ** (1 / years) - 1 if years > 0 and nav.iloc[-1] > 0 else np.nan
+
+    return {
+        'total_return': nav.iloc[-1] - 1,
+        'annual_return': annual_return,
+        'volatility': volatility,
+        'sharpe': returns.mean() / returns.std() * np.sqrt(TRADING_DAYS_PER_YEAR) if returns.std() > 0 else np.nan,
+        'max_drawdown': (nav / nav.cummax() - 1).min(),
+        'avg_turnover': result['turnover'].mean(),
+        'total_cost': result['cost'].sum(),
+    }
+
+
+def _sweep_task(task) -> Dict:
+    """进程池任务：在子进程中打开价格面板、生成权重并回测"""
+    panel_dir, settings, strategy, params, start_date, end_date = task
+    panel = PricePanel(panel_dir)
+    backtester = Backtester(panel, **settings)
+    result = backtester.run(strategy(panel, **params), start_date, end_date)
+    return {**params, **performance_summary(result)}
+
+
+def momentum_strategy(panel: PricePanel, lookback: int = 20, top_n: int = 50) -> pd.DataFrame:
+    """示例策略：持有过去lookback日涨幅最高的top_n只股票，等权"""
+    close = panel.frame('close')
+    momentum = close / close.shift(lookback) - 1
+    rank = momentum.rank(axis=1, ascending=False, method='first')
+    selected = (rank <= top_n) & close.notna()
+    return selected.div(selected.sum(axis=1).replace(0, np.nan), axis=0).fillna(0.0)
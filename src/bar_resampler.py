@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+成交明细聚合分钟K线模块
+
+把逐笔成交聚合为 1/5/15/30/60 分钟的 OHLCV + VWAP K线，并按成交方向拆分主动买卖量。
+聚合过程基于排序后的NumPy数组和 ufunc.reduceat，一次处理任意多只股票、任意多个交易日。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Union
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.market_rules import session_bins, bin_end_seconds
+
+SUPPORTED_FREQS = (1, 5, 15, 30, 60)
+
+# 成交方向取值：数据库中为B/S，akshare原始数据为买盘/卖盘/中性盘
+BUY_DIRECTIONS = ('B', '买盘')
+SELL_DIRECTIONS = ('S', '卖盘')
+
+BAR_COLUMNS = ['symbol', 'trade_date', 'bar_time', 'freq', 'open_price', 'high_price',
+               'low_price', 'close_price', 'volume', 'amount', 'vwap',
+               'buy_volume', 'sell_volume', 'tick_count']
+
+
+def resample_ticks(ticks: pd.DataFrame, freq: int) -> pd.DataFrame:
+    """
+    把成交明细聚合为分钟K线
+
+    Args:
+        ticks: 成交明细，需包含 symbol, trade_time, price, volume, amount, direction 列
+        freq: K线周期（分钟）
+
+    Returns:
+        分钟K线，没有成交的时间段不生成K线
+    """
+    if freq not in SUPPORTED_FREQS:
+        raise ValueError(f"不支持的K线周期: {freq}")
+    if ticks.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+
+    symbol_codes, symbols = pd.factorize(ticks['symbol'])
+    trade_times = pd.to_datetime(ticks['trade_time']).values.astype('datetime64[s]')
+
+    # 按股票、时间稳定排序，同一秒内保持原始成交顺序
+    order = np.lexsort((trade_times, symbol_codes))
+    symbol_codes = symbol_codes[order]
+    trade_times = trade_times[order]
+    price = ticks['price'].to_numpy(dtype=np.float64)[order]
+    volume = ticks['volume'].to_numpy(dtype=np.float64)[order]
+    amount = ticks['amount'].to_numpy(dtype=np.float64)[order]
+    direction = ticks['direction'].to_numpy()[order]
+
+    days = trade_times.astype('datetime64[D]')
+    bins = session_bins(trade_times, freq)
+
+    # 股票、日期、K线序号任一变化即为新K线的起点
+    boundary = np.empty(len(order), dtype=bool)
+    boundary[0] = True
+    boundary[1:] = (
+        (symbol_codes[1:] != symbol_codes[:-1])
+        | (days[1:] != days[:-1])
+        | (bins[1:] != bins[:-1])
+    )
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(order)) - 1
+
+    is_buy = np.isin(direction, BUY_DIRECTIONS)
+    is_sell = np.isin(direction, SELL_DIRECTIONS)
+
+    bar_volume = np.add.reduceat(volume, starts)
+    price_volume = np.add.reduceat(price * volume, starts)
+    close_price = price[ends]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = np.where(bar_volume > 0, price_volume / bar_volume, close_price)
+
+    bar_days = days[starts]
+    bar_time = bar_days + bin_end_seconds(bins[starts], freq).astype('timedelta64[s]')
+
+    return pd.DataFrame({
+        'symbol': symbols[symbol_codes[starts]],
+        'trade_date': pd.to_datetime(bar_days).date,
+        'bar_time': pd.to_datetime(bar_time),
+        'freq': freq,
+        'open_price': price[starts],
+        'high_price': np.maximum.reduceat(price, starts),
+        'low_price': np.minimum.reduceat(price, starts),
+        'close_price': close_price,
+        'volume': bar_volume.astype(np.int64),
+        'amount': np.add.reduceat(amount, starts),
+        'vwap': vwap,
+        'buy_volume': np.add.reduceat(np.where(is_buy, volume, 0), starts).astype(np.int64),
+        'sell_volume': np.add.reduceat(np.where(is_sell, volume, 0), starts).astype(np.int64),
+        'tick_count': ends - starts + 1,
+    })
+
+
+def _resample_chunk(ticks: pd.DataFrame, freqs: List[int]) -> pd.DataFrame:
+    """进程池任务：对一组股票计算多个周期的K线"""
+    return pd.concat([resample_ticks(ticks, freq) for freq in freqs], ignore_index=True)
+
+
+class BarResampler:
+    """分钟K线聚合器"""
+
+    def __init__(self, freqs: List[int] = None, max_workers: int = None):
+        from src.config import Config
+        self.freqs = freqs or Config.MINUTE_BAR_FREQS
+        self.max_workers = max_workers or Config.RESAMPLE_WORKERS or os.cpu_count() or 1
+
+        unsupported = [freq for freq in self.freqs if freq not in SUPPORTED_FREQS]
+        if unsupported:
+            raise ValueError(f"不支持的K线周期: {unsupported}")
+
+    def resample_many(self, transaction_data: Union[Dict[str, pd.DataFrame], pd.DataFrame],
+                      chunk_symbols: int = 200) -> pd.DataFrame:
+        """
+        多只股票并行聚合分钟K线
+
+        Args:
+            transaction_data: {股票代码: 成交明细} 或包含多只股票的成交明细
+            chunk_symbols: 每个进程任务处理的股票数量
+        """
+        if isinstance(transaction_data, dict):
+            frames = [df for df in transaction_data.values() if not df.empty]
+            if not frames:
+                return pd.DataFrame(columns=BAR_COLUMNS)
+            ticks = pd.concat(frames, ignore_index=True)
+        else:
+            ticks = transaction_data
+
+        if ticks.empty:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+
+        symbols = ticks['symbol'].unique()
+        if self.max_workers <= 1 or len(symbols) <= chunk_symbols:
+            bars = _resample_chunk(ticks, self.freqs)
+        else:
+            groups = ticks.groupby('symbol', sort=False)
+            chunks = [
+                pd.concat([groups.get_group(symbol) for symbol in symbols[start:start + chunk_symbols]])
+                for start in range(0, len(symbols), chunk_symbols)
+            ]
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(_resample_chunk, chunks, [self.freqs] * len(chunks)))
+            bars = pd.concat(results, ignore_index=True)
+
+        logger.info(f"分钟K线聚合完成: {len(symbols)} 只股票, {len(bars)} 根K线, 周期 {self.freqs}")
+        return bars
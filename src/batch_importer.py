@@ -9,28 +9,45 @@ from loguru import logger
 import time
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.config import Config
 from src.data_fetcher import StockDataFetcher
 from src.data_storage import DataStorage
+from src.rate_limiter import RateLimiter
+from src.metrics import dump_metrics_on_exit
+from src.tracing import span, setup_tracing, PROFILE_MODES
+from src.import_jobs import ImportJobStore, make_job_name, UNIT_DONE
+from src.gap_planner import GapPlanner, GAP_DATA_TYPES
 
 
 class BatchImporter:
     """批量数据导入器"""
     
-    def __init__(self):
-        self.data_fetcher = StockDataFetcher()
-        self.data_storage = DataStorage()
+    def __init__(self, data_fetcher: StockDataFetcher = None, data_storage: DataStorage = None):
+        self.data_fetcher = data_fetcher or StockDataFetcher()
+        self.data_storage = data_storage or DataStorage()
+        self.job_store = ImportJobStore(self.data_storage.db_manager)
+        self.gap_planner = GapPlanner(self.data_storage, self.data_fetcher, self.job_store)
+        # 成交明细单元并行执行时共享的请求限速
+        self.tick_limiter = RateLimiter(Config.IMPORT_RATE_LIMIT)
+        self.unit_handlers = {
+            'daily': self._import_daily_unit,
+            'transaction': self._import_transaction_unit,
+            'adj_factor': self._import_adj_factor_unit,
+        }
         logger.info("批量数据导入器初始化完成")
     
     def import_historical_data(self, 
                              start_date: str = None, 
                              end_date: str = None,
                              symbols: List[str] = None,
-                             data_types: List[str] = None) -> Dict[str, int]:
+                             data_types: List[str] = None,
+                             resume: bool = False) -> Dict[str, int]:
         """
         批量导入历史数据
         
@@ -38,7 +55,8 @@ class BatchImporter:
             start_date: 开始日期 (YYYYMMDD格式)
             end_date: 结束日期 (YYYYMMDD格式)
             symbols: 股票代码列表，None表示所有股票
-            data_types: 数据类型列表 ['daily', 'transaction']
+            data_types: 数据类型列表 ['daily', 'transaction', 'adj_factor']
+            resume: 断点续传，跳过同一日期范围上次已完成的单元并重试失败的单元
         
         Returns:
             导入结果统计
@@ -55,6 +73,10 @@ class BatchImporter:
             
             logger.info(f"开始批量导入历史数据: {start_date} - {end_date}")
             logger.info(f"数据类型: {data_types}")
+            start_day = datetime.strptime(start_date, '%Y%m%d').date()
+            end_day = datetime.strptime(end_date, '%Y%m%d').date()
+            job_name = make_job_name(start_day, end_day)
+            self.data_storage.validator.reset_metrics()
             
             # 获取股票列表
             if not symbols:
@@ -64,9 +86,11 @@ class BatchImporter:
                 logger.info(f"共 {len(symbols)} 只股票")
             
             results = {
+                'job_name': job_name,
                 'total_stocks': len(symbols),
                 'daily_data_count': 0,
                 'transaction_data_count': 0,
+                'adj_factor_count': 0,
                 'failed_stocks': [],
                 'success_stocks': []
             }
@@ -74,7 +98,7 @@ class BatchImporter:
             # 导入日线数据
             if 'daily' in data_types:
                 logger.info("开始导入日线数据...")
-                daily_results = self._import_daily_data(symbols, start_date, end_date)
+                daily_results = self._import_daily_data(job_name, symbols, start_day, end_day, resume)
                 results['daily_data_count'] = daily_results['total_records']
                 results['failed_stocks'].extend(daily_results['failed_stocks'])
                 results['success_stocks'].extend(daily_results['success_stocks'])
@@ -82,19 +106,33 @@ class BatchImporter:
             # 导入成交明细数据
             if 'transaction' in data_types:
                 logger.info("开始导入成交明细数据...")
-                transaction_results = self._import_transaction_data(symbols, start_date, end_date)
+                transaction_results = self._import_transaction_data(job_name, symbols, start_day, end_day, resume)
                 results['transaction_data_count'] = transaction_results['total_records']
                 results['failed_stocks'].extend(transaction_results['failed_stocks'])
                 results['success_stocks'].extend(transaction_results['success_stocks'])
             
+            # 导入复权因子
+            if 'adj_factor' in data_types:
+                logger.info("开始导入复权因子...")
+                factor_results = self._import_adj_factors(job_name, symbols, start_day, end_day, resume)
+                results['adj_factor_count'] = factor_results['total_records']
+                results['failed_stocks'].extend(factor_results['failed_stocks'])
+                results['success_stocks'].extend(factor_results['success_stocks'])
+            
+            # 入库前校验隔离的记录数
+            results['quarantined_count'] = self.data_storage.validator.metrics['rejected']
+            results['validation_metrics'] = self.data_storage.validator.metrics
+            
             # 去重失败和成功的股票列表
             results['failed_stocks'] = list(set(results['failed_stocks']))
-            results['success_stocks'] = list(set(results['success_stocks']))
+            results['success_stocks'] = list(set(results['success_stocks']) - set(results['failed_stocks']))
             
             logger.info("批量导入完成!")
             logger.info(f"总股票数: {results['total_stocks']}")
             logger.info(f"日线数据: {results['daily_data_count']} 条")
             logger.info(f"成交明细: {results['transaction_data_count']} 条")
+            logger.info(f"复权因子: {results['adj_factor_count']} 条")
+            logger.info(f"入库校验: {self.data_storage.validator.summary()}")
             logger.info(f"成功: {len(results['success_stocks'])} 只")
             logger.info(f"失败: {len(results['failed_stocks'])} 只")
             
@@ -104,117 +142,235 @@ class BatchImporter:
             logger.error(f"批量导入历史数据失败: {e}")
             raise
     
-    def _import_daily_data(self, symbols: List[str], start_date: str, end_date: str) -> Dict:
-        """导入日线数据"""
-        results = {
-            'total_records': 0,
-            'failed_stocks': [],
-            'success_stocks': []
-        }
+    def _run_units(self, job_name: str, data_type: str, units: List[tuple],
+                   resume: bool, desc: str, workers: int = 1) -> Dict:
+        """
+        执行任务单元：每个单元获取后立即保存并标记完成，失败的单元按指数退避重试
         
-        all_daily_data = []
+        Args:
+            units: (股票代码, 开始日期, 结束日期) 列表，按此顺序执行
+            resume: 是否跳过上次已完成的单元
+            workers: 并行执行单元的线程数
+        """
+        handler = self.unit_handlers[data_type]
+        created = self.job_store.create_units(job_name, data_type, units, resume=resume)
+        if resume:
+            logger.info(f"{desc}: 共 {len(units)} 个单元，新增 {created} 个，已完成的单元将被跳过")
         
-        # 使用进度条显示进度
-        for symbol in tqdm(symbols, desc="导入日线数据"):
-            try:
-                daily_data = self.data_fetcher.get_daily_data(symbol, start_date, end_date)
-                if not daily_data.empty:
-                    all_daily_data.append(daily_data)
-                    results['success_stocks'].append(symbol)
-                else:
-                    results['failed_stocks'].append(symbol)
-                
-                # 添加延时避免请求过于频繁
-                time.sleep(0.1)
-                
-            except Exception as e:
-                logger.error(f"获取股票 {symbol} 日线数据失败: {e}")
-                results['failed_stocks'].append(symbol)
-                continue
+        finished = self.job_store.unit_results(job_name, data_type)
+        done_count = int((finished['status'] == UNIT_DONE).sum()) if not finished.empty else 0
         
-        # 批量保存日线数据
-        if all_daily_data:
+        def run_unit(unit: Dict):
+            # 保存后、标记完成前中断的单元会被重新执行，各数据类型的保存都是幂等的（见 src/import_jobs.py）
+            self.job_store.mark_running(unit['id'])
             try:
-                combined_data = pd.concat(all_daily_data, ignore_index=True)
-                self.data_storage.save_daily_data(combined_data)
-                results['total_records'] = len(combined_data)
-                logger.info(f"成功保存日线数据 {len(combined_data)} 条")
+                with span(f'import.{data_type}'):
+                    row_count = handler(unit)
+                self.job_store.mark_done(unit['id'], row_count)
+                pbar.update(1)
             except Exception as e:
-                logger.error(f"保存日线数据失败: {e}")
+                logger.error(f"{desc}失败 {unit['symbol']} {unit['start_date']}~{unit['end_date']}: {e}")
+                self.job_store.mark_failed(unit['id'], unit['attempts'], str(e))
         
-        return results
-    
-    def _import_transaction_data(self, symbols: List[str], start_date: str, end_date: str) -> Dict:
-        """导入成交明细数据"""
-        results = {
-            'total_records': 0,
-            'failed_stocks': [],
-            'success_stocks': []
+        with tqdm(total=len(units), initial=done_count, desc=desc) as pbar, \
+                ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix=f'import-{data_type}') as executor:
+            while True:
+                batch = self.job_store.runnable_units(job_name, data_type)
+                if not batch:
+                    delay = self.job_store.next_retry_delay(job_name, data_type)
+                    if delay is None:
+                        break
+                    logger.info(f"{desc}: 等待 {delay:.0f} 秒后重试失败的单元")
+                    time.sleep(delay)
+                    continue
+                
+                if workers <= 1:
+                    for unit in batch:
+                        run_unit(unit)
+                else:
+                    # 线程按单元顺序领取，同时执行的单元相邻（成交明细为同一交易日的不同股票）
+                    list(executor.map(run_unit, batch))
+        
+        unit_results = self.job_store.unit_results(job_name, data_type)
+        failed = unit_results.loc[unit_results['status'] != UNIT_DONE, 'symbol'].unique().tolist()
+        return {
+            'total_records': int(unit_results.loc[unit_results['status'] == UNIT_DONE, 'row_count'].sum()),
+            'failed_stocks': failed,
+            'success_stocks': sorted(set(unit_results['symbol']) - set(failed)),
         }
+    
+    def _build_units(self, data_type: str, symbols: List[str], start_date: date, end_date: date) -> List[tuple]:
+        """拆分任务单元：成交明细每只股票每个交易日一个单元（见 _tick_units），其他数据每只股票一个单元"""
+        if data_type == 'transaction':
+            return self._tick_units(symbols, start_date, end_date)
+        return [(symbol, start_date, end_date) for symbol in symbols]
+    
+    def _tick_units(self, symbols: List[str], start_date: date, end_date: date) -> List[tuple]:
+        """
+        成交明细单元，按日期优先排列（先导入完一个交易日的全部股票，再导入下一个交易日）
         
-        # 生成日期范围
-        start_dt = datetime.strptime(start_date, '%Y%m%d')
-        end_dt = datetime.strptime(end_date, '%Y%m%d')
-        date_range = []
-        current_dt = start_dt
-        while current_dt <= end_dt:
-            # 跳过周末
-            if current_dt.weekday() < 5:
-                date_range.append(current_dt.strftime('%Y%m%d'))
-            current_dt += timedelta(days=1)
+        已保存日线的日期范围内，只为当天有日线的股票生成单元（停牌、未上市、已退市的股票没有成交明细），
+        范围内没有日线的工作日为节假日，跳过；范围外的工作日无法判断，为全部股票生成单元
+        """
+        weekdays = [day.date() for day in pd.bdate_range(start_date, end_date)]
+        keys = self.data_storage.get_data_keys('daily', start_date, end_date, symbols)
+        trade_dates = self.data_storage.get_trade_dates(start_date, end_date)
+        if not trade_dates:
+            return [(symbol, day, day) for day in weekdays for symbol in symbols]
         
-        all_transaction_data = {}
+        keys['trade_date'] = pd.to_datetime(keys['trade_date']).dt.date
+        listed = keys.groupby('trade_date')['symbol'].apply(set).to_dict()
+        wanted = set(symbols)
+        units = []
+        for day in weekdays:
+            if trade_dates[0] <= day <= trade_dates[-1]:
+                units.extend((symbol, day, day) for symbol in sorted(listed.get(day, set()) & wanted))
+            else:
+                units.extend((symbol, day, day) for symbol in symbols)
         
-        # 使用进度条显示进度
-        total_tasks = len(symbols) * len(date_range)
-        with tqdm(total=total_tasks, desc="导入成交明细") as pbar:
-            for symbol in symbols:
-                symbol_success = True
-                for trade_date in date_range:
-                    try:
-                        transaction_data = self.data_fetcher.get_transaction_detail(symbol, trade_date)
-                        if not transaction_data.empty:
-                            if symbol not in all_transaction_data:
-                                all_transaction_data[symbol] = []
-                            all_transaction_data[symbol].append(transaction_data)
-                        
-                        # 添加延时避免请求过于频繁
-                        time.sleep(0.1)
-                        
-                    except Exception as e:
-                        logger.error(f"获取股票 {symbol} 在 {trade_date} 的成交明细失败: {e}")
-                        symbol_success = False
-                    
-                    pbar.update(1)
-                
-                if symbol_success:
-                    results['success_stocks'].append(symbol)
-                else:
-                    results['failed_stocks'].append(symbol)
+        skipped = len(weekdays) * len(symbols) - len(units)
+        if skipped:
+            logger.info(f"按已保存的日线跳过 {skipped} 个没有交易的 股票 × 交易日，剩余 {len(units)} 个单元")
+        return units
+    
+    def _import_daily_unit(self, unit: Dict) -> int:
+        """导入一只股票的日线数据，返回保存的记录数"""
+        daily_data = self.data_fetcher.get_daily_data(
+            unit['symbol'], unit['start_date'].strftime('%Y%m%d'), unit['end_date'].strftime('%Y%m%d'))
+        # 添加延时避免请求过于频繁
+        time.sleep(0.1)
+        if daily_data.empty:
+            raise ValueError("没有获取到日线数据")
+        if not self.data_storage.save_daily_data(daily_data):
+            raise RuntimeError("保存日线数据失败")
+        return len(daily_data)
+    
+    def _import_transaction_unit(self, unit: Dict) -> int:
+        """导入一只股票一个交易日的成交明细，返回保存的记录数（没有成交的日期为0）"""
+        trade_date = unit['start_date'].strftime('%Y%m%d')
+        # 多个线程共享限速，避免请求过于频繁
+        self.tick_limiter.acquire()
+        transaction_data = self.data_fetcher.get_transaction_detail(unit['symbol'], trade_date)
+        if transaction_data.empty:
+            return 0
+        if not self.data_storage.save_transaction_details({unit['symbol']: transaction_data}):
+            raise RuntimeError("保存成交明细数据失败")
+        return len(transaction_data)
+    
+    def _import_adj_factor_unit(self, unit: Dict) -> int:
+        """导入一只股票的复权因子（完整历史，只保留因子变化的日期），返回保存的记录数"""
+        factors = self.data_fetcher.get_adj_factors(unit['symbol'])
+        # 添加延时避免请求过于频繁
+        time.sleep(0.1)
+        if factors.empty:
+            raise ValueError("没有获取到复权因子")
+        if not self.data_storage.save_adj_factors(factors):
+            raise RuntimeError("保存复权因子失败")
+        return len(factors)
+    
+    def _import_daily_data(self, job_name: str, symbols: List[str], start_date: date, end_date: date,
+                           resume: bool = False) -> Dict:
+        """导入日线数据（每只股票一个单元）"""
+        units = self._build_units('daily', symbols, start_date, end_date)
+        return self._run_units(job_name, 'daily', units, resume, "导入日线数据")
+    
+    def _import_transaction_data(self, job_name: str, symbols: List[str], start_date: date, end_date: date,
+                                 resume: bool = False) -> Dict:
+        """导入成交明细数据（每只股票每个交易日一个单元，TICK_IMPORT_WORKERS 个线程并行）"""
+        units = self._build_units('transaction', symbols, start_date, end_date)
+        return self._run_units(job_name, 'transaction', units, resume, "导入成交明细",
+                               workers=Config.TICK_IMPORT_WORKERS)
+    
+    def _import_adj_factors(self, job_name: str, symbols: List[str], start_date: date, end_date: date,
+                            resume: bool = False) -> Dict:
+        """导入复权因子（每只股票一个单元）"""
+        units = self._build_units('adj_factor', symbols, start_date, end_date)
+        return self._run_units(job_name, 'adj_factor', units, resume, "导入复权因子")
+    
+    def enqueue(self, start_date: str = None, end_date: str = None, symbols: List[str] = None,
+                data_types: List[str] = None, resume: bool = False) -> str:
+        """
+        分布式模式：只把任务单元写入 import_job_unit 表，由各主机的工作进程领取执行
         
-        # 批量保存成交明细数据
-        if all_transaction_data:
-            try:
-                # 合并每个股票的数据
-                final_transaction_data = {}
-                for symbol, data_list in all_transaction_data.items():
-                    if data_list:
-                        final_transaction_data[symbol] = pd.concat(data_list, ignore_index=True)
-                
-                self.data_storage.save_transaction_details(final_transaction_data)
-                results['total_records'] = sum(len(df) for df in final_transaction_data.values())
-                logger.info(f"成功保存成交明细数据 {results['total_records']} 条")
-            except Exception as e:
-                logger.error(f"保存成交明细数据失败: {e}")
+        Returns:
+            任务名称
+        """
+        data_types = data_types or ['daily', 'transaction']
+        end_date = end_date or datetime.now().strftime('%Y%m%d')
+        start_date = start_date or (datetime.now() - timedelta(days=30)).strftime('%Y%m%d')
+        start_day = datetime.strptime(start_date, '%Y%m%d').date()
+        end_day = datetime.strptime(end_date, '%Y%m%d').date()
+        job_name = make_job_name(start_day, end_day)
+        
+        if not symbols:
+            symbols = self.data_fetcher.get_stock_list()['symbol'].tolist()
         
-        return results
+        for data_type in data_types:
+            units = self._build_units(data_type, symbols, start_day, end_day)
+            created = self.job_store.create_units(job_name, data_type, units, resume=resume)
+            logger.info(f"任务 {job_name} 写入 {data_type} 单元 {created} 个（共 {len(units)} 个）")
+        return job_name
+    
+    def fill_gaps(self, start_date: str = None, end_date: str = None, symbols: List[str] = None,
+                  data_types: List[str] = None, dry_run: bool = False, merge_gap: int = 0,
+                  recheck: bool = False) -> Dict[str, Dict]:
+        """
+        检测缺失的 (股票, 交易日) 并只导入缺失的区间
+        
+        Args:
+            data_types: 数据类型列表，只支持 daily 和 transaction
+            dry_run: 只输出缺口统计、请求次数和预计耗时，不导入
+            merge_gap: 间隔不超过该交易日数的缺失区间合并为一次日线请求
+            recheck: 重新请求已完成单元覆盖但仍然缺失的日期
+        
+        Returns:
+            每种数据类型的缺口统计（dry_run=False时附带导入结果）
+        """
+        data_types = [data_type for data_type in (data_types or ['daily', 'transaction'])
+                      if data_type in GAP_DATA_TYPES]
+        end_date = end_date or datetime.now().strftime('%Y%m%d')
+        start_date = start_date or (datetime.now() - timedelta(days=30)).strftime('%Y%m%d')
+        start_day = datetime.strptime(start_date, '%Y%m%d').date()
+        end_day = datetime.strptime(end_date, '%Y%m%d').date()
+        job_name = f"gaps_{start_day:%Y%m%d}_{end_day:%Y%m%d}"
+        
+        reports = {}
+        for data_type in data_types:
+            # 成交明细按交易日请求，合并区间不能减少请求次数
+            spans = self.gap_planner.plan(data_type, start_day, end_day, symbols,
+                                          merge_gap=merge_gap if data_type == 'daily' else 0,
+                                          skip_attempted=not recheck)
+            report = self.gap_planner.estimate(data_type, spans)
+            report['spans_detail'] = spans
+            logger.info(f"{data_type} 缺口: {report['symbols']} 只股票，{report['missing_days']} 个交易日，"
+                        f"{report['spans']} 个区间，需要 {report['requests']} 次请求，"
+                        f"预计 {report['estimated_seconds'] / 60:.1f} 分钟")
+            
+            if not dry_run and not spans.empty:
+                if data_type == 'daily':
+                    units = list(zip(spans['symbol'], spans['start_date'], spans['end_date']))
+                else:
+                    calendar = self.gap_planner.trade_calendar(start_day, end_day).astype(object)
+                    units = sorted(((symbol, day, day)
+                                    for symbol, start, end in zip(spans['symbol'], spans['start_date'], spans['end_date'])
+                                    for day in calendar[(calendar >= start) & (calendar <= end)]),
+                                   key=lambda unit: (unit[1], unit[0]))
+                # 缺口任务的已完成单元保留下来，下次检测时据此跳过数据源没有数据的日期
+                workers = Config.TICK_IMPORT_WORKERS if data_type == 'transaction' else 1
+                report['result'] = self._run_units(job_name, data_type, units, True, f"补齐{data_type}缺口", workers)
+            reports[data_type] = report
+        return reports
     
     def import_stock_list(self) -> bool:
-        """导入股票列表"""
+        """导入股票列表（含已退市股票的上市和退市日期，用于缺口检测）"""
         try:
             logger.info("开始导入股票列表...")
             stock_list = self.data_fetcher.get_stock_list()
             if not stock_list.empty:
+                delisted = self.data_fetcher.get_delisted_stocks()
+                delisted = delisted[~delisted['symbol'].isin(stock_list['symbol'])]
+                if not delisted.empty:
+                    stock_list = pd.concat([stock_list, delisted], ignore_index=True)
                 success = self.data_storage.save_stock_info(stock_list)
                 if success:
                     logger.info(f"成功导入股票列表 {len(stock_list)} 只")
@@ -256,16 +412,27 @@ def main():
     parser.add_argument('--end-date', type=str, help='结束日期 (YYYYMMDD)')
     parser.add_argument('--symbols', type=str, nargs='+', help='股票代码列表')
     parser.add_argument('--data-types', type=str, nargs='+', 
-                       choices=['daily', 'transaction'], 
-                       default=['daily', 'transaction'],
-                       help='数据类型')
+                       choices=['daily', 'transaction', 'adj_factor'], 
+                       help='数据类型，默认为 daily transaction（工作进程默认处理全部类型）')
     parser.add_argument('--stock-list', action='store_true', help='只导入股票列表')
     parser.add_argument('--progress', action='store_true', help='显示导入进度')
+    parser.add_argument('--resume', action='store_true', help='断点续传：跳过上次已完成的单元，重试失败的单元')
+    parser.add_argument('--enqueue', action='store_true', help='分布式模式：只写入任务单元，由工作进程领取执行')
+    parser.add_argument('--worker', action='store_true', help='分布式模式：作为工作进程领取并执行任务单元')
+    parser.add_argument('--workers', type=int, metavar='N', help='分布式模式：在本机启动N个工作进程')
+    parser.add_argument('--job-name', type=str, help='工作进程只处理该任务的单元（默认全部任务）')
+    parser.add_argument('--wait', action='store_true', help='工作进程常驻，持续等待新的任务单元')
+    parser.add_argument('--fill-gaps', action='store_true', help='检测缺失的 股票 × 交易日 并只导入缺失的区间')
+    parser.add_argument('--dry-run', action='store_true', help='配合 --fill-gaps：只输出缺口统计和预计耗时')
+    parser.add_argument('--merge-gap', type=int, default=0, help='配合 --fill-gaps：间隔不超过N个交易日的日线缺口合并请求')
+    parser.add_argument('--recheck', action='store_true', help='配合 --fill-gaps：重新请求之前已请求过但仍缺失的日期')
+    parser.add_argument('--metrics-json', metavar='PATH', help='运行结束时把运行指标写入该JSON文件，默认 METRICS_JSON_PATH')
+    parser.add_argument('--profile', nargs='?', const='cprofile', choices=PROFILE_MODES,
+                        help='性能剖析（cprofile 或 sample，默认cprofile），结束时输出热点函数和各分段耗时')
     
     args = parser.parse_args()
     
     # 设置日志
-    from src.config import Config
     Config.setup_logging()
     
     # 验证配置
@@ -275,6 +442,9 @@ def main():
         print(f"配置验证失败: {e}")
         return
     
+    dump_metrics_on_exit(args.metrics_json)
+    setup_tracing(args.profile)
+    
     # 创建导入器
     importer = BatchImporter()
     
@@ -288,6 +458,60 @@ def main():
             print(f"成交明细: {progress.get('transaction_detail_count', 0)} 条")
             print(f"最新交易日期: {progress.get('latest_trade_date', 'N/A')}")
             
+            units = importer.job_store.summary()
+            if not units.empty:
+                print("\n=== 导入任务单元 ===")
+                print(units.to_string(index=False))
+            
+        elif args.fill_gaps:
+            reports = importer.fill_gaps(
+                start_date=args.start_date,
+                end_date=args.end_date,
+                symbols=args.symbols,
+                data_types=args.data_types,
+                dry_run=args.dry_run,
+                merge_gap=args.merge_gap,
+                recheck=args.recheck
+            )
+            for data_type, report in reports.items():
+                print(f"\n=== {data_type} 缺口 ===")
+                print(f"股票数: {report['symbols']}")
+                print(f"缺失交易日: {report['missing_days']}")
+                print(f"区间数: {report['spans']}")
+                print(f"请求次数: {report['requests']}")
+                print(f"预计耗时: {report['estimated_seconds'] / 60:.1f} 分钟"
+                      f"（单次 {report['seconds_per_request']:.2f} 秒，单进程）")
+                spans = report['spans_detail']
+                if args.dry_run and not spans.empty:
+                    print(spans.sort_values('missing_days', ascending=False).head(20).to_string(index=False))
+                if 'result' in report:
+                    print(f"导入: {report['result']['total_records']} 条，"
+                          f"失败 {len(report['result']['failed_stocks'])} 只")
+            
+        elif args.enqueue:
+            job_name = importer.enqueue(
+                start_date=args.start_date,
+                end_date=args.end_date,
+                symbols=args.symbols,
+                data_types=args.data_types,
+                resume=args.resume
+            )
+            print(f"任务单元已写入: {job_name}")
+            print(importer.job_store.summary(job_name).to_string(index=False))
+            
+        elif args.worker or args.workers:
+            from src.import_worker import ImportWorker, run_workers
+            if args.workers:
+                failed = run_workers(args.workers, args.job_name, args.data_types, args.wait)
+                print(f"{args.workers} 个工作进程结束，异常退出 {failed} 个")
+            else:
+                stats = ImportWorker(importer).run(job_name=args.job_name, data_types=args.data_types,
+                                                   wait=args.wait)
+                print(f"完成 {stats['units']} 个单元，{stats['rows']} 条记录，失败 {stats['failed']} 个单元")
+            summary = importer.job_store.summary(args.job_name)
+            if not summary.empty:
+                print(summary.to_string(index=False))
+            
         elif args.stock_list:
             # 只导入股票列表
             success = importer.import_stock_list()
@@ -302,13 +526,16 @@ def main():
                 start_date=args.start_date,
                 end_date=args.end_date,
                 symbols=args.symbols,
-                data_types=args.data_types
+                data_types=args.data_types,
+                resume=args.resume
             )
             
             print("\n=== 导入结果 ===")
             print(f"总股票数: {results['total_stocks']}")
             print(f"日线数据: {results['daily_data_count']} 条")
             print(f"成交明细: {results['transaction_data_count']} 条")
+            print(f"复权因子: {results['adj_factor_count']} 条")
+            print(f"隔离记录: {results['quarantined_count']} 条")
             print(f"成功: {len(results['success_stocks'])} 只")
             print(f"失败: {len(results['failed_stocks'])} 只")
             
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+收盘后采集优先级模块
+
+收盘后逐只股票请求的采集（当日日线、当日成交明细）按优先级执行，尽量在下游任务的截止时间前完成：
+    - 股票权重：持仓股票 > 重点指数成分股 > 其他股票，同一档内按近期日均成交额的分位数排序
+    - 数据类型权重：日线高于成交明细，推迟的单元按 股票权重 × 数据类型权重 的顺序被领取
+    - 单次请求耗时用指数加权平均估计；每处理一只股票前按剩余时间估算还能完成的股票数，
+      完成不了的低优先级股票（持仓和重点指数成分股除外）推迟到夜间补采队列
+    - 获取失败或没有数据的股票、保存失败时尚未保存的股票同样写入补采队列
+    - 补采队列为 import_job_unit 表中的 catchup_YYYYMMDD 任务，由夜间补采任务或分布式工作进程领取执行
+"""
+import os
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+import pandas as pd
+from loguru import logger
+
+from src.config import Config
+
+# 数据类型权重（下游任务对日线的截止时间更早）
+DATA_TYPE_WEIGHTS = {'daily': 2.0, 'transaction': 1.0}
+# 持仓股票和重点指数成分股的权重加成（流动性分位数在0~1之间，加成后的档位不会交叉）
+HOLDING_WEIGHT = 4.0
+INDEX_WEIGHT = 2.0
+# 流动性按最近多少个交易日的平均成交额计算
+LIQUIDITY_DAYS = 20
+
+
+def make_catchup_job_name(trade_date: date) -> str:
+    """夜间补采任务名称"""
+    return f"catchup_{trade_date:%Y%m%d}"
+
+
+class CollectionPrioritizer:
+    """收盘后采集的优先级和截止时间控制"""
+
+    # 单次请求耗时的指数加权平均系数
+    RATE_ALPHA = 0.3
+    # 预计耗时不超过剩余时间的这一比例，剩余部分留作余量
+    SAFETY_RATIO = 0.9
+    # 至少观察到这么多次请求后才根据耗时估计推迟股票，避免开头几次慢请求导致大量推迟
+    MIN_SAMPLES = 20
+
+    def __init__(self, data_fetcher, data_storage, job_store=None):
+        """
+        Args:
+            data_fetcher: 数据获取器（获取指数成分股）
+            data_storage: 数据存储器（计算流动性）
+            job_store: 导入任务单元状态，用于写入补采队列（None时推迟的股票只记录日志）
+        """
+        self.data_fetcher = data_fetcher
+        self.data_storage = data_storage
+        self.job_store = job_store
+        self._seconds_per_request = {}
+        self._samples = {}
+        self._index_members = None
+        self._index_date = None
+
+    def _holdings(self) -> set:
+        """持仓股票（HOLDINGS_FILE 中的 symbol 列）"""
+        path = Config.HOLDINGS_FILE
+        if not path or not os.path.exists(path):
+            return set()
+        try:
+            holdings = pd.read_csv(path, dtype={'symbol': str})
+            return set(holdings['symbol'].str.zfill(6))
+        except Exception as e:
+            logger.warning(f"读取持仓文件失败: {e}")
+            return set()
+
+    def _index_constituents(self) -> set:
+        """重点指数成分股（每天获取一次）"""
+        today = date.today()
+        if self._index_date != today:
+            members = set()
+            for index_code in Config.PRIORITY_INDEXES:
+                members.update(self.data_fetcher.get_index_constituents(index_code))
+            self._index_members, self._index_date = members, today
+        return self._index_members
+
+    def _liquidity(self, symbols: List[str]) -> pd.Series:
+        """近期日均成交额在全部股票中的分位数（0~1），没有日线数据的股票为0"""
+        latest = self.data_storage.get_latest_trade_date() or date.today()
+        bars = self.data_storage.get_daily_bars(start_date=latest - timedelta(days=LIQUIDITY_DAYS * 2))
+        if bars.empty:
+            return pd.Series(0.0, index=symbols)
+        amount = bars.groupby('symbol')['amount'].apply(lambda values: values.tail(LIQUIDITY_DAYS).mean())
+        return amount.rank(pct=True).reindex(symbols).fillna(0.0)
+
+    def symbol_weights(self, symbols: List[str]) -> pd.Series:
+        """
+        股票权重：持仓加成 + 指数成分股加成 + 流动性分位数
+
+        Returns:
+            以股票代码为索引的权重，降序排列
+        """
+        symbols = list(dict.fromkeys(symbols))
+        weights = self._liquidity(symbols)
+        weights += pd.Series(symbols, index=symbols).isin(self._index_constituents()) * INDEX_WEIGHT
+        weights += pd.Series(symbols, index=symbols).isin(self._holdings()) * HOLDING_WEIGHT
+        return weights.sort_values(ascending=False, kind='stable')
+
+    def seconds_per_request(self, data_type: str) -> float:
+        """单次请求耗时的估计值（跨交易日保留，没有观测时取 REQUEST_DELAY）"""
+        return self._seconds_per_request.get(data_type, Config.REQUEST_DELAY)
+
+    def _observe(self, data_type: str, elapsed: float):
+        """更新单次请求耗时的指数加权平均"""
+        self._samples[data_type] = self._samples.get(data_type, 0) + 1
+        if data_type not in self._seconds_per_request:
+            self._seconds_per_request[data_type] = elapsed
+        else:
+            self._seconds_per_request[data_type] += self.RATE_ALPHA * (elapsed - self._seconds_per_request[data_type])
+
+    def collect(self, data_type: str, symbols: List[str], deadline: datetime,
+                fetch: Callable[[str], pd.DataFrame], save: Callable[[Dict[str, pd.DataFrame]], bool],
+                save_batch: int = 200) -> Dict[str, pd.DataFrame]:
+        """
+        按优先级逐只股票获取数据，每获取 save_batch 只保存一次，截止时间有风险时推迟低优先级股票
+
+        推迟、获取失败或没有数据的股票写入夜间补采队列；保存失败时未保存和尚未获取的股票也写入后再抛出异常
+
+        Args:
+            data_type: daily 或 transaction
+            symbols: 股票代码列表
+            deadline: 截止时间，开始时已过截止时间（如手动补跑）则不推迟
+            fetch: 获取一只股票数据的函数
+            save: 保存 {股票代码: 数据} 的函数，返回是否成功
+
+        Returns:
+            {股票代码: 数据}（不含推迟和没有数据的股票）
+        """
+        weights = self.symbol_weights(symbols)
+        protected = set(weights.index[weights >= INDEX_WEIGHT])
+        queue = deque(weights.index)
+        enforce = datetime.now() < deadline
+        results, pending, deferred, failed, unsaved = {}, {}, [], [], []
+
+        def flush():
+            if pending and not save(dict(pending)):
+                raise RuntimeError(f"保存{data_type}数据失败")
+            pending.clear()
+
+        try:
+            while queue:
+                if enforce and self._samples.get(data_type, 0) >= self.MIN_SAMPLES:
+                    remaining = (deadline - datetime.now()).total_seconds() * self.SAFETY_RATIO
+                    capacity = max(int(remaining / self.seconds_per_request(data_type)), 0)
+                    if len(queue) > capacity and queue[-1] not in protected:
+                        before = len(deferred)
+                        while len(queue) > capacity and queue[-1] not in protected:
+                            deferred.append(queue.pop())
+                        logger.warning(f"{data_type} 采集预计无法在 {deadline:%H:%M} 前完成，"
+                                       f"推迟 {len(deferred) - before} 只低优先级股票到夜间补采")
+
+                symbol = queue.popleft()
+                started = time.monotonic()
+                try:
+                    data = fetch(symbol)
+                except Exception as e:
+                    logger.error(f"获取股票 {symbol} {data_type} 数据失败: {e}")
+                    data = None
+                # 每10次请求延时一次避免请求过于频繁（计入单次请求耗时）
+                if (len(results) + len(failed) + 1) % 10 == 0:
+                    time.sleep(1)
+                self._observe(data_type, time.monotonic() - started)
+
+                if data is None or data.empty:
+                    failed.append(symbol)
+                    continue
+                results[symbol] = pending[symbol] = data
+                if len(pending) >= save_batch:
+                    flush()
+            flush()
+        except Exception:
+            # 未保存和尚未获取的股票交给夜间补采
+            unsaved = list(pending) + list(queue)
+            for symbol in pending:
+                results.pop(symbol)
+            raise
+        finally:
+            logger.info(f"{data_type} 采集结束: 成功 {len(results)} 只，"
+                        f"失败 {len(failed)} 只，推迟 {len(deferred)} 只，未保存 {len(unsaved)} 只"
+                        f"（单次请求估计 {self.seconds_per_request(data_type):.2f} 秒）")
+            missed = deferred + failed + unsaved
+            if missed:
+                self.defer(data_type, missed, weights)
+        return results
+
+    def defer(self, data_type: str, symbols: List[str], weights: pd.Series, trade_date: date = None):
+        """推迟或没有采集到的股票写入夜间补采队列"""
+        trade_date = trade_date or date.today()
+        if self.job_store is None:
+            logger.warning(f"没有补采队列，推迟的 {len(symbols)} 只股票需要手动补采")
+            return
+        job_name = make_catchup_job_name(trade_date)
+        type_weight = DATA_TYPE_WEIGHTS.get(data_type, 1.0)
+        created = self.job_store.create_units(
+            job_name, data_type, [(symbol, trade_date, trade_date) for symbol in symbols], resume=True,
+            priorities={symbol: float(weights.get(symbol, 0.0)) * type_weight for symbol in symbols})
+        logger.info(f"补采任务 {job_name}: 新增 {created} 个 {data_type} 单元")
@@ -14,12 +14,19 @@ class Config:
     """配置类"""
     
     # 数据库配置
+    DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'data/quantitative_finance.db')
     DB_HOST = os.getenv('DB_HOST', 'localhost')
     DB_PORT = int(os.getenv('DB_PORT', '3306'))
     DB_USER = os.getenv('DB_USER', 'root')
     DB_PASSWORD = os.getenv('DB_PASSWORD', '')
     DB_NAME = os.getenv('DB_NAME', 'quantitative_finance')
     
+    # 分析数据库配置（DuckDB）
+    ANALYTICS_DB_PATH = os.getenv('ANALYTICS_DB_PATH', 'data/analytics.duckdb')
+    # 增量同步时重新读取已同步最大id之前的id数（并发写入的事务可能晚于id更大的记录提交）
+    ANALYTICS_SYNC_OVERLAP = int(os.getenv('ANALYTICS_SYNC_OVERLAP', '50000'))
+    
     # Tushare配置
     TUSHARE_TOKEN = os.getenv('TUSHARE_TOKEN', '')
     
@@ -27,17 +34,87 @@ class Config:
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'logs/quantitative_finance.log')
     
+    # 数据库日志配置（异步批量写入system_log表）
+    LOG_DB_ENABLED = os.getenv('LOG_DB_ENABLED', 'false').lower() == 'true'
+    LOG_DB_LEVEL = os.getenv('LOG_DB_LEVEL', 'WARNING')
+    LOG_DB_BATCH_SIZE = int(os.getenv('LOG_DB_BATCH_SIZE', '200'))
+    LOG_DB_FLUSH_INTERVAL = float(os.getenv('LOG_DB_FLUSH_INTERVAL', '2.0'))
+    LOG_DB_QUEUE_SIZE = int(os.getenv('LOG_DB_QUEUE_SIZE', '10000'))
+    
     # 数据源配置
     DATA_SOURCE = os.getenv('DATA_SOURCE', 'akshare')
     
     # 任务调度配置
     DAILY_TASK_TIME = os.getenv('DAILY_TASK_TIME', '15:30')
-    TRANSACTION_TASK_INTERVAL = int(os.getenv('TRANSACTION_TASK_INTERVAL', '30'))
+    TRANSACTION_TASK_INTERVAL = int(os.getenv('TRANSACTION_TASK_INTERVAL', '30'))  # 盘中采集间隔（分钟），从每个半场开盘起算
+    PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '4'))  # 收盘后流水线并行执行的阶段数
+    
+    # 收盘后采集的截止时间（下游任务需要数据的时间），来不及采集的低优先级股票推迟到夜间补采
+    DAILY_BAR_DEADLINE = os.getenv('DAILY_BAR_DEADLINE', '16:00')
+    TICK_DEADLINE = os.getenv('TICK_DEADLINE', '18:00')
+    CATCHUP_TASK_TIME = os.getenv('CATCHUP_TASK_TIME', '22:00')
+    # 采集优先级：持仓文件（包含symbol列的CSV）和重点指数（逗号分隔的指数代码）中的股票优先采集、不推迟
+    HOLDINGS_FILE = os.getenv('HOLDINGS_FILE', 'data/holdings.csv')
+    PRIORITY_INDEXES = [code.strip() for code in os.getenv('PRIORITY_INDEXES', '000300,000905').split(',') if code.strip()]
+    
+    # 分钟K线配置
+    MINUTE_BAR_FREQS = [int(freq) for freq in os.getenv('MINUTE_BAR_FREQS', '1,5,15,30,60').split(',') if freq.strip()]
+    RESAMPLE_WORKERS = int(os.getenv('RESAMPLE_WORKERS', '0'))  # 0表示使用CPU核数
+    
+    # 价格面板配置（内存映射的 日期 × 股票 矩阵）
+    PRICE_PANEL_DIR = os.getenv('PRICE_PANEL_DIR', 'data/price_panel')
+    
+    # 因子引擎状态文件（滚动窗口和指数均线状态，用于增量计算）
+    FACTOR_STATE_PATH = os.getenv('FACTOR_STATE_PATH', 'data/factor_state.npz')
+    
+    # 协方差矩阵配置（滚动窗口日收益率，支持 none / ledoit_wolf / constant_correlation 收缩）
+    COVARIANCE_DIR = os.getenv('COVARIANCE_DIR', 'data/covariance')
+    COVARIANCE_WINDOW = int(os.getenv('COVARIANCE_WINDOW', '250'))
+    COVARIANCE_SHRINKAGE = os.getenv('COVARIANCE_SHRINKAGE', 'ledoit_wolf')
+    
+    # 成交明细冷数据归档配置
+    TICK_ARCHIVE_DIR = os.getenv('TICK_ARCHIVE_DIR', 'data/tick_archive')
+    TICK_ARCHIVE_MONTHS = int(os.getenv('TICK_ARCHIVE_MONTHS', '3'))  # 数据库中保留最近几个完整月份
+    TICK_ARCHIVE_COMPRESS = os.getenv('TICK_ARCHIVE_COMPRESS', 'true').lower() == 'true'
+    
+    # 资金流汇总配置：单笔成交额不低于该值（元）计为大单
+    ORDER_FLOW_LARGE_AMOUNT = float(os.getenv('ORDER_FLOW_LARGE_AMOUNT', '200000'))
     
     # 数据获取配置
     MAX_RETRY_COUNT = int(os.getenv('MAX_RETRY_COUNT', '3'))
     REQUEST_DELAY = float(os.getenv('REQUEST_DELAY', '1.0'))
     
+    # 批量导入断点续传：失败单元按指数退避重试（最多 MAX_RETRY_COUNT 次）
+    IMPORT_RETRY_BASE_SECONDS = float(os.getenv('IMPORT_RETRY_BASE_SECONDS', '30'))
+    IMPORT_RETRY_MAX_SECONDS = float(os.getenv('IMPORT_RETRY_MAX_SECONDS', '600'))
+    
+    # 分布式采集配置（多台主机的工作进程从 import_job_unit 表领取任务单元）
+    DISTRIBUTED_COLLECTION = os.getenv('DISTRIBUTED_COLLECTION', 'false').lower() == 'true'
+    IMPORT_LEASE_SECONDS = float(os.getenv('IMPORT_LEASE_SECONDS', '120'))
+    IMPORT_CLAIM_BATCH = int(os.getenv('IMPORT_CLAIM_BATCH', '10'))
+    IMPORT_POLL_SECONDS = float(os.getenv('IMPORT_POLL_SECONDS', '5'))
+    
+    # 按交易所/板块导入（import_stocks.py）：所有板块共享的每秒请求数、每个板块的获取线程数
+    IMPORT_RATE_LIMIT = float(os.getenv('IMPORT_RATE_LIMIT', '5'))
+    IMPORT_BOARD_WORKERS = int(os.getenv('IMPORT_BOARD_WORKERS', '2'))
+    # 成交明细批量导入和补缺口的并行线程数（与其他导入共享 IMPORT_RATE_LIMIT 限速）
+    TICK_IMPORT_WORKERS = int(os.getenv('TICK_IMPORT_WORKERS', '4'))
+    # 后台批量写入：每次写入的行数、队列中最多等待写入的数据块数
+    WRITE_BATCH_ROWS = int(os.getenv('WRITE_BATCH_ROWS', '20000'))
+    WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', '200'))
+    
+    # 运行指标：调度器在本机该端口提供 Prometheus 格式的 /metrics（0表示不启动），
+    # METRICS_JSON_PATH 非空时每次运行结束把指标写入该JSON文件
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_JSON_PATH = os.getenv('METRICS_JSON_PATH', '')
+    
+    # 耗时分段和性能剖析：TRACE_ENABLED 为 true 时运行结束输出各分段的耗时汇总（--profile 时总是启用），
+    # 剖析文件保存在 PROFILE_DIR，sample 模式的采样间隔为 PROFILE_SAMPLE_INTERVAL 秒
+    TRACE_ENABLED = os.getenv('TRACE_ENABLED', 'false').lower() == 'true'
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'logs/profile')
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.01'))
+    
     @classmethod
     def setup_logging(cls):
         """设置日志配置"""
@@ -67,6 +144,15 @@ class Config:
                 compression="zip"
             )
             
+            # 添加数据库输出（后台线程批量写入）
+            if cls.LOG_DB_ENABLED:
+                from src.log_sink import get_log_sink, is_sink_record
+                logger.add(
+                    get_log_sink(),
+                    level=cls.LOG_DB_LEVEL,
+                    filter=lambda record: not is_sink_record(record)
+                )
+            
             logger.info("日志配置完成")
             
         except Exception as e:
@@ -78,12 +164,18 @@ class Config:
         errors = []
         
         # 检查数据库配置
-        if not cls.DB_HOST:
-            errors.append("DB_HOST 未配置")
-        if not cls.DB_USER:
-            errors.append("DB_USER 未配置")
-        if not cls.DB_NAME:
-            errors.append("DB_NAME 未配置")
+        if cls.DB_BACKEND == 'mysql':
+            if not cls.DB_HOST:
+                errors.append("DB_HOST 未配置")
+            if not cls.DB_USER:
+                errors.append("DB_USER 未配置")
+            if not cls.DB_NAME:
+                errors.append("DB_NAME 未配置")
+        elif cls.DB_BACKEND == 'sqlite':
+            if not cls.SQLITE_PATH:
+                errors.append("SQLITE_PATH 未配置")
+        else:
+            errors.append(f"不支持的数据库后端: {cls.DB_BACKEND}")
         
         # 检查日志配置
         if not cls.LOG_LEVEL:
@@ -102,7 +194,10 @@ class Config:
     def print_config(cls):
         """打印配置信息"""
         logger.info("当前配置:")
-        logger.info(f"  数据库: {cls.DB_HOST}:{cls.DB_PORT}/{cls.DB_NAME}")
+        if cls.DB_BACKEND == 'sqlite':
+            logger.info(f"  数据库: sqlite:{cls.SQLITE_PATH}")
+        else:
+            logger.info(f"  数据库: {cls.DB_HOST}:{cls.DB_PORT}/{cls.DB_NAME}")
         logger.info(f"  数据源: {cls.DATA_SOURCE}")
         logger.info(f"  日志级别: {cls.LOG_LEVEL}")
         logger.info(f"  日志文件: {cls.LOG_FILE}")
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+协方差/相关系数矩阵模块
+
+基于价格面板的后复权收盘价，计算全市场日收益率在滚动窗口内的协方差矩阵和相关系数矩阵：
+    - 停牌（收益率缺失）按成对删除处理：每对股票只使用两者都有收益率的交易日
+    - 全量计算把 N × N 矩阵切分为 block_size × block_size 的分块，在进程池中并行计算，
+      各进程通过内存映射读取价格面板并直接写入各自的分块
+    - 磁盘上保存成对的充分统计量（重叠天数、Σx、Σxy 以及收缩估计所需的高阶矩），
+      新增一个交易日时只需加上新一天、减去移出窗口那一天的秩一更新，无需重新扫描窗口
+    - 支持 Ledoit-Wolf 收缩（目标为单位阵的倍数）和常相关系数收缩（Ledoit-Wolf 2003）
+    - 结果以 float32 内存映射文件保存，5000只股票的协方差矩阵约100MB
+
+目录结构：
+    meta.json               股票代码、窗口起止日期、收缩方式与强度、当前文件代数，原子替换
+    {stat}.{gen}.bin        充分统计量（N × N）
+    cov.{out}.bin           协方差矩阵（float32，N × N）
+    corr.{out}.bin          相关系数矩阵（float32，N × N）
+
+收缩强度估计中的四阶矩项使用未中心化的矩（日收益率均值远小于波动率）。
+股票列表变化（新股上市）时重新全量计算。只允许一个写入进程。
+"""
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.config import Config
+from src.price_panel import PricePanel
+
+# 充分统计量: 存储类型。sx[i, j] 为股票i在与j重叠交易日上的收益率之和，
+# sx3y[i, j] = Σ x_i³·x_j，两者均不对称
+STAT_DTYPES = {
+    'n': 'float32',
+    'sx': 'float64',
+    'sxy': 'float64',
+    'sx2y2': 'float64',
+    'sx3y': 'float64',
+}
+
+SHRINKAGE_METHODS = ('none', 'ledoit_wolf', 'constant_correlation')
+
+META_FILE = 'meta.json'
+
+# 进程内缓存的窗口收益率矩阵: (面板目录, 起始行, 结束行) -> ndarray
+_returns_cache = {}
+
+
+def window_returns(panel: PricePanel, start_row: int, end_row: int) -> np.ndarray:
+    """面板第 start_row 到 end_row-1 行的日收益率（交易日 × 股票），停牌或新股首日为NaN"""
+    close = np.asarray(panel.field('close')[max(start_row - 1, 0):end_row], dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = close[1:] / close[:-1] - 1
+    if start_row == 0:
+        returns = np.vstack([np.full((1, close.shape[1]), np.nan), returns])
+    return returns
+
+
+def _tile_task(task) -> int:
+    """进程池任务：计算一个分块的充分统计量并写入内存映射文件"""
+    panel_dir, cov_dir, generation, n_symbols, start_row, end_row, rows, cols = task
+
+    key = (panel_dir, start_row, end_row)
+    if key not in _returns_cache:
+        _returns_cache.clear()
+        _returns_cache[key] = window_returns(PricePanel(panel_dir), start_row, end_row)
+    returns = _returns_cache[key]
+
+    x, y = returns[:, rows[0]:rows[1]], returns[:, cols[0]:cols[1]]
+    mx, my = np.isfinite(x).astype(np.float64), np.isfinite(y).astype(np.float64)
+    x, y = np.nan_to_num(x, nan=0.0), np.nan_to_num(y, nan=0.0)
+
+    blocks = {
+        'n': (mx.T @ my, None),
+        'sx': (x.T @ my, mx.T @ y),
+        'sxy': (x.T @ y, None),
+        'sx2y2': ((x * x).T @ (y * y), None),
+        'sx3y': ((x ** 3).T @ y, x.T @ y ** 3),
+    }
+
+    row_slice, col_slice = slice(*rows), slice(*cols)
+    for name, (block, mirrored) in blocks.items():
+        stat = np.memmap(os.path.join(cov_dir, f"{name}.{generation}.bin"), dtype=STAT_DTYPES[name],
+                         mode='r+', shape=(n_symbols, n_symbols))
+        stat[row_slice, col_slice] = block
+        if rows != cols:
+            # 对称统计量的镜像分块为转置；非对称统计量的镜像分块单独计算
+            stat[col_slice, row_slice] = (block if mirrored is None else mirrored).T
+        stat.flush()
+        del stat
+    return (rows[1] - rows[0]) * (cols[1] - cols[0])
+
+
+class CovarianceMatrix:
+    """协方差/相关系数矩阵（只读）"""
+
+    def __init__(self, cov_dir: str = None):
+        self.cov_dir = cov_dir or Config.COVARIANCE_DIR
+        self.meta = None
+        self.symbols = None
+        self._symbol_index = None
+        self._arrays = {}
+        self.refresh()
+
+    def refresh(self):
+        """重新读取元数据（写入进程更新矩阵后调用）"""
+        meta_path = os.path.join(self.cov_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"协方差矩阵不存在，请先计算: {self.cov_dir}")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('output') is None:
+            raise FileNotFoundError(f"协方差矩阵尚未生成: {self.cov_dir}")
+
+        if self.meta is None or meta['output'] != self.meta['output']:
+            self._arrays = {}
+        self.meta = meta
+        self.symbols = np.array(meta['symbols'], dtype=object)
+        self._symbol_index = pd.Index(self.symbols)
+
+    @property
+    def end_date(self) -> date:
+        return date.fromisoformat(self.meta['end_date'])
+
+    @property
+    def intensity(self) -> float:
+        """收缩强度（0表示样本协方差）"""
+        return self.meta['intensity']
+
+    def _matrix(self, kind: str) -> np.ndarray:
+        if kind not in ('cov', 'corr'):
+            raise ValueError(f"不支持的矩阵类型: {kind}")
+        if kind not in self._arrays:
+            n = len(self.symbols)
+            self._arrays[kind] = np.memmap(os.path.join(self.cov_dir, f"{kind}.{self.meta['output']}.bin"),
+                                           dtype='float32', mode='r', shape=(n, n))
+        return self._arrays[kind]
+
+    @property
+    def cov(self) -> np.ndarray:
+        """协方差矩阵（float32只读内存映射，日收益率口径）"""
+        return self._matrix('cov')
+
+    @property
+    def corr(self) -> np.ndarray:
+        """相关系数矩阵（float32只读内存映射）"""
+        return self._matrix('corr')
+
+    def frame(self, kind: str = 'cov', symbols: List[str] = None) -> pd.DataFrame:
+        """矩阵（或部分股票的子矩阵）转换为DataFrame"""
+        matrix = self._matrix(kind)
+        if symbols is None:
+            return pd.DataFrame(np.asarray(matrix), index=self.symbols, columns=self.symbols)
+        indexer = self._symbol_index.get_indexer(symbols)
+        indexer = indexer[indexer >= 0]
+        return pd.DataFrame(np.asarray(matrix[np.ix_(indexer, indexer)]),
+                            index=self.symbols[indexer], columns=self.symbols[indexer])
+
+
+class CovarianceEngine:
+    """协方差矩阵计算引擎（单写入进程）"""
+
+    def __init__(self, panel: PricePanel = None, cov_dir: str = None, window: int = None,
+                 min_periods: int = None, shrinkage: str = None, block_size: int = 512,
+                 max_workers: int = None):
+        self.panel = panel or PricePanel()
+        self.cov_dir = cov_dir or Config.COVARIANCE_DIR
+        self.window = window or Config.COVARIANCE_WINDOW
+        self.min_periods = min_periods or max(self.window // 2, 2)
+        self.shrinkage = shrinkage or Config.COVARIANCE_SHRINKAGE
+        if self.shrinkage not in SHRINKAGE_METHODS:
+            raise ValueError(f"不支持的收缩方式: {self.shrinkage}")
+        self.block_size = block_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def _path(self, name: str, generation) -> str:
+        return os.path.join(self.cov_dir, f"{name}.{generation}.bin")
+
+    def _read_meta(self) -> Optional[Dict]:
+        meta_path = os.path.join(self.cov_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: Dict):
+        """原子替换元数据文件"""
+        meta['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        meta_path = os.path.join(self.cov_dir, META_FILE)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+    def _open_stats(self, meta: Dict, mode: str = 'r') -> Dict[str, np.memmap]:
+        n = len(meta['symbols'])
+        return {name: np.memmap(self._path(name, meta['generation']), dtype=dtype, mode=mode, shape=(n, n))
+                for name, dtype in STAT_DTYPES.items()}
+
+    def _remove_files(self, names, generation):
+        for name in names:
+            path = self._path(name, generation)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def build(self, end_date: date = None) -> bool:
+        """
+        全量计算截至end_date（默认面板最新交易日）的窗口统计量并生成矩阵
+
+        Returns:
+            是否成功
+        """
+        try:
+            self.panel.refresh()
+            end_row = self.panel.date_slice(end_date=end_date).stop
+            start_row = max(end_row - self.window, 0)
+            if end_row - start_row < self.min_periods:
+                logger.warning(f"价格面板交易日不足 {self.min_periods} 天，跳过协方差计算")
+                return False
+
+            os.makedirs(self.cov_dir, exist_ok=True)
+            old_meta = self._read_meta()
+            generation = old_meta['generation'] + 1 if old_meta else 1
+            symbols = self.panel.symbols.tolist()
+            n = len(symbols)
+
+            for name, dtype in STAT_DTYPES.items():
+                np.memmap(self._path(name, generation), dtype=dtype, mode='w+', shape=(n, n)).flush()
+
+            edges = list(range(0, n, self.block_size)) + [n]
+            blocks = list(zip(edges[:-1], edges[1:]))
+            tasks = [(self.panel.panel_dir, self.cov_dir, generation, n, start_row, end_row, rows, cols)
+                     for i, rows in enumerate(blocks) for cols in blocks[i:]]
+
+            logger.info(f"开始计算协方差统计量: {n} 只股票, {end_row - start_row} 个交易日, "
+                        f"{len(tasks)} 个分块, {self.max_workers} 个进程")
+            if self.max_workers <= 1:
+                for task in tasks:
+                    _tile_task(task)
+            else:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    list(executor.map(_tile_task, tasks))
+
+            meta = {
+                'generation': generation,
+                'symbols': symbols,
+                'window': self.window,
+                'panel_generation': self.panel.meta['generation'],
+                'start_date': str(self.panel.dates[start_row]),
+                'end_date': str(self.panel.dates[end_row - 1]),
+                'dirty': False,
+                'output': old_meta.get('output') if old_meta else None,
+            }
+            self._write_meta(meta)
+            if old_meta:
+                self._remove_files(STAT_DTYPES, old_meta['generation'])
+
+            return self.finalize()
+
+        except Exception as e:
+            logger.error(f"计算协方差统计量失败: {e}")
+            return False
+
+    def update(self) -> int:
+        """
+        增量更新：对面板中统计量之后的每个新交易日做秩一更新（加入新一天、移出窗口外的一天），
+        然后重新生成矩阵。没有统计量、上次更新中断或股票列表变化时全量计算。
+
+        Returns:
+            处理的交易日数，失败时为-1
+        """
+        try:
+            self.panel.refresh()
+            meta = self._read_meta()
+            if meta is None or meta.get('dirty') or meta['window'] != self.window \
+                    or meta['symbols'] != self.panel.symbols.tolist() \
+                    or meta.get('panel_generation', self.panel.meta['generation']) != self.panel.meta['generation']:
+                logger.info("协方差统计量需要全量计算")
+                return len(self.panel.dates) if self.build() else -1
+
+            dates = self.panel.dates
+            start_row = int(np.searchsorted(dates, np.datetime64(meta['start_date'], 'D')))
+            end_row = int(np.searchsorted(dates, np.datetime64(meta['end_date'], 'D'))) + 1
+            new_rows = range(end_row, len(dates))
+            if not new_rows:
+                logger.info("协方差统计量已是最新")
+                return 0
+
+            # 原地更新期间中断会使统计量与元数据不一致，先标记，下次运行时全量重算
+            meta['dirty'] = True
+            self._write_meta(meta)
+
+            stats = self._open_stats(meta, mode='r+')
+            for row in new_rows:
+                self._rank_one(stats, window_returns(self.panel, row, row + 1)[0], 1.0)
+                if row - start_row >= self.window:
+                    self._rank_one(stats, window_returns(self.panel, start_row, start_row + 1)[0], -1.0)
+                    start_row += 1
+            for stat in stats.values():
+                stat.flush()
+            del stats
+
+            meta.update({'start_date': str(dates[start_row]), 'end_date': str(dates[-1]), 'dirty': False})
+            self._write_meta(meta)
+            logger.info(f"协方差统计量增量更新完成: {len(new_rows)} 个交易日, 截至 {dates[-1]}")
+
+            return len(new_rows) if self.finalize() else -1
+
+        except Exception as e:
+            logger.error(f"增量更新协方差统计量失败: {e}")
+            return -1
+
+    def _rank_one(self, stats: Dict[str, np.memmap], returns: np.ndarray, sign: float):
+        """把一个交易日的收益率加入（sign=1）或移出（sign=-1）统计量，只更新当日有收益率的股票对"""
+        active = np.flatnonzero(np.isfinite(returns))
+        if len(active) == 0:
+            return
+        x = returns[active]
+        terms = {
+            'n': (np.ones_like(x), np.ones_like(x)),
+            'sx': (x, np.ones_like(x)),
+            'sxy': (x, x),
+            'sx2y2': (x * x, x * x),
+            'sx3y': (x ** 3, x),
+        }
+        for lo in range(0, len(active), self.block_size):
+            rows = active[lo:lo + self.block_size]
+            index = np.ix_(rows, active)
+            for name, (left, right) in terms.items():
+                stats[name][index] += sign * np.outer(left[lo:lo + self.block_size], right)
+
+    def _pair_blocks(self, stats: Dict[str, np.memmap], var: np.ndarray, with_theta: bool = False):
+        """
+        按行块生成成对统计：(行号, 协方差, 重叠天数, 有效掩码, π/n, θ_ij/n, θ_ji/n)
+        π_ij 为 x_i·x_j 的方差（协方差估计误差的方差 = π_ij / n_ij），θ 用于常相关系数收缩
+        """
+        n_symbols = len(var)
+        for lo in range(0, n_symbols, self.block_size):
+            rows = slice(lo, min(lo + self.block_size, n_symbols))
+            n = np.asarray(stats['n'][rows], dtype=np.float64)
+            sx = np.asarray(stats['sx'][rows])
+            sy = np.asarray(stats['sx'][:, rows]).T
+            sxy = np.asarray(stats['sxy'][rows])
+
+            valid = (n >= self.min_periods) & np.isfinite(var[rows])[:, None] & np.isfinite(var)[None, :]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                cov = (sxy - sx * sy / n) / (n - 1)
+                second = sxy / n
+                pi = (np.asarray(stats['sx2y2'][rows]) / n - second ** 2) / n
+                theta_ij = theta_ji = None
+                if with_theta:
+                    theta_ij = (np.asarray(stats['sx3y'][rows]) / n - var[rows][:, None] * second) / n
+                    theta_ji = (np.asarray(stats['sx3y'][:, rows]).T / n - var[None, :] * second) / n
+            yield rows, np.where(valid, cov, np.nan), valid, pi, theta_ij, theta_ji
+
+    def finalize(self, shrinkage: str = None) -> bool:
+        """由统计量计算（收缩后的）协方差矩阵和相关系数矩阵，写入新的float32文件"""
+        try:
+            shrinkage = shrinkage or self.shrinkage
+            meta = self._read_meta()
+            stats = self._open_stats(meta)
+            n_symbols = len(meta['symbols'])
+
+            idx = np.arange(n_symbols)
+            diag_n = np.asarray(stats['n'][idx, idx], dtype=np.float64)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                diag_sx = np.asarray(stats['sx'][idx, idx])
+                var = (np.asarray(stats['sxy'][idx, idx]) - diag_sx ** 2 / diag_n) / (diag_n - 1)
+            var = np.where((diag_n >= self.min_periods) & (var > 0), var, np.nan)
+            std = np.sqrt(var)
+            mean_var = np.nanmean(var) if np.isfinite(var).any() else np.nan
+
+            # 第一遍：平均相关系数、估计误差总和、与单位阵目标的距离
+            corr_sum = corr_count = pi_sum = distance = 0.0
+            for rows, cov, valid, pi, _, _ in self._pair_blocks(stats, var):
+                off_diag = valid.copy()
+                off_diag[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = False
+                corr = cov / (std[rows][:, None] * std[None, :])
+                corr_sum += corr[off_diag].sum()
+                corr_count += off_diag.sum()
+                pi_sum += pi[valid].sum()
+                target = np.where(off_diag, 0.0, mean_var)
+                distance += ((cov - target)[valid] ** 2).sum()
+            mean_corr = corr_sum / corr_count if corr_count else 0.0
+
+            # 第二遍（常相关系数）：与目标的距离和修正项ρ
+            if shrinkage == 'constant_correlation':
+                distance = rho = 0.0
+                for rows, cov, valid, pi, theta_ij, theta_ji in self._pair_blocks(stats, var, with_theta=True):
+                    diagonal = np.zeros_like(valid)
+                    diagonal[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = True
+                    target = np.where(diagonal, var[rows][:, None], mean_corr * std[rows][:, None] * std[None, :])
+                    distance += ((target - cov)[valid] ** 2).sum()
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        ratio = std[None, :] / std[rows][:, None]
+                        cross = mean_corr / 2 * (ratio * theta_ij + theta_ji / ratio)
+                    rho += pi[valid & diagonal].sum() + cross[valid & ~diagonal].sum()
+                intensity = (pi_sum - rho) / distance if distance > 0 else 1.0
+            elif shrinkage == 'ledoit_wolf':
+                intensity = min(pi_sum, distance) / distance if distance > 0 else 1.0
+            else:
+                intensity = 0.0
+            intensity = float(np.clip(intensity, 0.0, 1.0))
+
+            # 第三遍：写入新的输出文件，重叠天数不足的股票对使用收缩目标
+            old_output = meta.get('output')
+            output = (old_output or 0) + 1
+            cov_out = np.memmap(self._path('cov', output), dtype='float32', mode='w+',
+                                shape=(n_symbols, n_symbols))
+            corr_out = np.memmap(self._path('corr', output), dtype='float32', mode='w+',
+                                 shape=(n_symbols, n_symbols))
+            for rows, cov, valid, _, _, _ in self._pair_blocks(stats, var):
+                diagonal = np.zeros_like(valid)
+                diagonal[np.arange(rows.stop - rows.start), np.arange(rows.start, rows.stop)] = True
+                if shrinkage == 'constant_correlation':
+                    target = np.where(diagonal, var[rows][:, None], mean_corr * std[rows][:, None] * std[None, :])
+                elif shrinkage == 'ledoit_wolf':
+                    target = np.where(diagonal, mean_var, 0.0)
+                else:
+                    cov_out[rows] = cov
+                    continue
+                shrunk = np.where(valid, intensity * target + (1 - intensity) * np.nan_to_num(cov), target)
+                cov_out[rows] = np.where(np.isfinite(std[rows])[:, None] & np.isfinite(std)[None, :], shrunk, np.nan)
+
+            # 相关系数由收缩后的协方差矩阵换算，保证与协方差矩阵一致
+            shrunk_var = np.asarray(cov_out[idx, idx], dtype=np.float64)
+            shrunk_std = np.sqrt(np.where(shrunk_var > 0, shrunk_var, np.nan))
+            for lo in range(0, n_symbols, self.block_size):
+                rows = slice(lo, min(lo + self.block_size, n_symbols))
+                corr_out[rows] = np.asarray(cov_out[rows], dtype=np.float64) \
+                    / (shrunk_std[rows][:, None] * shrunk_std[None, :])
+            cov_out.flush()
+            corr_out.flush()
+            del cov_out, corr_out, stats
+
+            meta.update({'output': output, 'shrinkage': shrinkage,
+                         'intensity': intensity, 'mean_corr': float(mean_corr), 'min_periods': self.min_periods})
+            self._write_meta(meta)
+            if old_output is not None:
+                self._remove_files(('cov', 'corr'), old_output)
+
+            logger.info(f"协方差矩阵生成完成: {n_symbols} 只股票, 截至 {meta['end_date']}, "
+                        f"收缩方式 {shrinkage}, 强度 {intensity:.4f}")
+            return True
+
+        except Exception as e:
+            logger.error(f"生成协方差矩阵失败: {e}")
+            return False
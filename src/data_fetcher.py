@@ -2,8 +2,9 @@
 """
 股票数据获取模块
 """
-import akshare as ak
-import tushare as ts
+import functools
+import importlib
+import threading
 import pandas as pd
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional
@@ -11,26 +12,145 @@ from loguru import logger
 import time
 import os
 
+from src.metrics import get_registry
+from src.tracing import span
+
+_metrics = get_registry()
+FETCH_SECONDS = _metrics.histogram('fetch_request_seconds', '数据源接口单次请求耗时（秒）', ['source', 'endpoint'])
+FETCH_REQUESTS = _metrics.counter('fetch_requests', '数据源接口请求次数', ['source', 'endpoint', 'status'])
+FETCH_ROWS = _metrics.counter('fetch_rows', '数据源接口返回的行数', ['source', 'endpoint'])
+FETCH_RETRIES = _metrics.counter('fetch_retries', '数据获取失败后的重试次数', ['operation'])
+FETCH_PROCESS_SECONDS = _metrics.histogram('fetch_process_seconds', '数据获取方法中请求以外的耗时（数据整理，秒）',
+                                           ['operation'])
+
+# 当前线程累计的请求和退避等待耗时，用于从方法总耗时中扣除
+_fetch_clock = threading.local()
+
+
+def _waited_seconds() -> float:
+    return getattr(_fetch_clock, 'seconds', 0.0)
+
+
+def _instrument(source: str, endpoint: str, func):
+    """包装数据源接口：记录请求耗时、结果状态和返回行数"""
+    span_name = f'fetch.request.{endpoint}'
+    
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            with span(span_name):
+                result = func(*args, **kwargs)
+            status = 'ok'
+        finally:
+            elapsed = time.perf_counter() - started
+            _fetch_clock.seconds = _waited_seconds() + elapsed
+            FETCH_SECONDS.labels(source, endpoint).observe(elapsed)
+            FETCH_REQUESTS.labels(source, endpoint, status).inc()
+        if isinstance(result, pd.DataFrame):
+            FETCH_ROWS.labels(source, endpoint).inc(len(result))
+        return result
+    return call
+
+
+def _measured(operation: str):
+    """记录获取方法中请求和退避等待以外的耗时（列转换、格式整理等），分段的自身耗时即为这部分耗时"""
+    span_name = f'fetch.{operation}'
+    
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started, waited = time.perf_counter(), _waited_seconds()
+            try:
+                with span(span_name):
+                    return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started - (_waited_seconds() - waited)
+                FETCH_PROCESS_SECONDS.labels(operation).observe(max(elapsed, 0.0))
+        return wrapper
+    return decorator
+
+
+class _LazyModule:
+    """延迟导入的模块代理，首次访问属性时才真正导入"""
+    
+    def __init__(self, name: str, source: str = None):
+        """
+        Args:
+            source: 指标中的数据源名称，非空时函数调用记录请求耗时
+        """
+        self._name = name
+        self._source = source
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attr)
+        if self._source and callable(value) and not isinstance(value, type):
+            return _instrument(self._source, attr, value)
+        return value
+
+
+class _InstrumentedApi:
+    """数据源API对象代理（如 Tushare Pro），方法调用记录请求耗时"""
+    
+    def __init__(self, api, source: str):
+        self._api = api
+        self._source = source
+    
+    def __getattr__(self, attr):
+        value = getattr(self._api, attr)
+        if callable(value):
+            return _instrument(self._source, attr, value)
+        return value
+
+
+# akshare/tushare导入耗时数秒，只在真正请求数据时加载
+ak = _LazyModule('akshare', source='akshare')
+ts = _LazyModule('tushare', source='tushare')
+
 
 class StockDataFetcher:
     """股票数据获取器"""
     
+    _PRO_UNSET = object()
+    
     def __init__(self):
         self.data_source = os.getenv('DATA_SOURCE', 'akshare')
         self.tushare_token = os.getenv('TUSHARE_TOKEN', '')
-        self.pro = None
-        
-        # 初始化tushare（如果配置了token）
-        if self.tushare_token:
-            try:
-                ts.set_token(self.tushare_token)
-                self.pro = ts.pro_api()
-                logger.info("Tushare API初始化成功")
-            except Exception as e:
-                logger.warning(f"Tushare API初始化失败: {e}")
+        self._pro = self._PRO_UNSET
         
         logger.info(f"初始化数据获取器，数据源: {self.data_source}")
     
+    @property
+    def pro(self):
+        """Tushare Pro API（首次使用时初始化）"""
+        if self._pro is self._PRO_UNSET:
+            self._pro = None
+            
+            # 初始化tushare（如果配置了token）
+            if self.tushare_token:
+                try:
+                    ts.set_token(self.tushare_token)
+                    self._pro = _InstrumentedApi(ts.pro_api(), 'tushare')
+                    logger.info("Tushare API初始化成功")
+                except Exception as e:
+                    logger.warning(f"Tushare API初始化失败: {e}")
+        
+        return self._pro
+    
+    @staticmethod
+    def _retry_backoff(operation: str, attempt: int):
+        """重试前指数退避等待（计入重试次数指标）"""
+        FETCH_RETRIES.labels(operation).inc()
+        delay = 2 ** attempt
+        with span('fetch.backoff'):
+            time.sleep(delay)
+        _fetch_clock.seconds = _waited_seconds() + delay
+    
+    @_measured('stock_list')
     def get_stock_list(self) -> pd.DataFrame:
         """获取股票列表"""
         try:
@@ -146,8 +266,9 @@ class StockDataFetcher:
             logger.error(f"tushare旧版API获取股票列表失败: {e}")
             raise
     
-    def _get_daily_data_akshare(self, symbol: str, start_date: str, end_date: str, max_retries: int) -> pd.DataFrame:
-        """使用akshare获取日线数据（降级方案）"""
+    def _get_daily_data_akshare(self, symbol: str, start_date: str, end_date: str, max_retries: int,
+                                adjust: str = '') -> pd.DataFrame:
+        """使用akshare获取日线数据"""
         try:
             # 重试机制
             for attempt in range(max_retries):
@@ -158,13 +279,13 @@ class StockDataFetcher:
                         period="daily",
                         start_date=start_date,
                         end_date=end_date,
-                        adjust="qfq"  # 前复权
+                        adjust=adjust  # 默认不复权，复权价格由复权因子在读取时计算
                     )
                     break  # 成功则跳出重试循环
                 except Exception as e:
                     if attempt < max_retries - 1:
                         logger.warning(f"akshare获取股票 {symbol} 日线数据失败，第 {attempt + 1} 次重试: {e}")
-                        time.sleep(2 ** attempt)  # 指数退避
+                        self._retry_backoff('daily', attempt)
                         continue
                     else:
                         raise e
@@ -244,7 +365,7 @@ class StockDataFetcher:
                 except Exception as e:
                     if attempt < max_retries - 1:
                         logger.warning(f"tushare旧版API获取股票 {symbol} 日线数据失败，第 {attempt + 1} 次重试: {e}")
-                        time.sleep(2 ** attempt)  # 指数退避
+                        self._retry_backoff('daily', attempt)
                         continue
                     else:
                         raise e
@@ -290,41 +411,33 @@ class StockDataFetcher:
             logger.error(f"tushare旧版API获取股票 {symbol} 日线数据失败: {e}")
             return pd.DataFrame()
     
-    def get_daily_data(self, symbol: str, start_date: str = None, end_date: str = None, max_retries: int = 3) -> pd.DataFrame:
-        """获取股票日线数据"""
+    @_measured('daily')
+    def get_daily_data(self, symbol: str, start_date: str = None, end_date: str = None, max_retries: int = 3,
+                       adjust: str = None) -> pd.DataFrame:
+        """
+        获取股票日线数据
+        
+        Args:
+            adjust: 复权方式，默认取环境变量DAILY_ADJUST（为空表示不复权）。
+                    存储不复权价格，复权价格通过复权因子在读取时计算，除权除息不会改写历史数据
+        """
         try:
             if not start_date:
                 start_date = (datetime.now() - timedelta(days=30)).strftime('%Y%m%d')
             if not end_date:
                 end_date = datetime.now().strftime('%Y%m%d')
+            if adjust is None:
+                adjust = os.getenv('DAILY_ADJUST', '')
             
             logger.info(f"获取股票 {symbol} 日线数据: {start_date} - {end_date}")
             
             if self.data_source == 'akshare':
-                # 重试机制
-                for attempt in range(max_retries):
-                    try:
-                        # 获取日线数据
-                        daily_data = ak.stock_zh_a_hist(
-                            symbol=symbol,
-                            period="daily",
-                            start_date=start_date,
-                            end_date=end_date,
-                            adjust="qfq"  # 前复权
-                        )
-                        break  # 成功则跳出重试循环
-                    except Exception as e:
-                        if attempt < max_retries - 1:
-                            logger.warning(f"获取股票 {symbol} 日线数据失败，第 {attempt + 1} 次重试: {e}")
-                            time.sleep(2 ** attempt)  # 指数退避
-                            continue
-                        else:
-                            raise e
+                return self._get_daily_data_akshare(symbol, start_date, end_date, max_retries, adjust)
                             
             elif self.data_source == 'tushare':
                 if not self.pro:
                     logger.warning("Tushare API未初始化，降级使用akshare获取日线数据")
-                    return self._get_daily_data_akshare(symbol, start_date, end_date, max_retries)
+                    return self._get_daily_data_akshare(symbol, start_date, end_date, max_retries, adjust)
                 
                 # 重试机制
                 for attempt in range(max_retries):
@@ -349,7 +462,7 @@ class StockDataFetcher:
                     except Exception as e:
                         if attempt < max_retries - 1:
                             logger.warning(f"获取股票 {symbol} 日线数据失败，第 {attempt + 1} 次重试: {e}")
-                            time.sleep(2 ** attempt)  # 指数退避
+                            self._retry_backoff('daily', attempt)
                             continue
                         else:
                             logger.warning(f"Tushare Pro API获取股票 {symbol} 日线数据失败，尝试旧版API: {e}")
@@ -357,7 +470,7 @@ class StockDataFetcher:
                                 return self._get_daily_data_tushare_old(symbol, start_date, end_date, max_retries)
                             except Exception as e2:
                                 logger.warning(f"Tushare旧版API也失败，降级使用akshare: {e2}")
-                                return self._get_daily_data_akshare(symbol, start_date, end_date, max_retries)
+                                return self._get_daily_data_akshare(symbol, start_date, end_date, max_retries, adjust)
                 
                 if daily_data.empty:
                     logger.warning(f"股票 {symbol} 没有数据")
@@ -436,6 +549,161 @@ class StockDataFetcher:
             logger.error(f"获取股票 {symbol} 日线数据失败: {e}")
             return pd.DataFrame()
     
+    @_measured('adj_factor')
+    def get_adj_factors(self, symbol: str = None, start_date: str = None, end_date: str = None,
+                        trade_date: str = None, max_retries: int = 3) -> pd.DataFrame:
+        """
+        获取后复权因子
+        
+        Args:
+            symbol: 股票代码，tushare数据源下为空时配合trade_date获取全市场当日因子
+            start_date: 开始日期 (YYYYMMDD)
+            end_date: 结束日期 (YYYYMMDD)
+            trade_date: 单个交易日 (YYYYMMDD)
+        
+        Returns:
+            包含 symbol, trade_date, adj_factor 列的DataFrame
+        """
+        columns = ['symbol', 'trade_date', 'adj_factor']
+        try:
+            if trade_date:
+                start_date = end_date = trade_date
+            
+            for attempt in range(max_retries):
+                try:
+                    if self.data_source == 'tushare' and self.pro:
+                        ts_code = self._to_ts_code(symbol) if symbol else ''
+                        factors = self.pro.adj_factor(
+                            ts_code=ts_code,
+                            trade_date=trade_date or '',
+                            start_date='' if trade_date else (start_date or ''),
+                            end_date='' if trade_date else (end_date or '')
+                        )
+                        factors['symbol'] = factors['ts_code'].str[:6]
+                    else:
+                        if not symbol:
+                            raise ValueError("akshare数据源需要指定股票代码")
+                        # akshare只返回发生除权除息的日期，数据量很小
+                        factors = ak.stock_zh_a_daily(
+                            symbol=f"{self._exchange_prefix(symbol)}{symbol}",
+                            adjust="hfq-factor"
+                        )
+                        factors = factors.reset_index().rename(columns={'date': 'trade_date', 'hfq_factor': 'adj_factor'})
+                        factors['symbol'] = symbol
+                    break  # 成功则跳出重试循环
+                except Exception as e:
+                    if attempt < max_retries - 1:
+                        logger.warning(f"获取股票 {symbol} 复权因子失败，第 {attempt + 1} 次重试: {e}")
+                        self._retry_backoff('adj_factor', attempt)
+                        continue
+                    else:
+                        raise e
+            
+            if factors.empty:
+                return pd.DataFrame(columns=columns)
+            
+            factors['trade_date'] = pd.to_datetime(factors['trade_date']).dt.date
+            factors['adj_factor'] = pd.to_numeric(factors['adj_factor'], errors='coerce')
+            factors = factors[columns].dropna()
+            
+            if start_date:
+                factors = factors[factors['trade_date'] >= pd.to_datetime(start_date).date()]
+            if end_date:
+                factors = factors[factors['trade_date'] <= pd.to_datetime(end_date).date()]
+            
+            logger.info(f"成功获取复权因子 {len(factors)} 条")
+            return factors.reset_index(drop=True)
+            
+        except Exception as e:
+            logger.error(f"获取股票 {symbol} 复权因子失败: {e}")
+            return pd.DataFrame(columns=columns)
+    
+    def get_trade_calendar(self) -> List[date]:
+        """
+        获取交易日历（新浪接口，包含历史和当年已公布的交易日）
+        
+        Returns:
+            升序的交易日列表，获取失败时为空列表
+        """
+        try:
+            calendar = ak.tool_trade_date_hist_sina()
+            trade_dates = sorted(pd.to_datetime(calendar['trade_date']).dt.date.unique())
+            logger.info(f"成功获取交易日历 {len(trade_dates)} 天")
+            return trade_dates
+        except Exception as e:
+            logger.warning(f"获取交易日历失败: {e}")
+            return []
+    
+    def get_delisted_stocks(self) -> pd.DataFrame:
+        """
+        获取已退市股票
+        
+        Returns:
+            包含 symbol, name, market, list_date, delist_date 列的DataFrame
+        """
+        columns = ['symbol', 'name', 'market', 'list_date', 'delist_date']
+        try:
+            if self.data_source == 'tushare' and self.pro:
+                delisted = self.pro.stock_basic(exchange='', list_status='D',
+                                                fields='symbol,name,list_date,delist_date')
+            else:
+                sh = ak.stock_info_sh_delist(symbol="全部").rename(columns={
+                    '公司代码': 'symbol', '公司简称': 'name', '上市日期': 'list_date', '暂停上市日期': 'delist_date'})
+                sz = ak.stock_info_sz_delist(symbol="终止上市公司").rename(columns={
+                    '证券代码': 'symbol', '证券简称': 'name', '上市日期': 'list_date', '终止上市日期': 'delist_date'})
+                delisted = pd.concat([sh, sz], ignore_index=True)
+            
+            delisted['symbol'] = delisted['symbol'].astype(str).str.zfill(6)
+            delisted['market'] = delisted['symbol'].apply(
+                lambda x: 'SH' if x.startswith(('60', '68', '90')) else 'SZ'
+            )
+            delisted['list_date'] = pd.to_datetime(delisted['list_date'], errors='coerce').dt.date
+            delisted['delist_date'] = pd.to_datetime(delisted['delist_date'], errors='coerce').dt.date
+            delisted = delisted.dropna(subset=['delist_date']).drop_duplicates('symbol')
+            
+            logger.info(f"成功获取退市股票 {len(delisted)} 只")
+            return delisted[columns].reset_index(drop=True)
+            
+        except Exception as e:
+            logger.warning(f"获取退市股票失败: {e}")
+            return pd.DataFrame(columns=columns)
+
+    def get_index_constituents(self, index_code: str) -> List[str]:
+        """
+        获取指数成分股（中证指数公司接口）
+
+        Args:
+            index_code: 指数代码，如 000300（沪深300）
+
+        Returns:
+            成分股代码列表，获取失败时为空列表
+        """
+        try:
+            constituents = ak.index_stock_cons_csindex(symbol=index_code)
+            symbols = constituents['成分券代码'].astype(str).str.zfill(6).unique().tolist()
+            logger.info(f"成功获取指数 {index_code} 成分股 {len(symbols)} 只")
+            return symbols
+        except Exception as e:
+            logger.warning(f"获取指数 {index_code} 成分股失败: {e}")
+            return []
+
+    @staticmethod
+    def _exchange_prefix(symbol: str) -> str:
+        """股票代码对应的交易所前缀（akshare新浪接口格式）"""
+        if symbol.startswith(('60', '68', '90')):
+            return 'sh'
+        if symbol.startswith(('4', '8', '92')):
+            return 'bj'
+        return 'sz'
+    
+    @staticmethod
+    def _to_ts_code(symbol: str) -> str:
+        """股票代码转换为tushare格式"""
+        if len(symbol) != 6:
+            return symbol
+        return f"{symbol}.{StockDataFetcher._exchange_prefix(symbol).upper()}"
+    
+    @_measured('transaction')
     def get_transaction_detail(self, symbol: str, trade_date: str = None) -> pd.DataFrame:
         """获取股票成交明细"""
         try:
@@ -2,41 +2,167 @@
 """
 数据存储模块
 """
+import threading
+import numpy as np
 import pandas as pd
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional
+from sqlalchemy import select, func, and_, or_, tuple_
 from sqlalchemy.orm import Session
 from loguru import logger
-from database import db_manager, StockInfo, StockDailyData, StockTransactionDetail, SystemLog
+from database import (
+    db_manager, StockInfo, StockDailyData, StockTransactionDetail, StockAdjFactor, StockMinuteBar,
+    StockOrderFlow, StockDailyFactor, DataQuarantine, JobRun
+)
+from src.log_sink import get_log_sink
+from src.price_adjust import compress_factors, adjust_prices
+from src.data_validator import DataValidator
+from src.tick_archive import TickArchive
+from src.order_flow import OrderFlowAggregator, ORDER_FLOW_COLUMNS
+from src.metrics import get_registry
+from src.tracing import span, traced
+
+_metrics = get_registry()
+STORE_ROWS = _metrics.counter('store_rows_written', '写入数据库的行数', ['table'])
+STORE_COMMIT_SECONDS = _metrics.histogram('store_commit_seconds', '写入事务提交耗时（秒）', ['table'])
 
 
 class DataStorage:
     """数据存储器"""
     
+    DAILY_COLUMNS = ['symbol', 'trade_date', 'open_price', 'high_price', 'low_price',
+                     'close_price', 'volume', 'amount', 'pct_change']
+    TRANSACTION_COLUMNS = ['symbol', 'trade_date', 'trade_time', 'price',
+                           'volume', 'amount', 'direction']
+    MINUTE_BAR_COLUMNS = ['symbol', 'trade_date', 'bar_time', 'freq', 'open_price', 'high_price',
+                          'low_price', 'close_price', 'volume', 'amount', 'vwap',
+                          'buy_volume', 'sell_volume', 'tick_count']
+    
+    # 按 (股票代码, 交易日期) 删除或锁定已有记录时每条语句的键数
+    KEY_CHUNK_SIZE = 500
+    
     def __init__(self):
         self.db_manager = db_manager
+        self.validator = DataValidator()
+        self.tick_archive = TickArchive(db_manager=self.db_manager)
+        self.order_flow = OrderFlowAggregator(loader=self._load_order_flow_states)
+        # 同一进程内按顺序执行 水位筛选 -> 提交 -> 更新内存状态
+        self._tick_lock = threading.Lock()
+        self._list_dates = None
+        self._first_dates = None
         logger.info("数据存储器初始化完成")
     
+    @staticmethod
+    def _to_records(data: pd.DataFrame, columns: List[str]) -> List[Dict]:
+        """DataFrame转换为批量插入用的记录列表（NaN转换为NULL）"""
+        with span('store.to_records'):
+            frame = data[columns]
+            frame = frame.astype(object).where(frame.notna(), None)
+            return frame.to_dict('records')
+    
+    @staticmethod
+    def _commit(session: Session, written: Dict[str, int]):
+        """
+        提交写入事务，记录提交耗时和各表写入行数
+        
+        Args:
+            written: {表名: 行数}，第一个表作为提交耗时的标签
+        """
+        with span('store.commit'), STORE_COMMIT_SECONDS.labels(next(iter(written))).time():
+            session.commit()
+        for table, rows in written.items():
+            if rows:
+                STORE_ROWS.labels(table).inc(rows)
+    
+    def _delete_existing(self, session: Session, model, data: pd.DataFrame) -> int:
+        """
+        删除与待写入数据 (股票代码, 交易日期) 相同的已有记录
+        
+        与插入在同一事务中执行：重新导入已保存的日期（补缺口合并的区间、断点续传重跑的单元、
+        重跑的收盘后任务）时替换原有记录，不会产生重复的K线
+        """
+        keys = pd.DataFrame({'symbol': data['symbol'].to_numpy(),
+                             'trade_date': pd.to_datetime(data['trade_date']).dt.date.to_numpy()})
+        keys = list(keys.drop_duplicates().itertuples(index=False, name=None))
+        table = model.__table__
+        deleted = 0
+        for start in range(0, len(keys), self.KEY_CHUNK_SIZE):
+            result = session.execute(table.delete().where(
+                tuple_(table.c.symbol, table.c.trade_date).in_(keys[start:start + self.KEY_CHUNK_SIZE])))
+            deleted += result.rowcount or 0
+        return deleted
+    
+    def _quarantine_records(self, rejected: pd.DataFrame, source_table: str, columns: List[str]) -> List[Dict]:
+        """校验不合格的记录转换为隔离表记录，原始字段序列化为JSON"""
+        quarantine = pd.DataFrame({
+            'source_table': source_table,
+            'symbol': rejected['symbol'].to_numpy(),
+            'trade_date': pd.to_datetime(rejected['trade_date'], errors='coerce').dt.date.to_numpy(),
+            'reasons': rejected['reasons'].str.slice(0, 200).to_numpy(),
+            'payload': rejected[columns].to_json(
+                orient='records', lines=True, force_ascii=False, date_format='iso'
+            ).splitlines(),
+        })
+        return self._to_records(quarantine, list(quarantine.columns))
+    
+    def _get_list_dates(self) -> pd.Series:
+        """读取股票上市日期（以股票代码为索引），用于新股涨跌幅豁免"""
+        if self._list_dates is None:
+            try:
+                stmt = select(StockInfo.symbol, StockInfo.list_date).where(StockInfo.list_date.isnot(None))
+                data = pd.read_sql(stmt, self.db_manager.engine)
+                self._list_dates = data.drop_duplicates('symbol').set_index('symbol')['list_date']
+            except Exception as e:
+                logger.warning(f"读取股票上市日期失败: {e}")
+                return pd.Series(dtype=object)
+        return self._list_dates
+    
+    def _get_first_dates(self) -> pd.Series:
+        """读取每只股票已保存日线的最早交易日（以股票代码为索引），上市日期未知时用于新股涨跌幅豁免"""
+        if self._first_dates is None:
+            try:
+                stmt = select(StockDailyData.symbol, func.min(StockDailyData.trade_date).label('first_date')) \
+                    .group_by(StockDailyData.symbol)
+                data = pd.read_sql(stmt, self.db_manager.engine)
+                self._first_dates = pd.to_datetime(data.set_index('symbol')['first_date'])
+            except Exception as e:
+                logger.warning(f"读取已保存日线的最早交易日失败: {e}")
+                return pd.Series(dtype='datetime64[ns]')
+        return self._first_dates
+    
+    def _update_first_dates(self, daily_data: pd.DataFrame):
+        """保存日线后把本批数据中更早的交易日计入缓存"""
+        if self._first_dates is None or daily_data.empty:
+            return
+        batch = pd.to_datetime(daily_data['trade_date']).groupby(daily_data['symbol']).min()
+        self._first_dates = pd.concat([self._first_dates, batch]).groupby(level=0).min()
+    
+    @traced('store.save_stock_info')
     def save_stock_info(self, stock_data: pd.DataFrame) -> bool:
-        """保存股票基本信息"""
+        """保存股票基本信息（已退市的股票保留，当前列表中重新出现的退市记录被替换）"""
         try:
             session = self.db_manager.get_session()
             
-            # 清空现有数据
-            session.query(StockInfo).delete()
+            # 清空现有的上市股票和本次重新提供的退市股票
+            incoming = set(stock_data['symbol'])
+            replaced = [row.id for row in session.query(StockInfo.id, StockInfo.symbol)
+                        .filter(StockInfo.delist_date.isnot(None)) if row.symbol in incoming]
+            session.query(StockInfo).filter(
+                or_(StockInfo.delist_date.is_(None), StockInfo.id.in_(replaced))
+            ).delete(synchronize_session=False)
             
-            # 批量插入新数据
-            stock_records = []
-            for _, row in stock_data.iterrows():
-                stock_record = StockInfo(
-                    symbol=row['symbol'],
-                    name=row['name'],
-                    market=row['market']
-                )
-                stock_records.append(stock_record)
-            
-            session.bulk_save_objects(stock_records)
-            session.commit()
+            # 批量插入新数据（tushare数据源附带行业和上市日期，退市列表附带退市日期）
+            stock_data = stock_data.copy()
+            for col in ('list_date', 'delist_date'):
+                if col in stock_data.columns:
+                    stock_data[col] = pd.to_datetime(stock_data[col], errors='coerce').dt.date
+            columns = ['symbol', 'name', 'market'] + [
+                col for col in ('industry', 'list_date', 'delist_date') if col in stock_data.columns
+            ]
+            stock_records = self._to_records(stock_data, columns)
+            self.db_manager.bulk_insert(session, StockInfo, stock_records)
+            self._commit(session, {StockInfo.__tablename__: len(stock_records)})
+            self._list_dates = None
             
             logger.info(f"成功保存股票基本信息 {len(stock_records)} 条")
             return True
@@ -48,8 +174,9 @@ class DataStorage:
         finally:
             session.close()
     
+    @traced('store.save_daily_data')
     def save_daily_data(self, daily_data: pd.DataFrame) -> bool:
-        """保存日线数据"""
+        """保存日线数据（入库前校验，不合格记录写入隔离表；已保存的股票和日期被替换）"""
         try:
             if daily_data.empty:
                 logger.warning("日线数据为空，跳过保存")
@@ -57,26 +184,22 @@ class DataStorage:
             
             session = self.db_manager.get_session()
             
-            # 批量插入数据
-            daily_records = []
-            for _, row in daily_data.iterrows():
-                daily_record = StockDailyData(
-                    symbol=row['symbol'],
-                    trade_date=row['trade_date'],
-                    open_price=row['open_price'],
-                    high_price=row['high_price'],
-                    low_price=row['low_price'],
-                    close_price=row['close_price'],
-                    volume=row['volume'],
-                    amount=row['amount'],
-                    pct_change=row['pct_change']
-                )
-                daily_records.append(daily_record)
-            
-            session.bulk_save_objects(daily_records)
-            session.commit()
+            with span('store.validate'):
+                daily_data, rejected = self.validator.validate_daily(
+                    daily_data, self._get_list_dates(), self._get_first_dates())
             
-            logger.info(f"成功保存日线数据 {len(daily_records)} 条")
+            # 替换已保存的同一股票同一交易日的记录后批量插入
+            daily_records = self._to_records(daily_data, self.DAILY_COLUMNS)
+            replaced = self._delete_existing(session, StockDailyData, daily_data) if daily_records else 0
+            self.db_manager.bulk_insert(session, StockDailyData, daily_records)
+            if not rejected.empty:
+                self.db_manager.bulk_insert(session, DataQuarantine, self._quarantine_records(
+                    rejected, StockDailyData.__tablename__, self.DAILY_COLUMNS))
+            self._commit(session, {StockDailyData.__tablename__: len(daily_records),
+                                   DataQuarantine.__tablename__: len(rejected)})
+            self._update_first_dates(daily_data)
+            
+            logger.info(f"成功保存日线数据 {len(daily_records)} 条（替换已有 {replaced} 条），隔离 {len(rejected)} 条")
             return True
             
         except Exception as e:
@@ -86,8 +209,16 @@ class DataStorage:
         finally:
             session.close()
     
+    @traced('store.save_transaction_details')
     def save_transaction_details(self, transaction_data: Dict[str, pd.DataFrame]) -> bool:
-        """保存成交明细数据"""
+        """
+        保存成交明细数据
+        
+        盘中接口每次返回当日截至当前的全部成交，按资金流汇总的已处理水位（最后成交时间及该秒已处理笔数）
+        只写入新成交，重复轮询和收盘后补采不会重复写入同一笔成交。
+        水位在写入事务中从 stock_order_flow 锁定读取（见 _lock_order_flow_states），
+        同时保存同一 股票 × 交易日 的其他线程和主机等待本事务提交后再按新水位筛选
+        """
         try:
             if not transaction_data:
                 logger.warning("成交明细数据为空，跳过保存")
@@ -95,39 +226,404 @@ class DataStorage:
             
             session = self.db_manager.get_session()
             
-            total_records = 0
+            total_rejected = 0
+            accepted = []
             for symbol, data in transaction_data.items():
                 if data.empty:
                     continue
                 
-                # 批量插入数据
-                detail_records = []
-                for _, row in data.iterrows():
-                    detail_record = StockTransactionDetail(
-                        symbol=row['symbol'],
-                        trade_date=row['trade_date'],
-                        trade_time=row['trade_time'],
-                        price=row['price'],
-                        volume=row['volume'],
-                        amount=row['amount'],
-                        direction=row['direction']
-                    )
-                    detail_records.append(detail_record)
+                with span('store.validate'):
+                    data, rejected = self.validator.validate_transactions(data)
+                accepted.append(data)
                 
-                session.bulk_save_objects(detail_records)
-                total_records += len(detail_records)
+                if not rejected.empty:
+                    self.db_manager.bulk_insert(session, DataQuarantine, self._quarantine_records(
+                        rejected, StockTransactionDetail.__tablename__, self.TRANSACTION_COLUMNS))
+                    total_rejected += len(rejected)
             
-            session.commit()
-            logger.info(f"成功保存成交明细数据 {total_records} 条")
+            # 成交明细、资金流汇总在同一事务中写入，水位随汇总表一起提交
+            received, flows = 0, None
+            detail_records = []
+            with self._tick_lock:
+                if accepted:
+                    ticks = pd.concat(accepted, ignore_index=True)
+                    received = len(ticks)
+                    saved = self._lock_order_flow_states(session, ticks)
+                    new_ticks, flows = self.order_flow.ingest(ticks, saved)
+                    detail_records = self._to_records(new_ticks, self.TRANSACTION_COLUMNS)
+                    self.db_manager.bulk_insert(session, StockTransactionDetail, detail_records)
+                if flows is not None and not flows.empty:
+                    self.db_manager.upsert(session, StockOrderFlow, self._to_records(flows, ORDER_FLOW_COLUMNS),
+                                           index_elements=['symbol', 'trade_date'])
+                
+                self._commit(session, {StockTransactionDetail.__tablename__: len(detail_records),
+                                       DataQuarantine.__tablename__: total_rejected,
+                                       StockOrderFlow.__tablename__: 0 if flows is None else len(flows)})
+                if flows is not None:
+                    self.order_flow.remember(flows)
+            logger.info(f"成功保存成交明细数据 {len(detail_records)} 条（跳过已保存 {received - len(detail_records)} 条），"
+                        f"隔离 {total_rejected} 条")
             return True
             
         except Exception as e:
             logger.error(f"保存成交明细数据失败: {e}")
             session.rollback()
+            self.order_flow.forget()
+            return False
+        finally:
+            session.close()
+    
+    def _lock_order_flow_states(self, session: Session, ticks: pd.DataFrame) -> pd.DataFrame:
+        """
+        在写入事务中锁定并读取本批成交涉及的资金流汇总行，作为筛选新成交的水位
+        
+        没有汇总行的 股票 × 交易日 先插入占位行（提交前会被汇总覆盖），
+        MySQL 用 SELECT ... FOR UPDATE 锁定，SQLite 在插入占位行时已取得写锁
+        """
+        keys = pd.DataFrame({'symbol': ticks['symbol'].to_numpy(),
+                             'trade_date': pd.to_datetime(ticks['trade_time']).dt.date.to_numpy()}).drop_duplicates()
+        self.db_manager.insert_ignore(session, StockOrderFlow, keys.to_dict('records'))
+        
+        columns = [getattr(StockOrderFlow, col) for col in ORDER_FLOW_COLUMNS]
+        frames = []
+        for start in range(0, len(keys), self.KEY_CHUNK_SIZE):
+            chunk = list(keys.iloc[start:start + self.KEY_CHUNK_SIZE].itertuples(index=False, name=None))
+            stmt = select(*columns).where(tuple_(StockOrderFlow.symbol, StockOrderFlow.trade_date).in_(chunk)) \
+                .with_for_update()
+            frames.append(pd.DataFrame(session.execute(stmt).mappings().all(), columns=ORDER_FLOW_COLUMNS))
+        return pd.concat(frames, ignore_index=True)
+    
+    def _load_order_flow_states(self, symbols: List[str], trade_dates: List[date]) -> pd.DataFrame:
+        """读取资金流汇总状态（资金流汇总器进程重启后恢复用）"""
+        columns = [getattr(StockOrderFlow, col) for col in ORDER_FLOW_COLUMNS]
+        stmt = select(*columns).where(StockOrderFlow.symbol.in_(symbols),
+                                      StockOrderFlow.trade_date.in_(trade_dates))
+        return pd.read_sql(stmt, self.db_manager.engine)
+    
+    def get_order_flow(self, symbols: List[str] = None, start_date: date = None,
+                       end_date: date = None) -> pd.DataFrame:
+        """读取日内资金流汇总"""
+        try:
+            stmt = select(StockOrderFlow.__table__)
+            if symbols:
+                stmt = stmt.where(StockOrderFlow.symbol.in_(symbols))
+            if start_date:
+                stmt = stmt.where(StockOrderFlow.trade_date >= start_date)
+            if end_date:
+                stmt = stmt.where(StockOrderFlow.trade_date <= end_date)
+            return pd.read_sql(stmt.order_by(StockOrderFlow.symbol, StockOrderFlow.trade_date),
+                               self.db_manager.engine)
+        except Exception as e:
+            logger.error(f"读取资金流汇总失败: {e}")
+            return pd.DataFrame()
+    
+    def get_transaction_details(self, symbols: List[str] = None, start_date: date = None,
+                                end_date: date = None) -> pd.DataFrame:
+        """
+        读取成交明细（已归档的月份从归档文件读取，与数据库中的记录合并）
+        
+        Args:
+            symbols: 股票代码列表，None表示全部
+            start_date: 开始日期
+            end_date: 结束日期
+        """
+        try:
+            columns = [getattr(StockTransactionDetail, col) for col in self.TRANSACTION_COLUMNS]
+            stmt = select(*columns)
+            if symbols:
+                stmt = stmt.where(StockTransactionDetail.symbol.in_(symbols))
+            if start_date:
+                stmt = stmt.where(StockTransactionDetail.trade_date >= start_date)
+            if end_date:
+                stmt = stmt.where(StockTransactionDetail.trade_date <= end_date)
+            
+            recent = pd.read_sql(stmt, self.db_manager.engine)
+            archived = self.tick_archive.read(symbols, start_date, end_date)
+            
+            frames = [frame for frame in (archived, recent) if not frame.empty]
+            if not frames:
+                return pd.DataFrame(columns=self.TRANSACTION_COLUMNS)
+            
+            details = pd.concat(frames, ignore_index=True)
+            details['trade_time'] = pd.to_datetime(details['trade_time'])
+            return details.sort_values(['symbol', 'trade_time'], kind='mergesort').reset_index(drop=True)
+            
+        except Exception as e:
+            logger.error(f"读取成交明细失败: {e}")
+            return pd.DataFrame(columns=self.TRANSACTION_COLUMNS)
+    
+    @traced('store.save_adj_factors')
+    def save_adj_factors(self, factor_data: pd.DataFrame) -> bool:
+        """保存复权因子（压缩为因子变化日期，去掉与已保存因子相同的记录后去重更新）"""
+        try:
+            if factor_data.empty:
+                logger.warning("复权因子数据为空，跳过保存")
+                return True
+            
+            session = self.db_manager.get_session()
+            
+            factors = compress_factors(factor_data)
+            unchanged = self._unchanged_factor_mask(session, factors)
+            factor_records = self._to_records(factors[~unchanged], ['symbol', 'trade_date', 'adj_factor'])
+            self.db_manager.upsert(session, StockAdjFactor, factor_records,
+                                   index_elements=['symbol', 'trade_date'])
+            self._commit(session, {StockAdjFactor.__tablename__: len(factor_records)})
+            
+            logger.info(f"成功保存复权因子 {len(factor_records)} 条（跳过与已保存因子相同的 {int(unchanged.sum())} 条）")
+            return True
+            
+        except Exception as e:
+            logger.error(f"保存复权因子失败: {e}")
+            session.rollback()
+            return False
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _unchanged_factor_mask(session: Session, factors: pd.DataFrame) -> np.ndarray:
+        """
+        与该日之前最近一条已保存因子相同的记录（如每日获取的全市场当日因子中没有除权除息的股票）
+        
+        压缩后的因子每只股票只有第一条可能与已保存的因子相同，后续记录都与前一条不同
+        """
+        unchanged = np.zeros(len(factors), dtype=bool)
+        if factors.empty:
+            return unchanged
+        
+        first = ~factors['symbol'].duplicated().to_numpy()
+        heads = pd.DataFrame({'symbol': factors['symbol'].to_numpy()[first],
+                              'trade_date': pd.to_datetime(factors['trade_date']).to_numpy()[first],
+                              'adj_factor': factors['adj_factor'].to_numpy(dtype=np.float64)[first],
+                              '_pos': np.flatnonzero(first)})
+        stmt = select(StockAdjFactor.symbol, StockAdjFactor.trade_date, StockAdjFactor.adj_factor.label('stored')) \
+            .where(StockAdjFactor.symbol.in_(heads['symbol'].tolist()),
+                   StockAdjFactor.trade_date < heads['trade_date'].max().date())
+        stored = pd.DataFrame(session.execute(stmt).all(), columns=['symbol', 'trade_date', 'stored'])
+        if stored.empty:
+            return unchanged
+        
+        stored['trade_date'] = pd.to_datetime(stored['trade_date'])
+        matched = pd.merge_asof(heads.sort_values('trade_date'), stored.sort_values('trade_date'),
+                                on='trade_date', by='symbol', allow_exact_matches=False)
+        same = np.isclose(matched['adj_factor'].to_numpy(), matched['stored'].to_numpy(dtype=np.float64),
+                          rtol=1e-9, atol=0)
+        unchanged[matched['_pos'].to_numpy()[same]] = True
+        return unchanged
+    
+    def get_db_time(self) -> datetime:
+        """数据库服务器的当前时间（与 created_at 默认值使用同一时钟）"""
+        with self.db_manager.engine.connect() as conn:
+            return conn.execute(select(func.now())).scalar()
+    
+    def get_daily_written_since(self, since: datetime, start_date: date, end_date: date) -> Optional[date]:
+        """since 之后写入（含重新导入）的日线中，交易日期在范围内的最早交易日期，没有时为None"""
+        # created_at 精度为秒，与 since 同一秒写入的记录也算在内（SQLite 按字符串比较，不能用 >= since）
+        stmt = select(func.min(StockDailyData.trade_date)).where(
+            StockDailyData.created_at > since - timedelta(seconds=1),
+            StockDailyData.trade_date >= start_date,
+            StockDailyData.trade_date <= end_date)
+        with self.db_manager.engine.connect() as conn:
+            earliest = conn.execute(stmt).scalar()
+        return pd.Timestamp(earliest).date() if earliest is not None else None
+    
+    def get_adj_factors(self, symbols: List[str] = None) -> pd.DataFrame:
+        """读取复权因子"""
+        try:
+            stmt = select(StockAdjFactor.symbol, StockAdjFactor.trade_date, StockAdjFactor.adj_factor)
+            if symbols:
+                stmt = stmt.where(StockAdjFactor.symbol.in_(symbols))
+            return pd.read_sql(stmt.order_by(StockAdjFactor.symbol, StockAdjFactor.trade_date),
+                               self.db_manager.engine)
+        except Exception as e:
+            logger.error(f"读取复权因子失败: {e}")
+            return pd.DataFrame(columns=['symbol', 'trade_date', 'adj_factor'])
+    
+    def get_daily_bars(self, symbols: List[str] = None, start_date: date = None, end_date: date = None,
+                       adjust: str = None) -> pd.DataFrame:
+        """
+        读取日线数据
+        
+        Args:
+            symbols: 股票代码列表，None表示全部
+            start_date: 开始日期
+            end_date: 结束日期
+            adjust: None为不复权，qfq为前复权，hfq为后复权
+        """
+        try:
+            columns = [getattr(StockDailyData, col) for col in self.DAILY_COLUMNS]
+            stmt = select(*columns)
+            if symbols:
+                stmt = stmt.where(StockDailyData.symbol.in_(symbols))
+            if start_date:
+                stmt = stmt.where(StockDailyData.trade_date >= start_date)
+            if end_date:
+                stmt = stmt.where(StockDailyData.trade_date <= end_date)
+            
+            bars = pd.read_sql(stmt.order_by(StockDailyData.symbol, StockDailyData.trade_date),
+                               self.db_manager.engine)
+            
+            if adjust and not bars.empty:
+                factors = self.get_adj_factors(symbols)
+                bars = adjust_prices(bars, factors, how=adjust)
+            return bars
+            
+        except Exception as e:
+            logger.error(f"读取日线数据失败: {e}")
+            return pd.DataFrame(columns=self.DAILY_COLUMNS)
+    
+    def get_stock_listing(self, symbols: List[str] = None) -> pd.DataFrame:
+        """读取股票的上市和退市日期（symbol, list_date, delist_date）"""
+        try:
+            stmt = select(StockInfo.symbol, StockInfo.list_date, StockInfo.delist_date)
+            if symbols:
+                stmt = stmt.where(StockInfo.symbol.in_(symbols))
+            listing = pd.read_sql(stmt, self.db_manager.engine)
+            return listing.drop_duplicates('symbol').reset_index(drop=True)
+        except Exception as e:
+            logger.error(f"读取股票上市日期失败: {e}")
+            return pd.DataFrame(columns=['symbol', 'list_date', 'delist_date'])
+    
+    def get_data_keys(self, data_type: str, start_date: date, end_date: date,
+                      symbols: List[str] = None) -> pd.DataFrame:
+        """
+        读取已保存数据的 (symbol, trade_date)
+        
+        Args:
+            data_type: daily（日线表）或 transaction（成交明细表，不含已归档的月份）
+        """
+        table = {'daily': StockDailyData, 'transaction': StockTransactionDetail}[data_type]
+        try:
+            stmt = select(table.symbol, table.trade_date).distinct().where(
+                table.trade_date >= start_date, table.trade_date <= end_date)
+            if symbols:
+                stmt = stmt.where(table.symbol.in_(symbols))
+            return pd.read_sql(stmt, self.db_manager.engine)
+        except Exception as e:
+            logger.error(f"读取已保存数据的日期失败: {e}")
+            return pd.DataFrame(columns=['symbol', 'trade_date'])
+    
+    def get_trade_dates(self, start_date: date = None, end_date: date = None) -> List[date]:
+        """获取日线数据中的交易日历（升序）"""
+        try:
+            stmt = select(StockDailyData.trade_date).distinct()
+            if start_date:
+                stmt = stmt.where(StockDailyData.trade_date >= start_date)
+            if end_date:
+                stmt = stmt.where(StockDailyData.trade_date <= end_date)
+            
+            with self.db_manager.engine.connect() as conn:
+                return [row[0] for row in conn.execute(stmt.order_by(StockDailyData.trade_date))]
+        except Exception as e:
+            logger.error(f"获取交易日历失败: {e}")
+            return []
+    
+    def get_daily_symbols(self, start_date: date = None) -> List[str]:
+        """获取有日线数据的股票代码（升序）"""
+        try:
+            stmt = select(StockDailyData.symbol).distinct()
+            if start_date:
+                stmt = stmt.where(StockDailyData.trade_date >= start_date)
+            
+            with self.db_manager.engine.connect() as conn:
+                return [row[0] for row in conn.execute(stmt.order_by(StockDailyData.symbol))]
+        except Exception as e:
+            logger.error(f"获取股票代码失败: {e}")
+            return []
+    
+    def get_prev_close(self, trade_date: date, symbols: List[str] = None, lookback_days: int = 30) -> pd.Series:
+        """获取指定日期之前最近一个交易日的不复权收盘价（以股票代码为索引）"""
+        try:
+            window = and_(
+                StockDailyData.trade_date < trade_date,
+                StockDailyData.trade_date >= trade_date - timedelta(days=lookback_days)
+            )
+            latest = select(
+                StockDailyData.symbol,
+                func.max(StockDailyData.trade_date).label('trade_date')
+            ).where(window)
+            if symbols:
+                latest = latest.where(StockDailyData.symbol.in_(symbols))
+            latest = latest.group_by(StockDailyData.symbol).subquery()
+            
+            stmt = select(StockDailyData.symbol, StockDailyData.close_price).join(
+                latest,
+                and_(StockDailyData.symbol == latest.c.symbol, StockDailyData.trade_date == latest.c.trade_date)
+            )
+            data = pd.read_sql(stmt, self.db_manager.engine)
+            return data.drop_duplicates('symbol', keep='last').set_index('symbol')['close_price']
+            
+        except Exception as e:
+            logger.error(f"获取前收盘价失败: {e}")
+            return pd.Series(dtype=float)
+    
+    @traced('store.save_minute_bars')
+    def save_minute_bars(self, bar_data: pd.DataFrame) -> bool:
+        """保存分钟K线（按股票、周期、K线时间去重更新）"""
+        try:
+            if bar_data.empty:
+                logger.warning("分钟K线数据为空，跳过保存")
+                return True
+            
+            session = self.db_manager.get_session()
+            
+            bar_records = self._to_records(bar_data, self.MINUTE_BAR_COLUMNS)
+            self.db_manager.upsert(session, StockMinuteBar, bar_records,
+                                   index_elements=['symbol', 'freq', 'bar_time'])
+            self._commit(session, {StockMinuteBar.__tablename__: len(bar_records)})
+            
+            logger.info(f"成功保存分钟K线 {len(bar_records)} 条")
+            return True
+            
+        except Exception as e:
+            logger.error(f"保存分钟K线失败: {e}")
+            session.rollback()
+            return False
+        finally:
+            session.close()
+    
+    @traced('store.save_daily_factors')
+    def save_daily_factors(self, factor_data: pd.DataFrame) -> bool:
+        """保存日频技术指标（按股票、交易日期去重更新）"""
+        try:
+            if factor_data.empty:
+                logger.warning("技术指标数据为空，跳过保存")
+                return True
+            
+            session = self.db_manager.get_session()
+            
+            columns = [col.name for col in StockDailyFactor.__table__.columns if col.name not in ('id', 'created_at')]
+            factor_records = self._to_records(factor_data, columns)
+            self.db_manager.upsert(session, StockDailyFactor, factor_records,
+                                   index_elements=['symbol', 'trade_date'])
+            self._commit(session, {StockDailyFactor.__tablename__: len(factor_records)})
+            
+            logger.info(f"成功保存技术指标 {len(factor_records)} 条")
+            return True
+            
+        except Exception as e:
+            logger.error(f"保存技术指标失败: {e}")
+            session.rollback()
             return False
         finally:
             session.close()
     
+    def get_daily_factors(self, symbols: List[str] = None, start_date: date = None,
+                          end_date: date = None) -> pd.DataFrame:
+        """读取日频技术指标"""
+        try:
+            stmt = select(StockDailyFactor.__table__)
+            if symbols:
+                stmt = stmt.where(StockDailyFactor.symbol.in_(symbols))
+            if start_date:
+                stmt = stmt.where(StockDailyFactor.trade_date >= start_date)
+            if end_date:
+                stmt = stmt.where(StockDailyFactor.trade_date <= end_date)
+            return pd.read_sql(stmt.order_by(StockDailyFactor.symbol, StockDailyFactor.trade_date),
+                               self.db_manager.engine)
+        except Exception as e:
+            logger.error(f"读取技术指标失败: {e}")
+            return pd.DataFrame()
+    
     def get_latest_trade_date(self) -> Optional[date]:
         """获取最新的交易日期"""
         try:
@@ -166,23 +662,76 @@ class DataStorage:
             session.close()
     
     def save_system_log(self, level: str, message: str, module: str = None, function: str = None):
-        """保存系统日志到数据库"""
+        """保存系统日志到数据库（进入缓冲区，由后台线程批量写入）"""
+        try:
+            get_log_sink().emit(level, message, module, function)
+        except Exception as e:
+            logger.error(f"保存系统日志失败: {e}")
+    
+    def start_job_run(self, job_name: str, scheduled_at: datetime, started_at: datetime,
+                      status: str) -> Optional[int]:
+        """记录定时任务开始运行，返回运行记录ID"""
         try:
             session = self.db_manager.get_session()
-            
-            log_record = SystemLog(
-                level=level,
-                message=message,
-                module=module,
-                function=function
+            run = JobRun(
+                job_name=job_name,
+                status=status,
+                scheduled_at=scheduled_at,
+                started_at=started_at,
+                start_latency=(started_at - scheduled_at).total_seconds()
             )
-            
-            session.add(log_record)
+            session.add(run)
             session.commit()
-            
+            return run.id
         except Exception as e:
-            logger.error(f"保存系统日志失败: {e}")
+            logger.error(f"记录任务运行失败: {e}")
             session.rollback()
+            return None
+        finally:
+            session.close()
+    
+    def update_job_run(self, run_id: int, **fields) -> bool:
+        """更新定时任务运行记录（状态、结束时间、运行时长、错误信息）"""
+        try:
+            session = self.db_manager.get_session()
+            session.query(JobRun).filter(JobRun.id == run_id).update(fields)
+            session.commit()
+            return True
+        except Exception as e:
+            logger.error(f"更新任务运行记录失败: {e}")
+            session.rollback()
+            return False
+        finally:
+            session.close()
+    
+    def get_job_runs(self, job_name: str = None, limit: int = 100) -> pd.DataFrame:
+        """读取最近的定时任务运行记录"""
+        try:
+            stmt = select(JobRun.__table__)
+            if job_name:
+                stmt = stmt.where(JobRun.job_name == job_name)
+            stmt = stmt.order_by(JobRun.id.desc()).limit(limit)
+            return pd.read_sql(stmt, self.db_manager.engine)
+        except Exception as e:
+            logger.error(f"读取任务运行记录失败: {e}")
+            return pd.DataFrame()
+    
+    def get_quarantine_count(self, source_table: str = None, trade_date: date = None) -> int:
+        """获取隔离记录数量"""
+        try:
+            session = self.db_manager.get_session()
+            query = session.query(DataQuarantine)
+            
+            if source_table:
+                query = query.filter(DataQuarantine.source_table == source_table)
+            if trade_date:
+                query = query.filter(DataQuarantine.trade_date == trade_date)
+            
+            count = query.count()
+            return count
+        except Exception as e:
+            logger.error(f"获取隔离记录数量失败: {e}")
+            return 0
         finally:
             session.close()
     
@@ -216,7 +765,7 @@ class DataStorage:
             session.close()
     
     def get_transaction_detail_count(self, trade_date: date = None) -> int:
-        """获取成交明细数据数量"""
+        """获取成交明细数据数量（包含已归档的记录）"""
         try:
             session = self.db_manager.get_session()
             query = session.query(StockTransactionDetail)
@@ -224,7 +773,7 @@ class DataStorage:
             if trade_date:
                 query = query.filter(StockTransactionDetail.trade_date == trade_date)
             
-            count = query.count()
+            count = query.count() + self.tick_archive.count(trade_date)
             return count
         except Exception as e:
             logger.error(f"获取成交明细数据数量失败: {e}")
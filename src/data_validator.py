@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+入库前数据校验模块
+
+在数据获取和入库之间对整个DataFrame做向量化校验（NumPy布尔掩码，不逐行循环），
+不合格的记录连同原因写入隔离表 data_quarantine，合格的记录照常入库。
+每条记录的不合格原因用位掩码累积，便于统计各类问题的数量。
+"""
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.market_rules import price_limit
+
+# 不合格原因（位掩码）
+MISSING_KEY = 1 << 0
+MISSING_PRICE = 1 << 1
+NON_POSITIVE_PRICE = 1 << 2
+OHLC_INCONSISTENT = 1 << 3
+INVALID_VOLUME = 1 << 4
+VOLUME_OVERFLOW = 1 << 5
+MISSING_PCT_CHANGE = 1 << 6
+PRICE_LIMIT_EXCEEDED = 1 << 7
+DUPLICATE_KEY = 1 << 8
+
+REASON_NAMES = {
+    MISSING_KEY: 'missing_key',
+    MISSING_PRICE: 'missing_price',
+    NON_POSITIVE_PRICE: 'non_positive_price',
+    OHLC_INCONSISTENT: 'ohlc_inconsistent',
+    INVALID_VOLUME: 'invalid_volume',
+    VOLUME_OVERFLOW: 'volume_overflow',
+    MISSING_PCT_CHANGE: 'missing_pct_change',
+    PRICE_LIMIT_EXCEEDED: 'price_limit_exceeded',
+    DUPLICATE_KEY: 'duplicate_key',
+}
+
+# 成交量列为 Integer（MySQL INT），超出即溢出
+INT32_MAX = np.iinfo(np.int32).max
+
+# 最小价格变动单位，涨跌停价四舍五入到分带来的涨跌幅误差不超过一个价位
+PRICE_TICK = 0.01
+
+# 上市日期（未知时为已保存和本批数据中最早的交易日）后这么多自然日内视为新股（覆盖前5个交易日及节假日）
+IPO_CALENDAR_DAYS = 14
+
+
+class DataValidator:
+    """入库前数据校验器"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        """重置运行指标"""
+        self.metrics = {
+            'checked': 0,
+            'passed': 0,
+            'rejected': 0,
+            'reasons': {name: 0 for name in REASON_NAMES.values()},
+        }
+
+    def summary(self) -> str:
+        """运行指标摘要"""
+        reasons = ', '.join(f"{name}={count}" for name, count in self.metrics['reasons'].items() if count)
+        return (f"校验 {self.metrics['checked']} 条, 通过 {self.metrics['passed']} 条, "
+                f"隔离 {self.metrics['rejected']} 条" + (f" ({reasons})" if reasons else ""))
+
+    def validate_daily(self, data: pd.DataFrame, list_dates: pd.Series = None,
+                       first_dates: pd.Series = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        校验日线数据
+
+        Args:
+            data: 日线数据，包含 symbol, trade_date, OHLC, volume, amount, pct_change 列
+            list_dates: 以股票代码为索引的上市日期，用于豁免新股上市初期的涨跌幅检查
+            first_dates: 以股票代码为索引的已保存日线的最早交易日，上市日期未知时代替上市日期
+
+        Returns:
+            (合格记录, 不合格记录)，不合格记录附带 reasons 列
+        """
+        if data.empty:
+            return data, data.iloc[0:0]
+
+        n = len(data)
+        codes = np.zeros(n, dtype=np.int64)
+
+        symbols = data['symbol'].to_numpy()
+        trade_dates = pd.to_datetime(data['trade_date'], errors='coerce').to_numpy()
+        codes[pd.isna(symbols) | pd.isna(trade_dates)] |= MISSING_KEY
+
+        open_price = data['open_price'].to_numpy(dtype=np.float64)
+        high_price = data['high_price'].to_numpy(dtype=np.float64)
+        low_price = data['low_price'].to_numpy(dtype=np.float64)
+        close_price = data['close_price'].to_numpy(dtype=np.float64)
+        prices = np.column_stack([open_price, high_price, low_price, close_price])
+
+        codes[np.isnan(prices).any(axis=1)] |= MISSING_PRICE
+        codes[(prices <= 0).any(axis=1)] |= NON_POSITIVE_PRICE
+
+        codes[
+            (high_price < low_price)
+            | (open_price > high_price) | (open_price < low_price)
+            | (close_price > high_price) | (close_price < low_price)
+        ] |= OHLC_INCONSISTENT
+
+        codes |= self._volume_codes(data)
+
+        pct_change = data['pct_change'].to_numpy(dtype=np.float64)
+        codes[np.isnan(pct_change)] |= MISSING_PCT_CHANGE
+
+        codes[self._price_limit_mask(data, symbols, trade_dates, close_price, pct_change, list_dates, first_dates)] \
+            |= PRICE_LIMIT_EXCEEDED
+
+        codes[data.duplicated(['symbol', 'trade_date'], keep='first').to_numpy()] |= DUPLICATE_KEY
+
+        return self._split(data, codes, '日线')
+
+    def validate_transactions(self, data: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        校验成交明细
+
+        Returns:
+            (合格记录, 不合格记录)，不合格记录附带 reasons 列
+        """
+        if data.empty:
+            return data, data.iloc[0:0]
+
+        codes = np.zeros(len(data), dtype=np.int64)
+
+        trade_times = pd.to_datetime(data['trade_time'], errors='coerce').to_numpy()
+        codes[pd.isna(data['symbol'].to_numpy()) | pd.isna(trade_times)] |= MISSING_KEY
+
+        price = data['price'].to_numpy(dtype=np.float64)
+        codes[np.isnan(price)] |= MISSING_PRICE
+        codes[price <= 0] |= NON_POSITIVE_PRICE
+
+        codes |= self._volume_codes(data)
+
+        return self._split(data, codes, '成交明细')
+
+    @staticmethod
+    def _volume_codes(data: pd.DataFrame) -> np.ndarray:
+        """成交量、成交额检查：缺失、为负、超出int32范围"""
+        volume = data['volume'].to_numpy(dtype=np.float64)
+        amount = data['amount'].to_numpy(dtype=np.float64)
+
+        codes = np.zeros(len(data), dtype=np.int64)
+        codes[np.isnan(volume) | (volume < 0) | (amount < 0)] |= INVALID_VOLUME
+        codes[volume > INT32_MAX] |= VOLUME_OVERFLOW
+        return codes
+
+    @staticmethod
+    def _price_limit_mask(data: pd.DataFrame, symbols: np.ndarray, trade_dates: np.ndarray,
+                          close_price: np.ndarray, pct_change: np.ndarray,
+                          list_dates: pd.Series = None, first_dates: pd.Series = None) -> np.ndarray:
+        """
+        涨跌幅超出板块限制的记录
+
+        新股上市前5个交易日不设涨跌幅限制，上市后 IPO_CALENDAR_DAYS 个自然日内的记录不检查。
+        上市日期未知时以已保存日线和本批数据中最早的交易日代替
+        （只有一个交易日的批次也按已保存的历史判断，不依赖本批数据的条数）。
+        """
+        limits = price_limit(symbols.astype(str), trade_dates)
+
+        # 由收盘价和涨跌幅反推昨收，涨跌停价四舍五入到分，允许一个价位的误差
+        with np.errstate(invalid='ignore', divide='ignore'):
+            implied_prev = close_price / (1 + pct_change / 100)
+            allowed = limits * 100 + PRICE_TICK / implied_prev * 100
+
+        listed = data.assign(_date=trade_dates).groupby('symbol', sort=False)['_date'].transform('min').to_numpy()
+        if first_dates is not None and not first_dates.empty:
+            stored = pd.to_datetime(data['symbol'].map(first_dates), errors='coerce').to_numpy()
+            listed = np.where(stored < listed, stored, listed)
+        if list_dates is not None and not list_dates.empty:
+            known = pd.to_datetime(data['symbol'].map(list_dates), errors='coerce').to_numpy()
+            listed = np.where(np.isnat(known), listed, known)
+        seasoned = trade_dates >= listed + np.timedelta64(IPO_CALENDAR_DAYS, 'D')
+
+        return seasoned & (np.abs(pct_change) > allowed)
+
+    def _split(self, data: pd.DataFrame, codes: np.ndarray, label: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """按原因码拆分合格与不合格记录，并累计运行指标"""
+        bad = codes != 0
+        passed = data[~bad]
+        rejected = data[bad].copy()
+
+        self.metrics['checked'] += len(data)
+        self.metrics['passed'] += len(passed)
+        self.metrics['rejected'] += len(rejected)
+
+        if len(rejected):
+            rejected_codes = codes[bad]
+            reasons = np.full(len(rejected), '', dtype=object)
+            for bit, name in REASON_NAMES.items():
+                hit = (rejected_codes & bit) != 0
+                count = int(hit.sum())
+                if count:
+                    self.metrics['reasons'][name] += count
+                    reasons[hit] = reasons[hit] + name + ','
+            rejected['reasons'] = pd.Series(reasons, index=rejected.index).str.rstrip(',')
+            logger.warning(f"{label}数据校验: {len(data)} 条中 {len(rejected)} 条不合格，已隔离")
+
+        return passed, rejected
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+按交易所/板块导入历史日线模块
+
+一次运行导入多个交易所或板块（SH、SZ、STAR、CHINEXT、BSE），各板块并行获取：
+    - 每个板块使用独立的获取线程，所有线程共享同一个令牌桶限速器（数据源按IP限频）
+    - 获取的数据交给一个后台写入线程合并为大批量写入（见 write_pipeline）
+    - 结束后输出每个板块的股票数、成功/失败数、记录数、耗时和吞吐量
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, List
+import pandas as pd
+from loguru import logger
+
+from src.config import Config
+from src.data_fetcher import StockDataFetcher
+from src.data_storage import DataStorage
+from src.market_rules import (board_of, BOARD_SH_MAIN, BOARD_STAR, BOARD_SZ_MAIN, BOARD_CHINEXT, BOARD_BSE)
+from src.metrics import dump_metrics_on_exit
+from src.rate_limiter import RateLimiter
+from src.write_pipeline import WritePipeline
+
+# 命令行可选的交易所/板块：SH、SZ 表示交易所（含科创板、创业板），其余为单个板块
+MARKETS = {
+    'SH': [BOARD_SH_MAIN, BOARD_STAR],
+    'SZ': [BOARD_SZ_MAIN, BOARD_CHINEXT],
+    'SH_MAIN': [BOARD_SH_MAIN],
+    'SZ_MAIN': [BOARD_SZ_MAIN],
+    'STAR': [BOARD_STAR],
+    'CHINEXT': [BOARD_CHINEXT],
+    'BSE': [BOARD_BSE],
+}
+
+REPORT_COLUMNS = ['board', 'symbols', 'success', 'failed', 'fetched_rows', 'written_rows', 'failed_rows',
+                  'seconds', 'symbols_per_sec', 'rows_per_sec']
+
+
+def resolve_boards(markets: List[str]) -> List[str]:
+    """交易所/板块名称展开为板块列表（去重并保持顺序）"""
+    boards = []
+    for market in markets:
+        key = market.upper()
+        if key not in MARKETS:
+            raise ValueError(f"不支持的交易所/板块: {market}，可选 {', '.join(MARKETS)}")
+        boards.extend(board for board in MARKETS[key] if board not in boards)
+    return boards
+
+
+class ExchangeImporter:
+    """按交易所/板块并行导入历史日线"""
+
+    def __init__(self, data_fetcher=None, data_storage=None, rate: float = None, workers: int = None):
+        """
+        Args:
+            rate: 所有板块合计的每秒请求数
+            workers: 每个板块的获取线程数
+        """
+        self.data_fetcher = data_fetcher or StockDataFetcher()
+        self.data_storage = data_storage or DataStorage()
+        rate = rate if rate is not None else Config.IMPORT_RATE_LIMIT
+        self.limiter = RateLimiter(rate)
+        self.workers = workers or Config.IMPORT_BOARD_WORKERS
+
+    def import_daily(self, markets: List[str], start_date: str = '20200101', end_date: str = None) -> pd.DataFrame:
+        """
+        导入指定交易所/板块的历史日线
+
+        Args:
+            markets: 交易所/板块名称，见 MARKETS
+            start_date: 开始日期 (YYYYMMDD)
+            end_date: 结束日期 (YYYYMMDD)，默认为昨天
+
+        Returns:
+            每个板块一行的统计（REPORT_COLUMNS），最后一行为合计
+        """
+        boards = resolve_boards(markets)
+        end_date = end_date or (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
+        logger.info(f"开始导入历史日线: {', '.join(boards)}，日期范围 {start_date} - {end_date}，"
+                    f"每个板块 {self.workers} 个线程，合计限速 {self.limiter.rate:g} 次/秒")
+
+        stock_list = self.data_fetcher.get_stock_list()
+        symbols = stock_list['symbol'].astype(str).to_numpy()
+        board_symbols = {board: sorted(symbols[board_of(symbols) == board]) for board in boards}
+        for board, members in board_symbols.items():
+            logger.info(f"板块 {board}: {len(members)} 只股票")
+
+        stats = {board: {'symbols': len(members), 'success': 0, 'failed': 0, 'fetched_rows': 0}
+                 for board, members in board_symbols.items()}
+        lock = threading.Lock()
+        started = time.monotonic()
+
+        def fetch(board: str, symbol: str):
+            self.limiter.acquire()
+            try:
+                daily_data = self.data_fetcher.get_daily_data(symbol=symbol, start_date=start_date, end_date=end_date)
+            except Exception as e:
+                logger.error(f"股票 {symbol} 处理失败: {e}")
+                daily_data = pd.DataFrame()
+            if not daily_data.empty:
+                writer.put(daily_data, board)
+            with lock:
+                board_stats = stats[board]
+                board_stats['success' if not daily_data.empty else 'failed'] += 1
+                board_stats['fetched_rows'] += len(daily_data)
+                done = board_stats['success'] + board_stats['failed']
+                if done == board_stats['symbols']:
+                    board_stats['seconds'] = time.monotonic() - started
+                if done % 100 == 0 or done == board_stats['symbols']:
+                    logger.info(f"板块 {board} 进度 {done}/{board_stats['symbols']}")
+
+        with WritePipeline(self.data_storage.save_daily_data, name='daily-writer') as writer:
+            executors = {board: ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'import-{board}')
+                         for board in boards}
+            try:
+                futures = [executors[board].submit(fetch, board, symbol)
+                           for board, members in board_symbols.items() for symbol in members]
+                for future in as_completed(futures):
+                    future.result()
+            finally:
+                # 中断（Ctrl-C）或出错时取消尚未开始的股票，只等待正在请求的股票结束
+                for executor in executors.values():
+                    executor.shutdown(wait=True, cancel_futures=True)
+        total_seconds = time.monotonic() - started
+
+        report = self._report(stats, writer.stats, total_seconds)
+        logger.info(f"导入完成，总耗时 {total_seconds:.1f} 秒，限速等待 {self.limiter.waited:.1f} 秒\n"
+                    f"{report.to_string(index=False)}")
+        return report
+
+    @staticmethod
+    def _report(stats: Dict[str, Dict], write_stats: Dict[str, Dict], total_seconds: float) -> pd.DataFrame:
+        """每个板块的吞吐量统计（写入行数来自写入线程）"""
+        rows = []
+        for board, board_stats in stats.items():
+            written = write_stats.get(board, {})
+            rows.append(dict(board_stats, board=board, seconds=board_stats.get('seconds', 0.0),
+                             written_rows=written.get('rows', 0), failed_rows=written.get('failed_rows', 0)))
+        report = pd.DataFrame(rows, columns=REPORT_COLUMNS)
+        total = report.drop(columns='board').sum()
+        total['seconds'] = total_seconds
+        report.loc[len(report)] = dict(total, board='TOTAL')
+        seconds = report['seconds'].where(report['seconds'] > 0)
+        report['symbols_per_sec'] = (report['success'] + report['failed']) / seconds
+        report['rows_per_sec'] = report['fetched_rows'] / seconds
+        counts = ['symbols', 'success', 'failed', 'fetched_rows', 'written_rows', 'failed_rows']
+        report[counts] = report[counts].astype(int)
+        return report.fillna(0.0).round({'seconds': 1, 'symbols_per_sec': 2, 'rows_per_sec': 1})
+
+
+def main(default_markets: List[str] = None, description: str = '按交易所/板块并行导入历史日线数据'):
+    """
+    命令行入口
+
+    Args:
+        default_markets: 未指定 --markets 时导入的交易所/板块（import_sh_stocks.py 等兼容脚本使用）
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--markets', nargs='+', metavar='MARKET', default=default_markets,
+                        required=default_markets is None,
+                        help=f"交易所/板块，可选 {' '.join(MARKETS)}")
+    parser.add_argument('--start-date', default='20200101', help='开始日期 (YYYYMMDD)')
+    parser.add_argument('--end-date', help='结束日期 (YYYYMMDD)，默认为昨天')
+    parser.add_argument('--workers', type=int, help='每个板块的获取线程数，默认 IMPORT_BOARD_WORKERS')
+    parser.add_argument('--rate', type=float, help='所有板块合计的每秒请求数（0表示不限速），默认 IMPORT_RATE_LIMIT')
+    parser.add_argument('--metrics-json', metavar='PATH', help='运行结束时把运行指标写入该JSON文件，默认 METRICS_JSON_PATH')
+    args = parser.parse_args()
+
+    Config.setup_logging()
+    dump_metrics_on_exit(args.metrics_json)
+    try:
+        importer = ExchangeImporter(rate=args.rate, workers=args.workers)
+        importer.import_daily(args.markets, start_date=args.start_date, end_date=args.end_date)
+    except KeyboardInterrupt:
+        logger.info("用户中断操作")
+    except Exception as e:
+        logger.error(f"程序执行失败: {e}")
+        sys.exit(1)
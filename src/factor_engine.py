@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+技术指标增量计算模块
+
+基于价格面板（后复权价格）对全市场股票同时做向量化计算，逐个交易日推进：
+    - 均线、波动率、均量等窗口指标使用每只股票一个的环形缓冲区（最近60个交易日）
+    - EMA、MACD、RSI、ATR 等递推指标只保存上一日的状态
+状态保存在 npz 文件中，每日只处理面板中新增的交易日，无需重新读取多年历史。
+停牌日不推进该股票的状态，指标按股票自身的交易日计算。
+价格类指标（均线、EMA、MACD、ATR）按当日复权因子换算为不复权口径，与当日收盘价可直接比较。
+系统不保存流通股本，不计算换手率类指标。
+"""
+import os
+import warnings
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.config import Config
+from src.price_panel import PricePanel
+
+RING_SIZE = 60
+MA_WINDOWS = (5, 10, 20, 60)
+VOLUME_RATIO_WINDOW = 5
+VOLATILITY_WINDOW = 20
+AMOUNT_WINDOW = 20
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+EMA_FAST, EMA_SLOW, EMA_SIGNAL = 12, 26, 9
+TRADING_DAYS_PER_YEAR = 252
+
+FACTOR_COLUMNS = ['ma5', 'ma10', 'ma20', 'ma60', 'ema12', 'ema26', 'macd_dif', 'macd_dea',
+                  'rsi14', 'atr14', 'volatility20', 'volume_ratio', 'amount_ma20']
+
+# 需要换算为不复权口径的指标
+PRICE_LEVEL_FACTORS = ('ma5', 'ma10', 'ma20', 'ma60', 'ema12', 'ema26', 'macd_dif', 'macd_dea', 'atr14')
+
+# 状态数组：环形缓冲区为 (RING_SIZE, 股票数)，其余为 (股票数,)
+_RING_ARRAYS = ('close_ring', 'return_ring', 'volume_ring', 'amount_ring')
+_STATE_ARRAYS = ('prev_close', 'ema_fast', 'ema_slow', 'macd_dea', 'avg_gain', 'avg_loss', 'atr')
+_COUNTER_ARRAYS = ('position', 'count')
+
+
+class FactorState:
+    """因子引擎的滚动状态"""
+
+    def __init__(self, symbols: List[str], last_date: np.datetime64 = None, panel_generation: int = None):
+        n = len(symbols)
+        self.symbols = np.array(symbols, dtype=object)
+        self.last_date = last_date
+        # 计算时价格面板的文件代数，面板重建后状态作废
+        self.panel_generation = panel_generation
+        self.arrays = {name: np.full((RING_SIZE, n), np.nan) for name in _RING_ARRAYS}
+        self.arrays.update({name: np.full(n, np.nan) for name in _STATE_ARRAYS})
+        self.arrays.update({name: np.zeros(n, dtype=np.int64) for name in _COUNTER_ARRAYS})
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def align(self, symbols: np.ndarray):
+        """按股票代码把状态对齐到面板的列顺序（面板新增或重排股票时）"""
+        if len(symbols) == len(self.symbols) and np.array_equal(symbols, self.symbols):
+            return
+        indexer = pd.Index(self.symbols).get_indexer(symbols)
+        found = indexer >= 0
+        aligned = FactorState(list(symbols), self.last_date)
+        for name, array in self.arrays.items():
+            if array.ndim == 2:
+                aligned.arrays[name][:, found] = array[:, indexer[found]]
+            else:
+                aligned.arrays[name][found] = array[indexer[found]]
+        self.symbols = aligned.symbols
+        self.arrays = aligned.arrays
+
+    def save(self, path: str):
+        """原子写入状态文件"""
+        state_dir = os.path.dirname(path)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, symbols=self.symbols.astype(str),
+                 last_date=np.array([self.last_date], dtype='datetime64[D]'),
+                 panel_generation=np.array([-1 if self.panel_generation is None else self.panel_generation]),
+                 **self.arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FactorState':
+        with np.load(path, allow_pickle=False) as data:
+            generation = int(data['panel_generation'][0]) if 'panel_generation' in data.files else -1
+            state = cls(data['symbols'].tolist(), data['last_date'][0], None if generation < 0 else generation)
+            for name in state.arrays:
+                state.arrays[name] = data[name]
+        return state
+
+
+class FactorEngine:
+    """技术指标增量计算引擎"""
+
+    def __init__(self, panel: PricePanel = None, data_storage=None, state_path: str = None):
+        if data_storage is None:
+            from src.data_storage import DataStorage
+            data_storage = DataStorage()
+        self.data_storage = data_storage
+        self.panel = panel or PricePanel()
+        self.state_path = state_path or Config.FACTOR_STATE_PATH
+
+    def _load_state(self) -> FactorState:
+        if os.path.exists(self.state_path):
+            state = FactorState.load(self.state_path)
+        else:
+            state = FactorState(self.panel.symbols.tolist())
+        state.align(self.panel.symbols)
+        return state
+
+    def reset(self):
+        """删除状态文件，下次更新时从面板起始日期重新计算"""
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def update(self, persist: bool = True, flush_days: int = 20) -> int:
+        """
+        计算状态日期之后所有交易日的指标
+
+        Args:
+            persist: 是否写入 stock_daily_factor 表
+            flush_days: 每累计多少个交易日写入一次数据库
+
+        Returns:
+            处理的交易日数
+        """
+        self.panel.refresh()
+        state = self._load_state()
+        generation = self.panel.meta['generation']
+        if state.panel_generation is not None and state.panel_generation != generation:
+            # 面板重建（已有交易日的日线被重新写入）后从面板起始日期重新计算
+            logger.info("价格面板已重建，技术指标从面板起始日期重新计算")
+            state = FactorState(self.panel.symbols.tolist())
+        state.panel_generation = generation
+
+        start = 0
+        if state.last_date is not None and not np.isnat(state.last_date):
+            start = int(np.searchsorted(self.panel.dates, state.last_date, side='right'))
+        rows = range(start, len(self.panel.dates))
+        if not rows:
+            logger.info("技术指标已是最新")
+            return 0
+
+        fields = {name: self.panel.field(name) for name in
+                  ('high', 'low', 'close', 'volume', 'amount', 'adj_factor')}
+        pending = []
+
+        for row in rows:
+            trade_date = self.panel.dates[row]
+            factors = self.step(state, {name: np.asarray(array[row]) for name, array in fields.items()})
+            state.last_date = trade_date
+
+            if persist and factors is not None:
+                pending.append(factors.assign(trade_date=pd.Timestamp(trade_date).date()))
+                if len(pending) >= flush_days:
+                    self._flush(pending)
+                    pending = []
+
+        if pending:
+            self._flush(pending)
+
+        # 指标全部写入后再保存状态，中途失败时下次从上一个状态重新计算（写入为幂等更新）
+        state.save(self.state_path)
+        logger.info(f"技术指标计算完成: {len(rows)} 个交易日, 截至 {state.last_date}")
+        return len(rows)
+
+    def _flush(self, frames: List[pd.DataFrame]):
+        if not self.data_storage.save_daily_factors(pd.concat(frames, ignore_index=True)):
+            raise RuntimeError("保存技术指标失败")
+
+    @staticmethod
+    def _recent(ring: np.ndarray, position: np.ndarray, cols: np.ndarray, window: int) -> np.ndarray:
+        """取各股票环形缓冲区中最近window个值，形状为 (window, len(cols))"""
+        offsets = np.arange(1, window + 1)[:, None]
+        return ring[(position[cols][None, :] - offsets) % RING_SIZE, cols[None, :]]
+
+    @staticmethod
+    def _ema(previous: np.ndarray, value: np.ndarray, alpha: float) -> np.ndarray:
+        return np.where(np.isnan(previous), value, previous + alpha * (value - previous))
+
+    def step(self, state: FactorState, bar: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """
+        推进一个交易日
+
+        Args:
+            state: 滚动状态（原地更新）
+            bar: 当日截面，包含 high/low/close（后复权）、volume、amount、adj_factor
+
+        Returns:
+            当日有交易股票的指标，无交易时为None
+        """
+        cols = np.flatnonzero(np.isfinite(bar['close']))
+        if len(cols) == 0:
+            return None
+
+        close = bar['close'][cols].astype(np.float64)
+        high = bar['high'][cols].astype(np.float64)
+        low = bar['low'][cols].astype(np.float64)
+        volume = bar['volume'][cols]
+        amount = bar['amount'][cols]
+        position = state['position']
+        prev_close = state['prev_close'][cols]
+
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            # 新股没有历史窗口，nanmean对全NaN列返回NaN
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+
+            # 量比以前5日均量为基准，需在写入当日成交量之前计算
+            prior_volume = np.nanmean(self._recent(state['volume_ring'], position, cols, VOLUME_RATIO_WINDOW), axis=0)
+            volume_ratio = volume / prior_volume
+
+            slot = position[cols] % RING_SIZE
+            state['close_ring'][slot, cols] = close
+            state['return_ring'][slot, cols] = close / prev_close - 1
+            state['volume_ring'][slot, cols] = volume
+            state['amount_ring'][slot, cols] = amount
+            position[cols] += 1
+            state['count'][cols] += 1
+            count = state['count'][cols]
+
+            result = {}
+            for window in MA_WINDOWS:
+                recent = self._recent(state['close_ring'], position, cols, window)
+                result[f'ma{window}'] = np.where(count >= window, recent.mean(axis=0), np.nan)
+
+            returns = self._recent(state['return_ring'], position, cols, VOLATILITY_WINDOW)
+            result['volatility20'] = np.where(
+                count > VOLATILITY_WINDOW,
+                returns.std(axis=0, ddof=1) * np.sqrt(TRADING_DAYS_PER_YEAR),
+                np.nan
+            )
+            amounts = self._recent(state['amount_ring'], position, cols, AMOUNT_WINDOW)
+            result['amount_ma20'] = np.where(count >= AMOUNT_WINDOW, np.nanmean(amounts, axis=0), np.nan)
+            result['volume_ratio'] = volume_ratio
+
+            # EMA / MACD
+            ema_fast = self._ema(state['ema_fast'][cols], close, 2 / (EMA_FAST + 1))
+            ema_slow = self._ema(state['ema_slow'][cols], close, 2 / (EMA_SLOW + 1))
+            dif = ema_fast - ema_slow
+            dea = self._ema(state['macd_dea'][cols], dif, 2 / (EMA_SIGNAL + 1))
+            state['ema_fast'][cols] = ema_fast
+            state['ema_slow'][cols] = ema_slow
+            state['macd_dea'][cols] = dea
+            result['ema12'] = np.where(count >= EMA_FAST, ema_fast, np.nan)
+            result['ema26'] = np.where(count >= EMA_SLOW, ema_slow, np.nan)
+            result['macd_dif'] = np.where(count >= EMA_SLOW, dif, np.nan)
+            result['macd_dea'] = np.where(count >= EMA_SLOW, dea, np.nan)
+
+            # RSI（Wilder平滑），第一天没有涨跌幅
+            change = close - prev_close
+            has_change = np.isfinite(change)
+            gain = np.where(has_change, np.maximum(change, 0), np.nan)
+            loss = np.where(has_change, np.maximum(-change, 0), np.nan)
+            avg_gain = np.where(has_change, self._ema(state['avg_gain'][cols], gain, 1 / RSI_PERIOD),
+                                state['avg_gain'][cols])
+            avg_loss = np.where(has_change, self._ema(state['avg_loss'][cols], loss, 1 / RSI_PERIOD),
+                                state['avg_loss'][cols])
+            state['avg_gain'][cols] = avg_gain
+            state['avg_loss'][cols] = avg_loss
+            total = avg_gain + avg_loss
+            rsi = np.where(total > 0, 100 * avg_gain / total, 50.0)
+            result['rsi14'] = np.where(count > RSI_PERIOD, rsi, np.nan)
+
+            # ATR（Wilder平滑），第一天以最高价-最低价作为真实波幅
+            true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+            atr = self._ema(state['atr'][cols], true_range, 1 / ATR_PERIOD)
+            state['atr'][cols] = atr
+            result['atr14'] = np.where(count >= ATR_PERIOD, atr, np.nan)
+
+            state['prev_close'][cols] = close
+
+            # 价格类指标换算为当日不复权口径
+            adj_factor = bar['adj_factor'][cols]
+            adj_factor = np.where(np.isfinite(adj_factor) & (adj_factor > 0), adj_factor, 1.0)
+            for name in PRICE_LEVEL_FACTORS:
+                result[name] = result[name] / adj_factor
+
+        frame = pd.DataFrame(result, columns=FACTOR_COLUMNS)
+        frame.insert(0, 'symbol', state.symbols[cols])
+        return frame
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+数据缺口检测模块
+
+按交易日历、上市/退市日期和已保存的 (股票, 交易日) 计算缺失的数据，合并为每只股票连续的缺失区间：
+    - 应有数据：交易日历中上市日期（含）到退市日期（不含）之间的交易日
+    - 已有数据：日线表 / 成交明细表中的记录，成交明细已归档的月份按归档文件的日期范围计入
+    - 已请求过：import_job_unit 中已完成单元覆盖的日期（数据源本身没有数据，如停牌），默认不再请求
+(股票, 交易日) 编码为 股票序号 × 交易日数 + 交易日序号 的整数后用集合运算求差，
+按交易日序号连续（跳过节假日）合并为区间。日线每个区间请求一次，成交明细每个交易日请求一次。
+"""
+from datetime import date
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.config import Config
+
+GAP_DATA_TYPES = ('daily', 'transaction')
+SPAN_COLUMNS = ['symbol', 'start_date', 'end_date', 'missing_days', 'span_days']
+
+
+def expand_ranges(codes: np.ndarray, lo: np.ndarray, hi: np.ndarray, n_days: int) -> np.ndarray:
+    """把每个股票序号的交易日序号区间 [lo, hi) 展开为编码后的键"""
+    lengths = np.maximum(hi - lo, 0)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(codes.astype(np.int64), lengths) * n_days + np.repeat(lo, lengths) + offsets
+
+
+class GapPlanner:
+    """数据缺口检测器"""
+
+    def __init__(self, data_storage, data_fetcher=None, job_store=None):
+        """
+        Args:
+            data_storage: 数据存储器
+            data_fetcher: 数据获取器，用于获取交易日历（None时只用本地数据推断）
+            job_store: 导入任务单元状态，用于排除已请求过的日期（None时不排除）
+        """
+        self.data_storage = data_storage
+        self.data_fetcher = data_fetcher
+        self.job_store = job_store
+        self._calendar = None
+
+    def trade_calendar(self, start_date: date, end_date: date) -> np.ndarray:
+        """
+        交易日历（datetime64[D]，升序）
+
+        优先使用数据源的交易日历；获取失败时，日线数据已覆盖的日期范围内用日线表中的交易日，
+        范围之外用工作日（节假日会被当作交易日，对应的请求返回空数据后记为已请求）
+        """
+        if self._calendar is None and self.data_fetcher is not None:
+            self._calendar = np.array(self.data_fetcher.get_trade_calendar(), dtype='datetime64[D]')
+
+        start, end = np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D')
+        if self._calendar is not None and len(self._calendar) and self._calendar[-1] >= end:
+            return self._calendar[(self._calendar >= start) & (self._calendar <= end)]
+
+        logger.warning("没有可用的交易日历，使用日线数据中的交易日和工作日推断")
+        weekdays = pd.bdate_range(start_date, end_date).values.astype('datetime64[D]')
+        stored = np.array(self.data_storage.get_trade_dates(start_date, end_date), dtype='datetime64[D]')
+        if not len(stored):
+            return weekdays
+        outside = (weekdays < stored[0]) | (weekdays > stored[-1])
+        return np.union1d(stored, weekdays[outside])
+
+    def plan(self, data_type: str, start_date: date, end_date: date, symbols: List[str] = None,
+             merge_gap: int = 0, skip_attempted: bool = True) -> pd.DataFrame:
+        """
+        计算缺失的区间
+
+        Args:
+            data_type: daily 或 transaction
+            symbols: 股票代码列表，None表示 stock_info 中的全部股票和有日线数据的股票
+            merge_gap: 间隔不超过该交易日数的缺失区间合并为一个（日线按区间请求，合并可减少请求次数）
+            skip_attempted: 是否排除已完成单元覆盖的日期
+
+        Returns:
+            symbol, start_date, end_date, missing_days（缺失交易日数）, span_days（区间交易日数）
+        """
+        if data_type not in GAP_DATA_TYPES:
+            raise ValueError(f"不支持缺口检测的数据类型: {data_type}")
+
+        calendar = self.trade_calendar(start_date, end_date)
+        listing = self.data_storage.get_stock_listing(symbols)
+        # 没有基本信息的股票（指定的股票，或未指定时有日线数据的股票）按全区间上市处理
+        universe = set(symbols) if symbols else set(listing['symbol']) | set(self.data_storage.get_daily_symbols())
+        listing = listing.set_index('symbol').reindex(sorted(universe)).rename_axis('symbol').reset_index()
+        if listing.empty or not len(calendar):
+            return pd.DataFrame(columns=SPAN_COLUMNS)
+
+        listing = listing.sort_values('symbol').reset_index(drop=True)
+        universe = pd.Index(listing['symbol'])
+        n_days = len(calendar)
+        codes = np.arange(len(universe))
+
+        list_dates = pd.to_datetime(listing['list_date']).values.astype('datetime64[D]')
+        delist_dates = pd.to_datetime(listing['delist_date']).values.astype('datetime64[D]')
+        lo = np.where(np.isnat(list_dates), 0, np.searchsorted(calendar, list_dates))
+        hi = np.where(np.isnat(delist_dates), n_days, np.searchsorted(calendar, delist_dates))
+        expected = expand_ranges(codes, lo, hi, n_days)
+
+        present = [self._encode_keys(self.data_storage.get_data_keys(data_type, start_date, end_date, symbols),
+                                     universe, calendar)]
+        if data_type == 'transaction':
+            archived = pd.DataFrame(self.data_storage.tick_archive.get_entries(symbols, start_date, end_date),
+                                    columns=['symbol', 'start_date', 'end_date'])
+            present.append(self._encode_ranges(archived, universe, calendar))
+        if skip_attempted and self.job_store is not None:
+            present.append(self._encode_ranges(self.job_store.done_ranges(data_type, symbols), universe, calendar))
+
+        missing = np.setdiff1d(expected, np.concatenate(present), assume_unique=False)
+        return self._merge_spans(missing, universe, calendar, merge_gap)
+
+    @staticmethod
+    def _encode_keys(keys: pd.DataFrame, universe: pd.Index, calendar: np.ndarray) -> np.ndarray:
+        """(symbol, trade_date) 编码为整数键，不在股票范围或交易日历中的记录丢弃"""
+        if keys.empty:
+            return np.empty(0, dtype=np.int64)
+        codes = universe.get_indexer(keys['symbol'])
+        days = pd.to_datetime(keys['trade_date']).values.astype('datetime64[D]')
+        idx = np.minimum(np.searchsorted(calendar, days), len(calendar) - 1)
+        valid = (codes >= 0) & (calendar[idx] == days)
+        return codes[valid].astype(np.int64) * len(calendar) + idx[valid]
+
+    @staticmethod
+    def _encode_ranges(ranges: pd.DataFrame, universe: pd.Index, calendar: np.ndarray) -> np.ndarray:
+        """(symbol, start_date, end_date) 区间内的交易日编码为整数键"""
+        if ranges.empty:
+            return np.empty(0, dtype=np.int64)
+        codes = universe.get_indexer(ranges['symbol'])
+        valid = codes >= 0
+        starts = pd.to_datetime(ranges['start_date']).values.astype('datetime64[D]')[valid]
+        ends = pd.to_datetime(ranges['end_date']).values.astype('datetime64[D]')[valid]
+        lo = np.searchsorted(calendar, starts)
+        hi = np.searchsorted(calendar, ends, side='right')
+        return expand_ranges(codes[valid], lo, hi, len(calendar))
+
+    @staticmethod
+    def _merge_spans(missing: np.ndarray, universe: pd.Index, calendar: np.ndarray, merge_gap: int) -> pd.DataFrame:
+        """排序后的缺失键按股票和连续交易日合并为区间"""
+        if not len(missing):
+            return pd.DataFrame(columns=SPAN_COLUMNS)
+
+        codes, days = np.divmod(missing, len(calendar))
+        boundary = np.empty(len(missing), dtype=bool)
+        boundary[0] = True
+        boundary[1:] = (codes[1:] != codes[:-1]) | (days[1:] - days[:-1] > merge_gap + 1)
+        starts = np.flatnonzero(boundary)
+        ends = np.append(starts[1:], len(missing)) - 1
+
+        return pd.DataFrame({
+            'symbol': universe.values[codes[starts]],
+            'start_date': calendar[days[starts]].astype('datetime64[D]').astype(object),
+            'end_date': calendar[days[ends]].astype('datetime64[D]').astype(object),
+            'missing_days': ends - starts + 1,
+            'span_days': days[ends] - days[starts] + 1,
+        }, columns=SPAN_COLUMNS)
+
+    def estimate(self, data_type: str, spans: pd.DataFrame) -> Dict:
+        """
+        补数据的请求次数和预计耗时（单进程）
+
+        单次请求耗时取最近完成单元的平均耗时，没有记录时取 REQUEST_DELAY
+        """
+        missing_days = int(spans['missing_days'].sum()) if not spans.empty else 0
+        requests = len(spans) if data_type == 'daily' else missing_days
+        seconds_per_request = None
+        if self.job_store is not None:
+            seconds_per_request = self.job_store.average_unit_seconds(data_type)
+        if seconds_per_request is None:
+            seconds_per_request = Config.REQUEST_DELAY
+        return {
+            'symbols': int(spans['symbol'].nunique()) if not spans.empty else 0,
+            'spans': len(spans),
+            'missing_days': missing_days,
+            'requests': requests,
+            'seconds_per_request': seconds_per_request,
+            'estimated_seconds': requests * seconds_per_request,
+        }
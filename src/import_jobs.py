@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+批量导入任务单元模块
+
+把一次批量导入拆分为 股票 × 数据类型 × 日期范围 的任务单元，状态保存在 import_job_unit 表：
+    pending   待执行
+    running   执行中
+    done      已完成（记录保存的行数）
+    failed    失败（记录错误信息和下次重试时间，按指数退避重试，超过最大次数后不再重试）
+每个单元获取的数据立即保存，进程中断后以 --resume 重新运行时跳过已完成的单元。
+单元在数据保存成功后才标记完成，中断发生在两者之间（或标记完成失败）时该单元会被重新导入一次，
+重新导入是幂等的，不会产生重复数据：日线在同一事务中先删除同一 股票 × 交易日 的已有记录再写入，
+成交明细只写入资金流汇总水位之后的新成交（水位与明细在同一事务中更新），复权因子按唯一键 upsert。
+
+分布式模式下多台主机的工作进程从同一张表领取单元：
+    - MySQL 用 SELECT ... FOR UPDATE SKIP LOCKED 领取，并发的领取互不等待、不会领到同一单元
+    - 不支持 SKIP LOCKED 的后端（SQLite）用条件更新领取，只有条件仍成立的进程更新成功
+    - 领取时写入租约（领取者和到期时间），工作进程定期心跳续约；
+      进程崩溃后租约到期，单元可被其他工作进程重新领取
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import os
+import socket
+import pandas as pd
+from sqlalchemy import select, func, and_, or_
+from loguru import logger
+
+from src.config import Config
+from database.models import ImportJobUnit
+
+UNIT_PENDING = 'pending'
+UNIT_RUNNING = 'running'
+UNIT_DONE = 'done'
+UNIT_FAILED = 'failed'
+
+
+def make_job_name(start_date: date, end_date: date) -> str:
+    """同一日期范围的导入使用同一个任务名称，以便续传"""
+    return f"import_{start_date:%Y%m%d}_{end_date:%Y%m%d}"
+
+
+def make_worker_id() -> str:
+    """工作进程标识：主机名:进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+
+class ImportJobStore:
+    """导入任务单元的持久化状态"""
+
+    def __init__(self, db_manager=None, max_attempts: int = None, retry_base: float = None,
+                 retry_max: float = None):
+        if db_manager is None:
+            from database import db_manager
+        self.db_manager = db_manager
+        self.max_attempts = max_attempts or Config.MAX_RETRY_COUNT
+        self.retry_base = retry_base if retry_base is not None else Config.IMPORT_RETRY_BASE_SECONDS
+        self.retry_max = retry_max if retry_max is not None else Config.IMPORT_RETRY_MAX_SECONDS
+
+    def create_units(self, job_name: str, data_type: str, units: List[Tuple[str, date, date]],
+                     resume: bool = False, priorities: Dict[str, float] = None) -> int:
+        """
+        创建任务单元
+
+        Args:
+            units: (股票代码, 开始日期, 结束日期) 列表
+            priorities: {股票代码: 优先级}，领取时优先级高的单元先领取，未指定的股票为0
+            resume: True时保留已完成单元的状态（失败的单元和租约已过期或没有租约的running单元恢复为pending，
+                    其他工作进程持有租约的单元不受影响），
+                    False时清除该任务的已有单元重新开始
+
+        Returns:
+            新建的单元数
+        """
+        session = self.db_manager.get_session()
+        try:
+            scope = and_(ImportJobUnit.job_name == job_name, ImportJobUnit.data_type == data_type)
+            if resume:
+                stale = or_(ImportJobUnit.status == UNIT_FAILED,
+                            and_(ImportJobUnit.status == UNIT_RUNNING,
+                                 or_(ImportJobUnit.lease_expires_at.is_(None),
+                                     ImportJobUnit.lease_expires_at < datetime.now())))
+                session.query(ImportJobUnit).filter(scope, stale)\
+                    .update({'status': UNIT_PENDING, 'attempts': 0, 'lease_owner': None,
+                             'lease_expires_at': None}, synchronize_session=False)
+                existing = set(session.query(ImportJobUnit.symbol, ImportJobUnit.start_date,
+                                             ImportJobUnit.end_date).filter(scope).all())
+            else:
+                session.query(ImportJobUnit).filter(scope).delete(synchronize_session=False)
+                existing = set()
+
+            priorities = priorities or {}
+            records = [
+                {'job_name': job_name, 'data_type': data_type, 'symbol': symbol,
+                 'start_date': start, 'end_date': end, 'status': UNIT_PENDING, 'row_count': 0, 'attempts': 0,
+                 'priority': priorities.get(symbol, 0.0)}
+                for symbol, start, end in units if (symbol, start, end) not in existing
+            ]
+            self.db_manager.bulk_insert(session, ImportJobUnit, records)
+            session.commit()
+            return len(records)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _runnable(self, now: datetime):
+        """可执行的单元：待执行，或失败但未超过最大次数且已到重试时间"""
+        return or_(
+            ImportJobUnit.status == UNIT_PENDING,
+            and_(ImportJobUnit.status == UNIT_FAILED,
+                 ImportJobUnit.attempts < self.max_attempts,
+                 ImportJobUnit.next_retry_at <= now)
+        )
+
+    def _claimable(self, now: datetime):
+        """可领取的单元：可执行的单元，以及租约已过期的running单元（领取者已崩溃或失联）"""
+        return or_(
+            self._runnable(now),
+            and_(ImportJobUnit.status == UNIT_RUNNING, ImportJobUnit.lease_expires_at < now)
+        )
+
+    @staticmethod
+    def _scope(job_name: str = None, data_types: List[str] = None) -> List:
+        conditions = []
+        if job_name:
+            conditions.append(ImportJobUnit.job_name == job_name)
+        if data_types:
+            conditions.append(ImportJobUnit.data_type.in_(data_types))
+        return conditions
+
+    def claim_units(self, owner: str, job_name: str = None, data_types: List[str] = None,
+                    limit: int = 10, lease_seconds: float = None) -> List[Dict]:
+        """
+        领取一批单元并写入租约（优先级高的单元先领取）
+
+        Args:
+            owner: 工作进程标识
+            job_name: 只领取该任务的单元，None表示所有任务
+            data_types: 只领取这些数据类型的单元，None表示全部
+            limit: 每次领取的单元数
+            lease_seconds: 租约时长（秒），期间需要心跳续约
+
+        Returns:
+            领取到的单元（id, job_name, data_type, symbol, start_date, end_date, attempts）
+        """
+        lease_seconds = lease_seconds or Config.IMPORT_LEASE_SECONDS
+        session = self.db_manager.get_session()
+        try:
+            now = datetime.now()
+            conditions = self._scope(job_name, data_types) + [self._claimable(now)]
+            stmt = select(ImportJobUnit.id).where(*conditions)\
+                .order_by(ImportJobUnit.priority.desc(), ImportJobUnit.id).limit(limit)
+            if self.db_manager.backend == 'mysql':
+                stmt = stmt.with_for_update(skip_locked=True)
+            ids = session.execute(stmt).scalars().all()
+            if not ids:
+                session.commit()
+                return []
+
+            # 条件更新：查询后被其他进程领取的单元不再满足条件，不会被重复领取
+            session.query(ImportJobUnit).filter(ImportJobUnit.id.in_(ids), *conditions).update({
+                'status': UNIT_RUNNING,
+                'lease_owner': owner,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'heartbeat_at': now,
+                'started_at': now,
+            }, synchronize_session=False)
+            session.commit()
+
+            claimed = session.execute(
+                select(ImportJobUnit.id, ImportJobUnit.job_name, ImportJobUnit.data_type, ImportJobUnit.symbol,
+                       ImportJobUnit.start_date, ImportJobUnit.end_date, ImportJobUnit.attempts)
+                .where(ImportJobUnit.id.in_(ids), ImportJobUnit.lease_owner == owner,
+                       ImportJobUnit.status == UNIT_RUNNING)
+                .order_by(ImportJobUnit.priority.desc(), ImportJobUnit.id)
+            )
+            units = [dict(row._mapping) for row in claimed]
+            session.commit()
+            return units
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def heartbeat(self, owner: str, unit_ids: List[int], lease_seconds: float = None) -> int:
+        """
+        为持有的单元续约
+
+        Returns:
+            续约成功的单元数（租约已过期并被其他进程领取的单元不再续约）
+        """
+        if not unit_ids:
+            return 0
+        lease_seconds = lease_seconds or Config.IMPORT_LEASE_SECONDS
+        session = self.db_manager.get_session()
+        try:
+            now = datetime.now()
+            count = session.query(ImportJobUnit).filter(
+                ImportJobUnit.id.in_(unit_ids),
+                ImportJobUnit.lease_owner == owner,
+                ImportJobUnit.status == UNIT_RUNNING
+            ).update({'lease_expires_at': now + timedelta(seconds=lease_seconds), 'heartbeat_at': now},
+                     synchronize_session=False)
+            session.commit()
+            return count
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def runnable_units(self, job_name: str, data_type: str, limit: int = None) -> List[Dict]:
+        """读取当前可执行的单元"""
+        stmt = select(ImportJobUnit.id, ImportJobUnit.symbol, ImportJobUnit.start_date,
+                      ImportJobUnit.end_date, ImportJobUnit.attempts)\
+            .where(ImportJobUnit.job_name == job_name, ImportJobUnit.data_type == data_type,
+                   self._runnable(datetime.now()))\
+            .order_by(ImportJobUnit.id)
+        if limit:
+            stmt = stmt.limit(limit)
+        with self.db_manager.engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(stmt)]
+
+    def next_retry_delay(self, job_name: str = None, data_type: str = None) -> Optional[float]:
+        """距离最早一个待重试单元的秒数，没有待重试单元时为None"""
+        session = self.db_manager.get_session()
+        try:
+            next_retry = session.query(func.min(ImportJobUnit.next_retry_at)).filter(
+                *self._scope(job_name, [data_type] if data_type else None),
+                ImportJobUnit.status == UNIT_FAILED,
+                ImportJobUnit.attempts < self.max_attempts
+            ).scalar()
+            if next_retry is None:
+                return None
+            return max((next_retry - datetime.now()).total_seconds(), 0.0)
+        finally:
+            session.close()
+
+    def unfinished_count(self, job_name: str = None, data_types: List[str] = None) -> int:
+        """未结束的单元数：待执行、执行中、以及还可以重试的失败单元"""
+        session = self.db_manager.get_session()
+        try:
+            return session.query(func.count(ImportJobUnit.id)).filter(
+                *self._scope(job_name, data_types),
+                or_(ImportJobUnit.status.in_([UNIT_PENDING, UNIT_RUNNING]),
+                    and_(ImportJobUnit.status == UNIT_FAILED, ImportJobUnit.attempts < self.max_attempts))
+            ).scalar()
+        finally:
+            session.close()
+
+    def _update(self, unit_id: int, fields: Dict, owner: str = None) -> bool:
+        """更新单元状态，指定owner时只更新该进程仍持有租约的单元"""
+        session = self.db_manager.get_session()
+        try:
+            query = session.query(ImportJobUnit).filter(ImportJobUnit.id == unit_id)
+            if owner:
+                query = query.filter(ImportJobUnit.lease_owner == owner)
+            count = query.update(fields, synchronize_session=False)
+            session.commit()
+            return count > 0
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def mark_running(self, unit_id: int):
+        self._update(unit_id, {'status': UNIT_RUNNING, 'started_at': datetime.now()})
+
+    def mark_done(self, unit_id: int, row_count: int, owner: str = None) -> bool:
+        return self._update(unit_id, {'status': UNIT_DONE, 'row_count': row_count, 'finished_at': datetime.now(),
+                                      'last_error': None, 'lease_expires_at': None}, owner)
+
+    def mark_failed(self, unit_id: int, attempts: int, error: str, owner: str = None) -> bool:
+        """
+        标记失败，下次重试时间按指数退避计算
+
+        Args:
+            attempts: 本次失败前已尝试的次数
+            owner: 工作进程标识，租约已被其他进程接管时不更新
+        """
+        attempts += 1
+        delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+        return self._update(unit_id, {
+            'status': UNIT_FAILED,
+            'attempts': attempts,
+            'last_error': error[:2000],
+            'next_retry_at': datetime.now() + timedelta(seconds=delay),
+            'lease_expires_at': None,
+        }, owner)
+
+    def unit_results(self, job_name: str, data_type: str) -> pd.DataFrame:
+        """任务单元的状态和保存行数"""
+        stmt = select(ImportJobUnit.symbol, ImportJobUnit.start_date, ImportJobUnit.end_date,
+                      ImportJobUnit.status, ImportJobUnit.row_count, ImportJobUnit.attempts)\
+            .where(ImportJobUnit.job_name == job_name, ImportJobUnit.data_type == data_type)
+        return pd.read_sql(stmt, self.db_manager.engine)
+
+    def done_ranges(self, data_type: str, symbols: List[str] = None) -> pd.DataFrame:
+        """所有任务中已完成单元的 (symbol, start_date, end_date)，这些日期已向数据源请求过"""
+        stmt = select(ImportJobUnit.symbol, ImportJobUnit.start_date, ImportJobUnit.end_date)\
+            .where(ImportJobUnit.data_type == data_type, ImportJobUnit.status == UNIT_DONE)
+        if symbols:
+            stmt = stmt.where(ImportJobUnit.symbol.in_(symbols))
+        return pd.read_sql(stmt, self.db_manager.engine)
+
+    def average_unit_seconds(self, data_type: str, sample: int = 1000) -> Optional[float]:
+        """最近完成的单元的平均耗时（秒），没有记录时为None"""
+        stmt = select(ImportJobUnit.started_at, ImportJobUnit.finished_at)\
+            .where(ImportJobUnit.data_type == data_type, ImportJobUnit.status == UNIT_DONE,
+                   ImportJobUnit.started_at.isnot(None), ImportJobUnit.finished_at.isnot(None))\
+            .order_by(ImportJobUnit.finished_at.desc()).limit(sample)
+        durations = pd.read_sql(stmt, self.db_manager.engine, parse_dates=['started_at', 'finished_at'])
+        if durations.empty:
+            return None
+        return float((durations['finished_at'] - durations['started_at']).dt.total_seconds().clip(lower=0).mean())
+
+    def summary(self, job_name: str = None) -> pd.DataFrame:
+        """按任务、数据类型、状态统计单元数和行数"""
+        try:
+            stmt = select(ImportJobUnit.job_name, ImportJobUnit.data_type, ImportJobUnit.status,
+                          func.count().label('units'), func.sum(ImportJobUnit.row_count).label('rows'))\
+                .group_by(ImportJobUnit.job_name, ImportJobUnit.data_type, ImportJobUnit.status)
+            if job_name:
+                stmt = stmt.where(ImportJobUnit.job_name == job_name)
+            return pd.read_sql(stmt, self.db_manager.engine)
+        except Exception as e:
+            logger.error(f"读取导入任务状态失败: {e}")
+            return pd.DataFrame()
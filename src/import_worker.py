@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+分布式导入工作进程模块
+
+多台主机各运行一个或多个工作进程，从 import_job_unit 表领取任务单元、获取数据并各自写入数据库：
+    - 每次领取 IMPORT_CLAIM_BATCH 个单元，领取时写入租约
+    - 后台线程每 1/3 租约时长心跳续约持有的单元
+    - 进程崩溃后租约到期，单元由其他工作进程重新领取
+    - 接口限频按IP计算，吞吐量随主机数近似线性增长
+"""
+import multiprocessing
+import threading
+from typing import Dict, List
+from loguru import logger
+
+from src.config import Config
+from src.import_jobs import make_worker_id
+
+
+class ImportWorker:
+    """导入工作进程"""
+
+    def __init__(self, importer=None, worker_id: str = None, batch_size: int = None,
+                 lease_seconds: float = None, poll_seconds: float = None):
+        """
+        Args:
+            importer: 批量导入器（提供各数据类型的单元处理函数），None时新建
+            worker_id: 工作进程标识，默认为 主机名:进程号
+            batch_size: 每次领取的单元数
+            lease_seconds: 租约时长（秒）
+            poll_seconds: 没有可领取的单元时的轮询间隔（秒）
+        """
+        if importer is None:
+            from src.batch_importer import BatchImporter
+            importer = BatchImporter()
+        self.importer = importer
+        self.job_store = importer.job_store
+        self.worker_id = worker_id or make_worker_id()
+        self.batch_size = batch_size or Config.IMPORT_CLAIM_BATCH
+        self.lease_seconds = lease_seconds or Config.IMPORT_LEASE_SECONDS
+        self.poll_seconds = poll_seconds or Config.IMPORT_POLL_SECONDS
+        self._held = set()
+        self._lock = threading.Lock()
+
+    def _heartbeat_loop(self, stop: threading.Event):
+        """定期为持有的单元续约"""
+        while not stop.wait(self.lease_seconds / 3):
+            # 持锁续约，期间不会有单元被标记结束，续约失败的单元即为租约已失效
+            with self._lock:
+                unit_ids = list(self._held)
+                try:
+                    renewed = self.job_store.heartbeat(self.worker_id, unit_ids, self.lease_seconds)
+                except Exception as e:
+                    logger.error(f"工作进程 {self.worker_id} 心跳失败: {e}")
+                    continue
+            if renewed < len(unit_ids):
+                logger.warning(f"工作进程 {self.worker_id} 有 {len(unit_ids) - renewed} 个单元的租约已失效")
+
+    def run(self, job_name: str = None, data_types: List[str] = None, wait: bool = False,
+            stop_event: threading.Event = None) -> Dict[str, int]:
+        """
+        领取并执行任务单元
+
+        Args:
+            job_name: 只处理该任务的单元，None表示所有任务
+            data_types: 只处理这些数据类型的单元，None表示全部
+            wait: True时持续等待新的单元（常驻进程），False时所有单元结束后退出
+            stop_event: 外部停止信号
+
+        Returns:
+            本进程处理的单元数、保存的记录数和失败的单元数
+        """
+        stop_event = stop_event or threading.Event()
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(heartbeat_stop,),
+                                     name='import-heartbeat', daemon=True)
+        heartbeat.start()
+        stats = {'units': 0, 'rows': 0, 'failed': 0}
+        logger.info(f"工作进程 {self.worker_id} 启动，任务: {job_name or '全部'}")
+
+        try:
+            while not stop_event.is_set():
+                units = self.job_store.claim_units(self.worker_id, job_name, data_types,
+                                                   limit=self.batch_size, lease_seconds=self.lease_seconds)
+                if not units:
+                    # 其他进程持有的单元可能因崩溃而租约到期，所有单元结束前继续轮询
+                    if not wait and self.job_store.unfinished_count(job_name, data_types) == 0:
+                        break
+                    delay = self.poll_seconds
+                    retry_delay = self.job_store.next_retry_delay(job_name)
+                    if retry_delay is not None:
+                        delay = min(delay, max(retry_delay, 0.1))
+                    stop_event.wait(delay)
+                    continue
+
+                with self._lock:
+                    self._held.update(unit['id'] for unit in units)
+                for unit in units:
+                    if stop_event.is_set():
+                        break
+                    self._process(unit, stats)
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+
+        logger.info(f"工作进程 {self.worker_id} 结束: 完成 {stats['units']} 个单元，"
+                    f"{stats['rows']} 条记录，失败 {stats['failed']} 个单元")
+        return stats
+
+    def _process(self, unit: Dict, stats: Dict[str, int]):
+        handler = self.importer.unit_handlers[unit['data_type']]
+        try:
+            row_count, error = handler(unit), None
+        except Exception as e:
+            row_count, error = 0, e
+
+        with self._lock:
+            self._held.discard(unit['id'])
+            if error is None:
+                if self.job_store.mark_done(unit['id'], row_count, self.worker_id):
+                    stats['units'] += 1
+                    stats['rows'] += row_count
+                else:
+                    logger.warning(f"单元 {unit['id']} 的租约已被其他工作进程接管，结果已写入但不更新状态")
+                return
+            stats['failed'] += 1
+            logger.error(f"单元 {unit['id']} {unit['data_type']} {unit['symbol']} "
+                         f"{unit['start_date']}~{unit['end_date']} 失败: {error}")
+            self.job_store.mark_failed(unit['id'], unit['attempts'], str(error), self.worker_id)
+
+
+def _worker_process(job_name: str, data_types: List[str], wait: bool):
+    """子进程入口"""
+    Config.setup_logging()
+    ImportWorker().run(job_name=job_name, data_types=data_types, wait=wait)
+
+
+def run_workers(count: int, job_name: str = None, data_types: List[str] = None, wait: bool = False) -> int:
+    """
+    在本机启动多个工作进程（每个进程独立连接数据库）
+
+    Returns:
+        异常退出的进程数
+    """
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_worker_process, args=(job_name, data_types, wait),
+                                 name=f'import-worker-{i}')
+                 for i in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return sum(1 for process in processes if process.exitcode != 0)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+任务执行模块
+
+调度器到点后把任务提交到线程池执行，主循环不被长任务阻塞：
+    - 同一任务同时只运行一个实例，上一次仍在运行时本次触发记为 skipped
+    - 每个任务有超时时间，超时后记录为 timeout 并写入系统日志告警
+      （Python线程无法强制终止，超时任务继续运行到结束，期间仍占用该任务的运行锁，避免重复堆积）
+    - 每次运行记录计划时间、实际开始时间、启动延迟和运行时长（job_run 表）
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from loguru import logger
+
+from src.metrics import get_registry
+from src.tracing import span
+
+STATUS_RUNNING = 'running'
+STATUS_SUCCESS = 'success'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+STATUS_SKIPPED = 'skipped'
+
+_metrics = get_registry()
+JOB_SECONDS = _metrics.histogram('job_duration_seconds', '定时任务运行时长（秒）', ['job'])
+JOB_RUNS = _metrics.counter('job_runs', '定时任务运行次数', ['job', 'status'])
+JOB_START_DELAY = _metrics.histogram('job_start_delay_seconds', '定时任务启动延迟（秒）', ['job'])
+JOB_RUNNING = _metrics.gauge('jobs_running', '正在运行的定时任务数')
+
+
+class JobRunner:
+    """线程池任务执行器"""
+
+    def __init__(self, data_storage=None, max_workers: int = None):
+        """
+        Args:
+            data_storage: 用于记录运行历史的数据存储器，None表示不记录
+            max_workers: 线程数，默认为已注册任务数（每个任务最多一个运行实例，互不阻塞）
+        """
+        self.data_storage = data_storage
+        self.max_workers = max_workers
+        self._jobs: Dict[str, Dict] = {}
+        self._running: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        JOB_RUNNING.labels().set_function(lambda: len(self._running))
+
+    def register(self, name: str, func: Callable, timeout: float = None):
+        """注册任务，timeout为超时时间（秒），None表示不限制"""
+        self._jobs[name] = {'func': func, 'timeout': timeout}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            workers = self.max_workers or max(len(self._jobs), 1)
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        return self._executor
+
+    def is_running(self, name: str) -> bool:
+        with self._lock:
+            return name in self._running
+
+    def submit(self, name: str, scheduled_at: datetime = None) -> bool:
+        """
+        提交任务执行
+
+        Args:
+            name: 任务名称
+            scheduled_at: 计划执行时间，用于计算启动延迟
+
+        Returns:
+            是否已提交（任务仍在运行时不提交）
+        """
+        job = self._jobs[name]
+        now = datetime.now()
+        scheduled_at = scheduled_at or now
+
+        with self._lock:
+            if name in self._running:
+                running = self._running[name]
+                logger.warning(f"任务 {name} 仍在运行（已运行 {time.monotonic() - running['started']:.0f} 秒），跳过本次触发")
+                skipped = True
+            else:
+                skipped = False
+                self._running[name] = {
+                    'run_id': None,
+                    'started': time.monotonic(),
+                    'deadline': time.monotonic() + job['timeout'] if job['timeout'] else None,
+                    'timed_out': False,
+                }
+
+        if skipped:
+            JOB_RUNS.labels(name, STATUS_SKIPPED).inc()
+            self._record_start(name, scheduled_at, now, STATUS_SKIPPED)
+            return False
+
+        run_id = self._record_start(name, scheduled_at, now, STATUS_RUNNING)
+        with self._lock:
+            self._running[name]['run_id'] = run_id
+
+        latency = (now - scheduled_at).total_seconds()
+        JOB_START_DELAY.labels(name).observe(max(latency, 0.0))
+        logger.info(f"任务 {name} 开始执行，启动延迟 {latency:.3f} 秒")
+        self._get_executor().submit(self._execute, name, job['func'])
+        return True
+
+    def _execute(self, name: str, func: Callable):
+        """在线程池中执行任务并记录结果"""
+        status, error = STATUS_SUCCESS, None
+        try:
+            with span(f'job.{name}'):
+                func()
+        except Exception as e:
+            status, error = STATUS_FAILED, str(e)
+            logger.error(f"任务 {name} 执行失败: {e}")
+        finally:
+            with self._lock:
+                running = self._running.pop(name, None)
+            if running is None:
+                return
+            duration = time.monotonic() - running['started']
+            if running['timed_out'] or (running['deadline'] and time.monotonic() > running['deadline']):
+                status = STATUS_TIMEOUT
+            logger.info(f"任务 {name} 结束: {status}, 耗时 {duration:.1f} 秒")
+            JOB_SECONDS.labels(name).observe(duration)
+            JOB_RUNS.labels(name, status).inc()
+            self._record_finish(running['run_id'], status, duration, error)
+
+    def check_timeouts(self) -> Optional[float]:
+        """
+        检查超时任务（调度主循环调用）
+
+        Returns:
+            距离下一个未超时任务截止时间的秒数，没有时为None
+        """
+        now = time.monotonic()
+        expired = []
+        next_deadline = None
+
+        with self._lock:
+            for name, running in self._running.items():
+                if running['deadline'] is None or running['timed_out']:
+                    continue
+                if now >= running['deadline']:
+                    running['timed_out'] = True
+                    expired.append((name, running['run_id'], now - running['started']))
+                else:
+                    remaining = running['deadline'] - now
+                    next_deadline = remaining if next_deadline is None else min(next_deadline, remaining)
+
+        for name, run_id, elapsed in expired:
+            message = f"任务 {name} 运行超时（已运行 {elapsed:.0f} 秒，限制 {self._jobs[name]['timeout']:.0f} 秒）"
+            logger.error(message)
+            if self.data_storage is not None:
+                self.data_storage.save_system_log("ERROR", message, "job_runner", name)
+                self.data_storage.update_job_run(run_id, status=STATUS_TIMEOUT)
+
+        return next_deadline
+
+    def _record_start(self, name: str, scheduled_at: datetime, started_at: datetime, status: str) -> Optional[int]:
+        if self.data_storage is None:
+            return None
+        return self.data_storage.start_job_run(name, scheduled_at, started_at, status)
+
+    def _record_finish(self, run_id: Optional[int], status: str, duration: float, error: str = None):
+        if self.data_storage is None or run_id is None:
+            return
+        self.data_storage.update_job_run(run_id, status=status, finished_at=datetime.now(),
+                                         duration=duration, error_message=error)
+
+    def shutdown(self, wait: bool = False):
+        """停止线程池（wait=False时不等待运行中的任务）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+数据库日志异步批量写入模块
+
+日志记录先进入内存缓冲区，由后台线程按条数或时间间隔批量写入 system_log 表，
+调用方不再为每条日志承担一次数据库往返。缓冲区满时对重复日志做聚合计数，
+无法聚合的日志直接丢弃并计数，保证过载时不会拖慢业务线程。
+"""
+import atexit
+import threading
+from collections import deque, OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+from loguru import logger
+
+from src.config import Config
+from src.metrics import get_registry
+
+_metrics = get_registry()
+LOG_QUEUE_DEPTH = _metrics.gauge('log_sink_queue_depth', '等待写入数据库的日志条数')
+LOG_SINK_RECORDS = _metrics.gauge('log_sink_records', '数据库日志写入器累计处理的日志条数', ['result'])
+
+
+class DatabaseLogSink:
+    """数据库日志批量写入器"""
+
+    # 与 SystemLog 表字段长度保持一致
+    _FIELD_LIMITS = {'level': 10, 'module': 50, 'function': 50}
+
+    def __init__(self, db_manager=None, batch_size: int = None, flush_interval: float = None,
+                 max_queue_size: int = None, max_aggregate_keys: int = 1000):
+        if db_manager is None:
+            from database import db_manager
+        self.db_manager = db_manager
+        self.batch_size = batch_size or Config.LOG_DB_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.LOG_DB_FLUSH_INTERVAL
+        self.max_queue_size = max_queue_size or Config.LOG_DB_QUEUE_SIZE
+        self.max_aggregate_keys = max_aggregate_keys
+
+        self._buffer = deque()
+        # 过载时的重复日志聚合: key -> [record, count]
+        self._overflow = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+        self.stats = {'written': 0, 'aggregated': 0, 'dropped': 0, 'failed': 0}
+
+    def start(self):
+        """启动后台写入线程"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='db-log-sink', daemon=True)
+            self._thread.start()
+        return self
+
+    def emit(self, level: str, message: str, module: str = None, function: str = None,
+             created_at: datetime = None):
+        """写入一条日志（非阻塞）"""
+        record = {
+            'level': level,
+            'message': message,
+            'module': module,
+            'function': function,
+            'created_at': created_at or datetime.now()
+        }
+
+        with self._cond:
+            if len(self._buffer) < self.max_queue_size:
+                self._buffer.append(record)
+                if len(self._buffer) >= self.batch_size:
+                    self._cond.notify()
+                return
+
+            # 缓冲区已满，聚合重复日志，否则丢弃
+            key = (level, message, module, function)
+            if key in self._overflow:
+                self._overflow[key][1] += 1
+                self.stats['aggregated'] += 1
+            elif len(self._overflow) < self.max_aggregate_keys:
+                self._overflow[key] = [record, 1]
+            else:
+                self.stats['dropped'] += 1
+            self._cond.notify()
+
+    def __call__(self, message):
+        """作为loguru的sink使用"""
+        record = message.record
+        self.emit(
+            record['level'].name,
+            record['message'],
+            record['name'],
+            record['function'],
+            record['time'].replace(tzinfo=None)
+        )
+
+    def flush(self):
+        """立即写入缓冲区中的全部日志"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台线程并写入剩余日志"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def queue_size(self) -> int:
+        """当前缓冲的日志条数"""
+        with self._cond:
+            return len(self._buffer) + len(self._overflow)
+
+    def _run(self):
+        """后台线程：按条数或时间间隔批量写入"""
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                stopped = self._stopped
+
+            self.flush()
+
+            if stopped:
+                return
+
+    def _drain(self) -> List[Dict]:
+        """取出一批待写入的日志"""
+        with self._cond:
+            count = min(len(self._buffer), self.batch_size)
+            batch = [self._buffer.popleft() for _ in range(count)]
+
+            if len(batch) < self.batch_size and self._overflow:
+                while self._overflow and len(batch) < self.batch_size:
+                    _, (record, repeat) = self._overflow.popitem(last=False)
+                    if repeat > 1:
+                        record = dict(record, message=f"{record['message']} [重复 {repeat} 次]")
+                    batch.append(record)
+        return batch
+
+    def _write(self, batch: List[Dict]):
+        """多行插入写入数据库"""
+        from database.models import SystemLog
+
+        rows = []
+        for record in batch:
+            row = dict(record)
+            for field, limit in self._FIELD_LIMITS.items():
+                if row[field] is not None:
+                    row[field] = str(row[field])[:limit]
+            rows.append(row)
+
+        session = None
+        try:
+            session = self.db_manager.get_session()
+            session.execute(SystemLog.__table__.insert(), rows)
+            session.commit()
+            self.stats['written'] += len(rows)
+        except Exception as e:
+            # 本模块的日志不会回写数据库，避免递归
+            logger.error(f"批量写入系统日志失败，丢弃 {len(rows)} 条: {e}")
+            self.stats['failed'] += len(rows)
+            if session is not None:
+                session.rollback()
+        finally:
+            if session is not None:
+                session.close()
+
+
+_default_sink: Optional[DatabaseLogSink] = None
+_default_sink_lock = threading.Lock()
+
+
+def get_log_sink() -> DatabaseLogSink:
+    """获取全局日志写入器（首次调用时启动）"""
+    global _default_sink
+    with _default_sink_lock:
+        if _default_sink is None:
+            _default_sink = DatabaseLogSink().start()
+            LOG_QUEUE_DEPTH.labels().set_function(_default_sink.queue_size)
+            for result in _default_sink.stats:
+                LOG_SINK_RECORDS.labels(result).set_function(lambda result=result: _default_sink.stats[result])
+            atexit.register(_default_sink.stop)
+        return _default_sink
+
+
+def is_sink_record(record) -> bool:
+    """判断loguru记录是否来自本模块（这类记录不能再写回数据库）"""
+    return record['name'] == __name__
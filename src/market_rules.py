@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+A股市场规则模块
+
+交易时段、板块和涨跌幅限制等规则集中在这里，供分钟线聚合、数据校验、调度等模块共用
+"""
+from datetime import datetime, time, timedelta
+from typing import List, Optional, Tuple
+import numpy as np
+
+# 交易时段：9:30-11:30, 13:00-15:00
+MORNING_OPEN = time(9, 30)
+MORNING_CLOSE = time(11, 30)
+AFTERNOON_OPEN = time(13, 0)
+AFTERNOON_CLOSE = time(15, 0)
+
+# 每个半场的分钟数
+HALF_SESSION_MINUTES = 120
+
+# 收盘后补采的延迟（分钟），收盘集合竞价的成交在收盘后才完整可取
+SESSION_SWEEP_DELAY_MINUTES = 1
+
+_MORNING_OPEN_SECONDS = 9 * 3600 + 30 * 60
+_AFTERNOON_OPEN_SECONDS = 13 * 3600
+_HALF_SESSION_SECONDS = HALF_SESSION_MINUTES * 60
+
+
+def intraday_trigger_times(interval_minutes: int) -> List[Tuple[time, bool]]:
+    """
+    盘中采集的触发时间，对齐交易时段而不是从进程启动时刻起算
+
+    每个半场从开盘起每 interval_minutes 分钟触发一次（不含收盘时刻），
+    收盘后 SESSION_SWEEP_DELAY_MINUTES 分钟再补采一次。
+
+    Returns:
+        按时间排序的 [(触发时间, 是否为收盘补采)]
+    """
+    if interval_minutes <= 0:
+        raise ValueError(f"采集间隔必须为正数: {interval_minutes}")
+
+    triggers = []
+    for open_time, close_time in ((MORNING_OPEN, MORNING_CLOSE), (AFTERNOON_OPEN, AFTERNOON_CLOSE)):
+        day = datetime(2000, 1, 1)
+        current = datetime.combine(day, open_time)
+        close = datetime.combine(day, close_time)
+        while current < close:
+            triggers.append((current.time(), False))
+            current += timedelta(minutes=interval_minutes)
+        triggers.append(((close + timedelta(minutes=SESSION_SWEEP_DELAY_MINUTES)).time(), True))
+    return triggers
+
+
+def next_trigger_time(now: time, triggers: List[Tuple[time, bool]]) -> Optional[time]:
+    """当日下一个触发时间，今日已没有触发时为None"""
+    for trigger, _ in triggers:
+        if trigger > now:
+            return trigger
+    return None
+
+
+def seconds_of_day(trade_times: np.ndarray) -> np.ndarray:
+    """datetime64数组转换为当日秒数"""
+    trade_times = np.asarray(trade_times, dtype='datetime64[s]')
+    return (trade_times - trade_times.astype('datetime64[D]')).astype(np.int64)
+
+
+def session_bins(trade_times: np.ndarray, freq_minutes: int) -> np.ndarray:
+    """
+    计算成交时间所属的K线序号（跳过午间休市）
+
+    上午为 0 ~ n-1，下午为 n ~ 2n-1，n = 120 / freq_minutes。
+    9:30之前的集合竞价成交归入第一根K线，11:30和15:00的收盘成交归入各半场最后一根K线。
+    """
+    if HALF_SESSION_MINUTES % freq_minutes:
+        raise ValueError(f"K线周期必须能整除120分钟: {freq_minutes}")
+
+    seconds = seconds_of_day(trade_times)
+    width = freq_minutes * 60
+    per_half = HALF_SESSION_MINUTES // freq_minutes
+
+    afternoon = seconds >= _AFTERNOON_OPEN_SECONDS
+    morning_offset = np.clip(seconds - _MORNING_OPEN_SECONDS, 0, _HALF_SESSION_SECONDS)
+    afternoon_offset = np.clip(seconds - _AFTERNOON_OPEN_SECONDS, 0, _HALF_SESSION_SECONDS)
+
+    morning_bin = np.minimum(morning_offset // width, per_half - 1)
+    afternoon_bin = per_half + np.minimum(afternoon_offset // width, per_half - 1)
+    return np.where(afternoon, afternoon_bin, morning_bin)
+
+
+def bin_end_seconds(bins: np.ndarray, freq_minutes: int) -> np.ndarray:
+    """K线序号转换为K线结束时间（当日秒数），A股分钟线以结束时间标记"""
+    width = freq_minutes * 60
+    per_half = HALF_SESSION_MINUTES // freq_minutes
+    bins = np.asarray(bins, dtype=np.int64)
+    return np.where(
+        bins < per_half,
+        _MORNING_OPEN_SECONDS + (bins + 1) * width,
+        _AFTERNOON_OPEN_SECONDS + (bins - per_half + 1) * width
+    )
+
+
+# 板块
+BOARD_SH_MAIN = 'SH_MAIN'    # 上海主板 60xxxx
+BOARD_STAR = 'STAR'          # 科创板 68xxxx
+BOARD_SZ_MAIN = 'SZ_MAIN'    # 深圳主板 00xxxx
+BOARD_CHINEXT = 'CHINEXT'    # 创业板 30xxxx
+BOARD_BSE = 'BSE'            # 北京证券交易所 4xxxxx/8xxxxx/92xxxx
+BOARD_OTHER = 'OTHER'
+
+# 创业板注册制改革后涨跌幅限制由10%调整为20%
+CHINEXT_REFORM_DATE = np.datetime64('2020-08-24')
+
+# 新股上市初期不设涨跌幅限制的交易日数
+IPO_NO_LIMIT_DAYS = 5
+
+
+def _startswith_any(symbols: np.ndarray, prefixes) -> np.ndarray:
+    mask = np.zeros(len(symbols), dtype=bool)
+    for prefix in prefixes:
+        mask |= np.char.startswith(symbols, prefix)
+    return mask
+
+
+def board_of(symbols) -> np.ndarray:
+    """按股票代码前缀判断所属板块"""
+    symbols = np.asarray(symbols, dtype=str)
+    boards = np.full(len(symbols), BOARD_OTHER, dtype=object)
+    boards[_startswith_any(symbols, ('60', '90'))] = BOARD_SH_MAIN
+    boards[_startswith_any(symbols, ('68',))] = BOARD_STAR
+    boards[_startswith_any(symbols, ('00', '20'))] = BOARD_SZ_MAIN
+    boards[_startswith_any(symbols, ('30',))] = BOARD_CHINEXT
+    boards[_startswith_any(symbols, ('4', '8', '92'))] = BOARD_BSE
+    return boards
+
+
+def price_limit(symbols, trade_dates=None) -> np.ndarray:
+    """
+    涨跌幅限制比例（不考虑ST股票的5%限制和新股上市初期）
+
+    Args:
+        symbols: 股票代码数组
+        trade_dates: 交易日期数组，用于区分创业板改革前后，为空时按当前规则
+    """
+    boards = board_of(symbols)
+    limits = np.full(len(boards), 0.10)
+    limits[boards == BOARD_STAR] = 0.20
+    limits[boards == BOARD_BSE] = 0.30
+
+    chinext = boards == BOARD_CHINEXT
+    if trade_dates is None:
+        limits[chinext] = 0.20
+    else:
+        dates = np.asarray(trade_dates, dtype='datetime64[D]')
+        limits[chinext] = np.where(dates[chinext] >= CHINEXT_REFORM_DATE, 0.20, 0.10)
+    return limits
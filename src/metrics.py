@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标模块
+
+进程内的指标注册表（计数器、仪表盘、直方图，均支持标签），只依赖标准库：
+    - 数据获取：每个数据源/接口的请求耗时直方图、请求数、重试次数、获取行数、数据整理耗时
+    - 数据存储：各表写入行数、事务提交耗时
+    - 任务调度：任务和流水线阶段的运行时长、运行结果、写入队列和日志缓冲区深度
+指标可以通过本机HTTP端口以 Prometheus 文本格式抓取（/metrics，/metrics.json 为JSON），
+也可以在运行结束时写入JSON文件（METRICS_JSON_PATH），便于对比批量导入等一次性任务的耗时。
+"""
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from loguru import logger
+
+from src.config import Config
+
+# 耗时直方图的默认桶（秒），覆盖毫秒级的数据库提交到数分钟的批量任务
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+
+def _format_value(value: float) -> str:
+    """Prometheus 文本格式的数值"""
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Prometheus 文本格式的标签"""
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    """指标基类：按标签值保存子指标"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        """取得指定标签值的子指标（不存在时创建）"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {key}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        """没有标签的指标直接使用唯一的子指标"""
+        return self.labels()
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """(样本名, 标签, 数值) 列表"""
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child.samples():
+                samples.append((self.name + suffix, dict(labels, **extra), value))
+        return samples
+
+    def to_dict(self) -> Dict:
+        """JSON导出：每组标签一项"""
+        with self._lock:
+            children = list(self._children.items())
+        return {
+            'type': self.type_name,
+            'help': self.documentation,
+            'values': [dict(labels=dict(zip(self.labelnames, key)), **child.snapshot()) for key, child in children],
+        }
+
+
+class _CounterValue:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        with self._lock:
+            self._value += amount
+
+    def samples(self):
+        return [('_total', {}, self._value)]
+
+    def snapshot(self) -> Dict:
+        return {'value': self._value}
+
+
+class Counter(_Metric):
+    """只增不减的计数器（如请求数、写入行数）"""
+
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _GaugeValue:
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """抓取时调用 function 取值（如队列长度），None 表示恢复为手动设置的值"""
+        self._function = function
+
+    def get(self) -> float:
+        function = self._function
+        if function is not None:
+            try:
+                return float(function())
+            except Exception:
+                return math.nan
+        return self._value
+
+    def samples(self):
+        return [('', {}, self.get())]
+
+    def snapshot(self) -> Dict:
+        return {'value': self.get()}
+
+
+class Gauge(_Metric):
+    """可增可减的仪表盘（如队列深度、运行中的任务数）"""
+
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value: float):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            self._max = max(self._max, value)
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        """记录代码块的耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples, cumulative = [], 0
+        for bound, bucket_count in zip(self._buckets, counts):
+            cumulative += bucket_count
+            samples.append(('_bucket', {'le': _format_value(bound)}, cumulative))
+        samples.append(('_bucket', {'le': '+Inf'}, count))
+        samples.append(('_sum', {}, total))
+        samples.append(('_count', {}, count))
+        return samples
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts, total, count, maximum = list(self._counts), self._sum, self._count, self._max
+        return {
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else 0.0,
+            'max': maximum,
+            'buckets': {_format_value(bound): bucket_count for bound, bucket_count in zip(self._buckets, counts)
+                        if bucket_count},
+        }
+
+
+class Histogram(_Metric):
+    """耗时等数值的分布（累积桶、总和、次数）"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class MetricsRegistry:
+    """指标注册表（同名指标重复注册时返回已有的指标，模块可以在导入时注册）"""
+
+    def __init__(self, prefix: str = 'qf_'):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.started_at = datetime.now()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> _Metric:
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"指标 {name} 已注册为不同的类型或标签")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> Dict:
+        """全部指标的JSON结构"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'dumped_at': datetime.now().isoformat(timespec='seconds'),
+            'metrics': {metric.name: metric.to_dict() for metric in metrics},
+        }
+
+    def dump_json(self, path: str):
+        """写入JSON文件（先写临时文件再替换，中途退出不会留下不完整的文件）"""
+        try:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+            logger.info(f"运行指标已写入 {path}")
+        except Exception as e:
+            logger.error(f"写入运行指标失败: {e}")
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        """在后台线程启动HTTP服务：/metrics 为 Prometheus 文本格式，/metrics.json 为JSON"""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path in ('/', '/metrics'):
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(registry.to_dict(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 抓取请求很频繁，不写入日志
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"运行指标HTTP服务已启动: http://{host}:{self._server.server_port}/metrics")
+        return self._server
+
+    def stop(self):
+        """停止HTTP服务"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+_default_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """获取全局指标注册表"""
+    return _default_registry
+
+
+def start_metrics_server():
+    """按配置在后台启动指标HTTP服务（METRICS_PORT 为0时不启动，端口被占用时只告警）"""
+    if Config.METRICS_PORT <= 0:
+        return None
+    try:
+        return get_registry().serve(Config.METRICS_PORT, Config.METRICS_HOST)
+    except OSError as e:
+        logger.warning(f"运行指标HTTP服务启动失败（端口 {Config.METRICS_PORT}）: {e}")
+        return None
+
+
+_dump_paths = set()
+
+
+def dump_metrics_on_exit(path: str = None):
+    """进程退出时把指标写入JSON文件，默认路径为 METRICS_JSON_PATH（为空时不写入）"""
+    path = path or Config.METRICS_JSON_PATH
+    if path and path not in _dump_paths:
+        _dump_paths.add(path)
+        atexit.register(get_registry().dump_json, path)
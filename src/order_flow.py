@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+成交明细资金流汇总模块
+
+成交明细写入数据库时顺带计算每只股票每个交易日的资金流指标，写入 stock_order_flow 表：
+    - 成交笔数、成交量、成交额、VWAP、开高低收
+    - 主动买入/卖出/中性的成交量、成交额和笔数，买卖失衡度 (买量 - 卖量) / (买量 + 卖量)
+    - 大单（单笔成交额不低于 ORDER_FLOW_LARGE_AMOUNT）的买卖金额和笔数
+    - 日内成交量分布（每30分钟一档，共8档）
+汇总状态按 股票 × 交易日 保存，盘中每次轮询只把新成交并入已有状态，不重新扫描当日全部明细。
+盘中接口每次返回当日截至当前的全部成交，状态中记录已处理的最后成交时间及该时间的笔数，
+重复的成交不会被重复计入。进程重启后从汇总表恢复状态。
+同一水位也用于成交明细表：每次只写入水位之后的新成交（ingest），盘中轮询和收盘后补采的重复成交不会重复入库。
+写入时以事务中锁定读取的汇总行为准（saved 参数），多个线程或多台主机同时保存同一 股票 × 交易日 时不会重复写入。
+"""
+from datetime import date
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+from src.bar_resampler import BUY_DIRECTIONS, SELL_DIRECTIONS
+from src.market_rules import session_bins
+
+PROFILE_MINUTES = 30
+PROFILE_BINS = 240 // PROFILE_MINUTES
+
+# 累加字段
+SUM_COLUMNS = ['tick_count', 'volume', 'amount', 'buy_volume', 'sell_volume', 'neutral_volume',
+               'buy_amount', 'sell_amount', 'buy_count', 'sell_count',
+               'large_buy_amount', 'large_sell_amount', 'large_buy_count', 'large_sell_count']
+
+ORDER_FLOW_COLUMNS = ['symbol', 'trade_date'] + SUM_COLUMNS + [
+    'vwap', 'open_price', 'high_price', 'low_price', 'close_price', 'order_imbalance',
+    'volume_profile', 'last_trade_time', 'last_time_count']
+
+# 内存中最多保留的 股票 × 交易日 状态数，超出后淘汰最早交易日的状态（需要时从汇总表重新读取）
+MAX_CACHED_STATES = 20000
+
+
+def format_profile(profile: np.ndarray) -> str:
+    return ','.join(str(int(value)) for value in profile)
+
+
+def parse_profile(text: str) -> np.ndarray:
+    if not text:
+        return np.zeros(PROFILE_BINS, dtype=np.int64)
+    return np.array([int(value) for value in text.split(',')], dtype=np.int64)
+
+
+class OrderFlowAggregator:
+    """资金流增量汇总器"""
+
+    def __init__(self, large_order_amount: float = None, loader: Callable = None):
+        """
+        Args:
+            large_order_amount: 大单的单笔成交额阈值（元）
+            loader: loader(symbols, trade_dates) -> DataFrame，读取已保存的汇总，用于恢复状态
+        """
+        if large_order_amount is None:
+            from src.config import Config
+            large_order_amount = Config.ORDER_FLOW_LARGE_AMOUNT
+        self.large_order_amount = large_order_amount
+        self.loader = loader
+        self._states: Dict[Tuple[str, date], Dict] = {}
+
+    def _load_states(self, keys: List[Tuple[str, date]], saved: pd.DataFrame = None):
+        """
+        读取缓存中没有的状态（没有记录的为当日第一次处理）
+
+        Args:
+            saved: 已读取的汇总，指定时这些 股票 × 交易日 的状态全部以其为准，不使用缓存
+                （last_trade_time 为空的占位行视为当日第一次处理）
+        """
+        if saved is not None:
+            missing = list(keys)
+            for key in missing:
+                self._states.pop(key, None)
+        else:
+            missing = [key for key in keys if key not in self._states]
+            if not missing or self.loader is None:
+                return
+            saved = self.loader(sorted({key[0] for key in missing}), sorted({key[1] for key in missing}))
+        if saved is None or saved.empty:
+            return
+        wanted = set(missing)
+        for row in saved.to_dict('records'):
+            key = (row['symbol'], pd.Timestamp(row['trade_date']).date())
+            if key in wanted and not pd.isna(row['last_trade_time']):
+                row['trade_date'] = key[1]
+                row['last_trade_time'] = pd.Timestamp(row['last_trade_time'])
+                self._states[key] = {column: row[column] for column in ORDER_FLOW_COLUMNS}
+
+    def update(self, ticks: pd.DataFrame) -> pd.DataFrame:
+        """
+        把一批成交明细并入汇总状态
+
+        Args:
+            ticks: 成交明细，需包含 symbol, trade_time, price, volume, amount, direction 列
+
+        Returns:
+            有新成交的 股票 × 交易日 的完整汇总（用于写入汇总表）；内存状态在 remember 后才更新
+        """
+        return self.ingest(ticks)[1]
+
+    def ingest(self, ticks: pd.DataFrame, saved: pd.DataFrame = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        按已处理水位筛选新成交并计算汇总
+
+        Args:
+            ticks: 成交明细
+            saved: 写入事务中锁定读取的汇总行，指定时以其中的水位为准（见 _load_states）
+
+        Returns:
+            (新成交明细（保持原始行顺序，用于写入成交明细表）, 有新成交的 股票 × 交易日 的完整汇总)
+        """
+        if ticks is None or ticks.empty:
+            return ticks, pd.DataFrame(columns=ORDER_FLOW_COLUMNS)
+
+        symbol_codes, symbols = pd.factorize(ticks['symbol'])
+        trade_times = pd.to_datetime(ticks['trade_time']).values.astype('datetime64[s]')
+        days = trade_times.astype('datetime64[D]')
+
+        # 按股票、日期、时间稳定排序，同一秒内保持原始成交顺序
+        order = np.lexsort((trade_times, days, symbol_codes))
+        symbol_codes, trade_times, days = symbol_codes[order], trade_times[order], days[order]
+
+        group_start = np.empty(len(order), dtype=bool)
+        group_start[0] = True
+        group_start[1:] = (symbol_codes[1:] != symbol_codes[:-1]) | (days[1:] != days[:-1])
+        group_ids = np.cumsum(group_start) - 1
+        starts = np.flatnonzero(group_start)
+        keys = [(symbols[code], pd.Timestamp(day).date())
+                for code, day in zip(symbol_codes[starts], days[starts])]
+        self._load_states(keys, saved)
+
+        # 已处理位置：最后成交时间之后的成交，以及最后成交时间上超出已处理笔数的成交
+        last_times = np.array([self._states[key]['last_trade_time'].to_datetime64() if key in self._states
+                               else np.datetime64('NaT') for key in keys], dtype='datetime64[s]')
+        last_counts = np.array([self._states[key]['last_time_count'] if key in self._states else 0
+                                for key in keys], dtype=np.int64)
+
+        run_start = group_start.copy()
+        run_start[1:] |= trade_times[1:] != trade_times[:-1]
+        run_starts = np.flatnonzero(run_start)
+        rank_in_second = np.arange(len(order)) - run_starts[np.cumsum(run_start) - 1]
+
+        watermark = last_times[group_ids]
+        keep = np.isnat(watermark) | (trade_times > watermark) \
+            | ((trade_times == watermark) & (rank_in_second >= last_counts[group_ids]))
+        if not keep.any():
+            return ticks.iloc[:0], pd.DataFrame(columns=ORDER_FLOW_COLUMNS)
+
+        order, group_ids, trade_times = order[keep], group_ids[keep], trade_times[keep]
+        new_ticks = ticks.iloc[np.sort(order)]
+        price = ticks['price'].to_numpy(dtype=np.float64)[order]
+        volume = ticks['volume'].to_numpy(dtype=np.float64)[order]
+        amount = ticks['amount'].to_numpy(dtype=np.float64)[order]
+        direction = ticks['direction'].to_numpy()[order]
+
+        boundary = np.empty(len(order), dtype=bool)
+        boundary[0] = True
+        boundary[1:] = group_ids[1:] != group_ids[:-1]
+        starts = np.flatnonzero(boundary)
+        ends = np.append(starts[1:], len(order)) - 1
+        batch_groups = group_ids[starts]
+
+        is_buy = np.isin(direction, BUY_DIRECTIONS)
+        is_sell = np.isin(direction, SELL_DIRECTIONS)
+        is_large = amount >= self.large_order_amount
+
+        def total(values):
+            return np.add.reduceat(values, starts)
+
+        batch = {
+            'tick_count': ends - starts + 1,
+            'volume': total(volume),
+            'amount': total(amount),
+            'buy_volume': total(np.where(is_buy, volume, 0.0)),
+            'sell_volume': total(np.where(is_sell, volume, 0.0)),
+            'neutral_volume': total(np.where(is_buy | is_sell, 0.0, volume)),
+            'buy_amount': total(np.where(is_buy, amount, 0.0)),
+            'sell_amount': total(np.where(is_sell, amount, 0.0)),
+            'buy_count': total(is_buy.astype(np.int64)),
+            'sell_count': total(is_sell.astype(np.int64)),
+            'large_buy_amount': total(np.where(is_buy & is_large, amount, 0.0)),
+            'large_sell_amount': total(np.where(is_sell & is_large, amount, 0.0)),
+            'large_buy_count': total((is_buy & is_large).astype(np.int64)),
+            'large_sell_count': total((is_sell & is_large).astype(np.int64)),
+        }
+        price_volume = total(price * volume)
+        high = np.maximum.reduceat(price, starts)
+        low = np.minimum.reduceat(price, starts)
+
+        profile = np.zeros((len(starts), PROFILE_BINS), dtype=np.int64)
+        segment = np.cumsum(boundary) - 1
+        np.add.at(profile, (segment, session_bins(trade_times, PROFILE_MINUTES)), volume.astype(np.int64))
+
+        # 批次最后一秒的成交笔数（用于下次轮询时跳过已处理的成交）
+        last_second = trade_times[ends]
+        tail_counts = total((trade_times == last_second[segment]).astype(np.int64))
+
+        rows = []
+        for i, group in enumerate(batch_groups):
+            key = keys[group]
+            state = self._states.get(key)
+            row = {'symbol': key[0], 'trade_date': key[1]}
+            for column in SUM_COLUMNS:
+                row[column] = batch[column][i] + (state[column] if state else 0)
+
+            if state:
+                pv = price_volume[i] + (state['vwap'] or 0.0) * state['volume']
+                row['open_price'] = state['open_price']
+                row['high_price'] = max(state['high_price'], high[i])
+                row['low_price'] = min(state['low_price'], low[i])
+                row['volume_profile'] = format_profile(parse_profile(state['volume_profile']) + profile[i])
+                same_second = last_second[i] == state['last_trade_time'].to_datetime64()
+                row['last_time_count'] = tail_counts[i] + (state['last_time_count'] if same_second else 0)
+            else:
+                pv = price_volume[i]
+                row['open_price'] = price[starts[i]]
+                row['high_price'] = high[i]
+                row['low_price'] = low[i]
+                row['volume_profile'] = format_profile(profile[i])
+                row['last_time_count'] = tail_counts[i]
+
+            row['close_price'] = price[ends[i]]
+            row['vwap'] = pv / row['volume'] if row['volume'] > 0 else row['close_price']
+            directional = row['buy_volume'] + row['sell_volume']
+            row['order_imbalance'] = (row['buy_volume'] - row['sell_volume']) / directional if directional > 0 else 0.0
+            row['last_trade_time'] = pd.Timestamp(last_second[i])
+            rows.append(row)
+
+        result = pd.DataFrame(rows, columns=ORDER_FLOW_COLUMNS)
+        int_columns = [column for column in SUM_COLUMNS if column.endswith(('count', 'volume'))]
+        result[int_columns] = result[int_columns].astype(np.int64)
+        return new_ticks, result
+
+    def remember(self, flows: pd.DataFrame):
+        """汇总写入数据库成功后更新内存状态"""
+        for row in flows.to_dict('records'):
+            self._states[(row['symbol'], row['trade_date'])] = row
+
+        if len(self._states) > MAX_CACHED_STATES:
+            # 淘汰最早交易日的状态，保留一半
+            keep = sorted(self._states, key=lambda key: key[1], reverse=True)[:MAX_CACHED_STATES // 2]
+            self._states = {key: self._states[key] for key in keep}
+
+    def forget(self):
+        """清空内存状态（写入失败时调用，下次从汇总表恢复）"""
+        self._states = {}
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+有向无环图任务流水线模块
+
+收盘后的处理拆分为声明了依赖关系的阶段，由线程池按依赖执行：
+    - 依赖全部成功的阶段立即提交，互不依赖的阶段并行执行
+    - 每个阶段单独重试（指数退避），失败或跳过的阶段的下游阶段记为跳过
+    - 阶段抛出 StageSkip 表示无需继续（如非交易日），下游阶段同样跳过
+    - 阶段之间通过共享的 context 字典传递结果；阶段在 context 中取不到上游结果时应从数据库读取，
+      以便单独重跑某些阶段（run(only=[...])）
+    - 每次运行输出各阶段的开始时间、等待时间、耗时和关键路径（决定总耗时的依赖链）
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+from loguru import logger
+
+from src.job_runner import STATUS_RUNNING
+from src.metrics import get_registry
+from src.tracing import span
+
+STAGE_PENDING = 'pending'
+STAGE_SUCCESS = 'success'
+STAGE_FAILED = 'failed'
+STAGE_SKIPPED = 'skipped'
+
+_metrics = get_registry()
+STAGE_SECONDS = _metrics.histogram('pipeline_stage_seconds', '流水线阶段运行时长（秒，含重试）', ['pipeline', 'stage'])
+STAGE_RUNS = _metrics.counter('pipeline_stage_runs', '流水线阶段运行次数', ['pipeline', 'stage', 'status'])
+
+
+class StageSkip(Exception):
+    """阶段无需执行，下游阶段一并跳过"""
+
+
+class Stage:
+    """流水线阶段"""
+
+    def __init__(self, name: str, func: Callable[[Dict], object], deps: Iterable[str] = (),
+                 retries: int = 0, retry_delay: float = 5.0):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+
+class Pipeline:
+    """阶段流水线"""
+
+    def __init__(self, name: str, max_workers: int = 4, data_storage=None):
+        """
+        Args:
+            name: 流水线名称
+            max_workers: 并行执行的阶段数
+            data_storage: 用于把各阶段的运行记录写入 job_run 表（任务名称为 流水线名称.阶段名称），None表示不记录
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.data_storage = data_storage
+        self.stages: Dict[str, Stage] = {}
+        self._scheduled_at = None
+
+    def add_stage(self, name: str, func: Callable[[Dict], object], deps: Iterable[str] = (),
+                  retries: int = 0, retry_delay: float = 5.0) -> 'Pipeline':
+        """添加阶段，依赖的阶段需要先添加"""
+        if name in self.stages:
+            raise ValueError(f"阶段重复: {name}")
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"阶段 {name} 依赖的阶段不存在: {missing}")
+        self.stages[name] = Stage(name, func, deps, retries, retry_delay)
+        return self
+
+    def _run_stage(self, stage: Stage, context: Dict, record: Dict):
+        """执行阶段（含重试），结果写入 context[阶段名称]"""
+        record['start'] = time.monotonic()
+        record['started_at'] = datetime.now()
+        run_id = self._record_start(stage.name, record)
+
+        # 重试期间状态保持pending，主循环只根据最终状态决定下游阶段
+        status = STAGE_FAILED
+        for attempt in range(stage.retries + 1):
+            record['attempts'] = attempt + 1
+            try:
+                with span(f'stage.{stage.name}'):
+                    context[stage.name] = stage.func(context)
+                status, record['error'] = STAGE_SUCCESS, None
+                break
+            except StageSkip as e:
+                status, record['error'] = STAGE_SKIPPED, str(e)
+                logger.info(f"阶段 {stage.name} 跳过: {e}")
+                break
+            except Exception as e:
+                record['error'] = str(e)
+                if attempt < stage.retries:
+                    delay = stage.retry_delay * 2 ** attempt
+                    logger.warning(f"阶段 {stage.name} 失败，{delay:.0f} 秒后第 {attempt + 1} 次重试: {e}")
+                    time.sleep(delay)
+                else:
+                    logger.error(f"阶段 {stage.name} 失败: {e}")
+
+        record['end'] = time.monotonic()
+        record['status'] = status
+        STAGE_SECONDS.labels(self.name, stage.name).observe(record['end'] - record['start'])
+        STAGE_RUNS.labels(self.name, stage.name, status).inc()
+        self._record_finish(run_id, record)
+
+    def run(self, context: Dict = None, only: List[str] = None) -> Dict[str, Dict]:
+        """
+        执行流水线
+
+        Args:
+            context: 初始上下文（阶段之间共享）
+            only: 只执行这些阶段，其余阶段视为已完成（用于单独重跑失败的阶段）
+
+        Returns:
+            各阶段的运行记录：status, attempts, error, wait（等待依赖和线程的秒数）, duration, start, end（相对开始时间）
+        """
+        context = context if context is not None else {}
+        if only:
+            unknown = set(only) - set(self.stages)
+            if unknown:
+                raise ValueError(f"阶段不存在: {sorted(unknown)}")
+        selected = [name for name in self.stages if not only or name in only]
+
+        origin = time.monotonic()
+        self._scheduled_at = datetime.now()
+        records = {name: {'status': STAGE_PENDING, 'attempts': 0, 'error': None} for name in selected}
+        ready_at = {}
+        futures = {}
+
+        def dep_status(name: str) -> str:
+            # 未选中的阶段视为已成功
+            return records[name]['status'] if name in records else STAGE_SUCCESS
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name) as executor:
+            while True:
+                # 阶段按添加顺序（即拓扑顺序）遍历，一次遍历即可把跳过传递到所有下游
+                for name in selected:
+                    if records[name]['status'] != STAGE_PENDING or name in futures:
+                        continue
+                    states = [dep_status(dep) for dep in self.stages[name].deps]
+                    if any(state in (STAGE_FAILED, STAGE_SKIPPED) for state in states):
+                        records[name]['status'] = STAGE_SKIPPED
+                        records[name]['error'] = '上游阶段失败或跳过'
+                    elif all(state == STAGE_SUCCESS for state in states):
+                        ready_at[name] = time.monotonic()
+                        futures[name] = executor.submit(self._run_stage, self.stages[name], context, records[name])
+
+                running = [future for future in futures.values() if not future.done()]
+                if not running:
+                    for name, future in futures.items():
+                        if records[name]['status'] == STAGE_PENDING:
+                            records[name]['status'] = STAGE_FAILED
+                            records[name]['error'] = str(future.exception())
+                    if all(record['status'] != STAGE_PENDING for record in records.values()):
+                        break
+                    continue
+                wait(running, return_when=FIRST_COMPLETED)
+
+        for name, record in records.items():
+            if 'end' in record:
+                record['wait'] = record['start'] - ready_at[name]
+                record['duration'] = record['end'] - record['start']
+                record['start'] -= origin
+                record['end'] -= origin
+        self._log_report(records)
+        return records
+
+    def critical_path(self, records: Dict[str, Dict]) -> List[str]:
+        """
+        关键路径：从最后结束的阶段开始，逐级回溯最晚结束的依赖阶段
+
+        关键路径上的阶段缩短后总耗时才会缩短
+        """
+        executed = {name: record for name, record in records.items() if 'end' in record}
+        if not executed:
+            return []
+        path = [max(executed, key=lambda name: executed[name]['end'])]
+        while True:
+            deps = [dep for dep in self.stages[path[-1]].deps if dep in executed]
+            if not deps:
+                break
+            path.append(max(deps, key=lambda name: executed[name]['end']))
+        return path[::-1]
+
+    def _log_report(self, records: Dict[str, Dict]):
+        """输出各阶段耗时和关键路径"""
+        path = self.critical_path(records)
+        total = max((record['end'] for record in records.values() if 'end' in record), default=0.0)
+        lines = [f"流水线 {self.name} 完成，总耗时 {total:.1f} 秒"]
+        lines.append(f"{'阶段':<16}{'状态':<10}{'开始':>8}{'等待':>8}{'耗时':>9}{'次数':>6}  关键路径")
+        ordered = sorted(records.items(), key=lambda item: item[1].get('start', float('inf')) if 'end' in item[1]
+                         else float('inf'))
+        for name, record in ordered:
+            if 'end' in record:
+                lines.append(f"{name:<16}{record['status']:<10}{record['start']:>8.1f}{record['wait']:>8.1f}"
+                             f"{record['duration']:>9.1f}{record['attempts']:>6}  {'*' if name in path else ''}")
+            else:
+                lines.append(f"{name:<16}{record['status']:<10}{'-':>8}{'-':>8}{'-':>9}{0:>6}")
+        if path:
+            lines.append(f"关键路径: {' -> '.join(path)}")
+        logger.info("\n".join(lines))
+
+    def _record_start(self, stage_name: str, record: Dict) -> Optional[int]:
+        if self.data_storage is None:
+            return None
+        return self.data_storage.start_job_run(f"{self.name}.{stage_name}", self._scheduled_at,
+                                               record['started_at'], STATUS_RUNNING)
+
+    def _record_finish(self, run_id: Optional[int], record: Dict):
+        if self.data_storage is None or run_id is None:
+            return
+        self.data_storage.update_job_run(run_id, status=record['status'], finished_at=datetime.now(),
+                                         duration=record['end'] - record['start'], error_message=record['error'])
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+复权计算模块
+
+数据库存储不复权日线和每只股票的后复权因子（只保留因子发生变化的日期），
+前复权/后复权价格在读取时向量化计算：
+    后复权价格 = 不复权价格 × 当日因子
+    前复权价格 = 不复权价格 × 当日因子 / 最新因子
+"""
+from typing import List
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ['open_price', 'high_price', 'low_price', 'close_price']
+
+
+def compress_factors(factors: pd.DataFrame) -> pd.DataFrame:
+    """只保留每只股票因子发生变化的日期（逐日因子压缩为除权除息日因子）"""
+    if factors.empty:
+        return factors
+
+    factors = factors.sort_values(['symbol', 'trade_date'], kind='mergesort')
+    symbols = factors['symbol'].to_numpy()
+    values = factors['adj_factor'].to_numpy(dtype=np.float64)
+
+    keep = np.ones(len(factors), dtype=bool)
+    keep[1:] = (symbols[1:] != symbols[:-1]) | ~np.isclose(values[1:], values[:-1], rtol=1e-9, atol=0)
+    return factors[keep].reset_index(drop=True)
+
+
+def factor_as_of(bars: pd.DataFrame, factors: pd.DataFrame) -> np.ndarray:
+    """
+    查找每根K线当日适用的复权因子
+
+    早于第一条因子记录的K线使用该股票的第一条因子，没有因子记录的股票因子为1
+    """
+    if factors.empty:
+        return np.ones(len(bars))
+
+    left = pd.DataFrame({
+        'symbol': bars['symbol'].to_numpy(),
+        'trade_date': pd.to_datetime(bars['trade_date']).to_numpy(),
+        '_pos': np.arange(len(bars))
+    }).sort_values('trade_date', kind='mergesort')
+    right = pd.DataFrame({
+        'symbol': factors['symbol'].to_numpy(),
+        'trade_date': pd.to_datetime(factors['trade_date']).to_numpy(),
+        'adj_factor': factors['adj_factor'].to_numpy(dtype=np.float64)
+    }).sort_values('trade_date', kind='mergesort')
+
+    merged = pd.merge_asof(left, right, on='trade_date', by='symbol', direction='backward')
+
+    first_factor = right.groupby('symbol')['adj_factor'].first()
+    result = merged['adj_factor'].fillna(merged['symbol'].map(first_factor)).fillna(1.0)
+
+    out = np.empty(len(bars))
+    out[merged['_pos'].to_numpy()] = result.to_numpy()
+    return out
+
+
+def adjust_prices(bars: pd.DataFrame, factors: pd.DataFrame, how: str = 'qfq',
+                  columns: List[str] = None) -> pd.DataFrame:
+    """
+    计算复权价格
+
+    Args:
+        bars: 不复权日线，包含 symbol, trade_date 和价格列
+        factors: 后复权因子，包含 symbol, trade_date, adj_factor 列
+        how: qfq为前复权，hfq为后复权
+        columns: 需要复权的价格列
+
+    Returns:
+        复权后的日线（新DataFrame，不修改输入）
+    """
+    if how not in ('qfq', 'hfq'):
+        raise ValueError(f"不支持的复权方式: {how}")
+
+    columns = [col for col in (columns or PRICE_COLUMNS) if col in bars.columns]
+    adjusted = bars.copy()
+    if bars.empty:
+        return adjusted
+
+    ratio = factor_as_of(bars, factors)
+
+    if how == 'qfq' and not factors.empty:
+        latest_factor = (
+            factors.sort_values('trade_date', kind='mergesort')
+            .groupby('symbol')['adj_factor'].last()
+        )
+        ratio = ratio / bars['symbol'].map(latest_factor).fillna(1.0).to_numpy()
+
+    for col in columns:
+        adjusted[col] = adjusted[col].to_numpy(dtype=np.float64) * ratio
+
+    return adjusted
+
+
+def detect_corporate_actions(today_bars: pd.DataFrame, prev_close: pd.Series,
+                             tolerance: float = 0.005) -> List[str]:
+    """
+    找出当日发生除权除息的股票
+
+    数据源的涨跌幅以除权后的参考价为基准计算，由收盘价和涨跌幅反推的昨收
+    与库中存储的不复权昨收不一致时，说明当日发生了除权除息，需要更新复权因子。
+
+    Args:
+        today_bars: 当日不复权日线，包含 symbol, close_price, pct_change 列
+        prev_close: 以股票代码为索引的前一交易日不复权收盘价
+        tolerance: 允许的相对误差
+    """
+    if today_bars.empty or prev_close.empty:
+        return []
+
+    close = today_bars['close_price'].to_numpy(dtype=np.float64)
+    pct_change = today_bars['pct_change'].to_numpy(dtype=np.float64)
+    stored_prev = today_bars['symbol'].map(prev_close).to_numpy(dtype=np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        implied_prev = close / (1 + pct_change / 100)
+        deviation = np.abs(implied_prev / stored_prev - 1)
+
+    mask = np.isfinite(deviation) & (deviation > tolerance)
+    return today_bars['symbol'].to_numpy()[mask].tolist()
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+价格面板模块
+
+把 stock_daily_data 维护为磁盘上的 日期 × 股票 稠密矩阵（每个字段一个文件），通过 np.memmap 打开，
+多个研究进程可以在毫秒级打开全市场历史，并通过操作系统页缓存共享内存。
+
+目录结构：
+    meta.json               交易日历、股票代码（列顺序）、容量和当前文件代数，原子替换
+    {field}.{gen}.bin       行为交易日、列为股票的C顺序矩阵，缺失值为NaN
+
+价格字段为后复权价格（历史值不随新的除权除息变化，适合增量追加），
+adj_factor 字段保存当日后复权因子，不复权价格 = 后复权价格 / adj_factor。
+按日期为主序存储，追加新交易日只需写入文件末尾的连续行；文件按容量预分配，
+股票数超出容量时整体重建为新一代文件，已打开旧文件的读取进程不受影响。
+面板只允许一个写入进程（收盘后的调度任务）。
+补缺口、重新导入和补采写入面板中已有交易日的日线时，追加前按 created_at 检测到这些记录并整体重建，
+重建后的文件代数变化，技术指标和协方差矩阵据此从头计算。
+"""
+import os
+import json
+from datetime import date, datetime
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.config import Config
+from src.price_adjust import factor_as_of
+
+# 字段名: (日线表列名, 存储类型)
+PANEL_FIELDS = {
+    'open': ('open_price', 'float32'),
+    'high': ('high_price', 'float32'),
+    'low': ('low_price', 'float32'),
+    'close': ('close_price', 'float32'),
+    'volume': ('volume', 'float64'),
+    'amount': ('amount', 'float64'),
+    'adj_factor': (None, 'float64'),
+}
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
+# 容量按块分配：股票数预留25%余量，交易日每次扩展一个块
+SYMBOL_BLOCK = 256
+DATE_BLOCK = 256
+
+META_FILE = 'meta.json'
+
+
+def _capacity(count: int, block: int, headroom: float = 1.0) -> int:
+    needed = max(1, int(np.ceil(count * headroom)))
+    return (needed + block - 1) // block * block
+
+
+class PricePanel:
+    """价格面板（只读）"""
+
+    def __init__(self, panel_dir: str = None):
+        self.panel_dir = panel_dir or Config.PRICE_PANEL_DIR
+        self.meta = None
+        self.dates = None
+        self.symbols = None
+        self._symbol_index = None
+        self._arrays = {}
+        self.refresh()
+
+    def refresh(self):
+        """重新读取元数据（写入进程追加新交易日后调用）"""
+        meta_path = os.path.join(self.panel_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"价格面板不存在，请先构建: {self.panel_dir}")
+
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if self.meta is None or meta['generation'] != self.meta['generation'] \
+                or meta['date_capacity'] != self.meta['date_capacity']:
+            self._arrays = {}
+
+        self.meta = meta
+        self.dates = np.array(meta['dates'], dtype='datetime64[D]')
+        self.symbols = np.array(meta['symbols'], dtype=object)
+        self._symbol_index = pd.Index(self.symbols)
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+    def field(self, name: str) -> np.ndarray:
+        """字段矩阵（日期 × 股票，只读内存映射视图）"""
+        if name not in PANEL_FIELDS:
+            raise ValueError(f"不支持的面板字段: {name}")
+
+        if name not in self._arrays:
+            self._arrays[name] = np.memmap(
+                os.path.join(self.panel_dir, f"{name}.{self.meta['generation']}.bin"),
+                dtype=PANEL_FIELDS[name][1],
+                mode='r',
+                shape=(self.meta['date_capacity'], self.meta['symbol_capacity'])
+            )
+        return self._arrays[name][:len(self.dates), :len(self.symbols)]
+
+    def date_slice(self, start_date: date = None, end_date: date = None) -> slice:
+        """日期范围对应的行切片"""
+        lo = 0 if start_date is None else int(np.searchsorted(self.dates, np.datetime64(start_date, 'D'), 'left'))
+        hi = len(self.dates) if end_date is None else \
+            int(np.searchsorted(self.dates, np.datetime64(end_date, 'D'), 'right'))
+        return slice(lo, hi)
+
+    def symbol_columns(self, symbols: List[str]) -> np.ndarray:
+        """股票代码对应的列号，不存在的股票为-1"""
+        return self._symbol_index.get_indexer(symbols)
+
+    def frame(self, name: str, start_date: date = None, end_date: date = None,
+              symbols: List[str] = None) -> pd.DataFrame:
+        """字段矩阵转换为DataFrame（行为交易日，列为股票代码）"""
+        rows = self.date_slice(start_date, end_date)
+        values = self.field(name)[rows]
+        columns = self.symbols
+        if symbols is not None:
+            indexer = self.symbol_columns(symbols)
+            indexer = indexer[indexer >= 0]
+            values = values[:, indexer]
+            columns = self.symbols[indexer]
+        return pd.DataFrame(np.asarray(values), index=pd.DatetimeIndex(self.dates[rows]), columns=columns)
+
+    def cross_section(self, trade_date: date = None, fields: List[str] = None) -> pd.DataFrame:
+        """某个交易日的全市场截面（默认最新交易日），索引为股票代码"""
+        if trade_date is None:
+            row = len(self.dates) - 1
+        else:
+            row = int(np.searchsorted(self.dates, np.datetime64(trade_date, 'D')))
+            if row >= len(self.dates) or self.dates[row] != np.datetime64(trade_date, 'D'):
+                raise KeyError(f"价格面板中没有交易日: {trade_date}")
+
+        fields = fields or list(PANEL_FIELDS)
+        return pd.DataFrame({name: np.asarray(self.field(name)[row]) for name in fields},
+                            index=pd.Index(self.symbols, name='symbol'))
+
+
+class PanelBuilder:
+    """价格面板构建器（单写入进程）"""
+
+    def __init__(self, panel_dir: str = None, data_storage=None):
+        if data_storage is None:
+            from src.data_storage import DataStorage
+            data_storage = DataStorage()
+        self.data_storage = data_storage
+        self.panel_dir = panel_dir or Config.PRICE_PANEL_DIR
+
+    def _path(self, name: str, generation: int) -> str:
+        return os.path.join(self.panel_dir, f"{name}.{generation}.bin")
+
+    def _read_meta(self) -> Optional[Dict]:
+        meta_path = os.path.join(self.panel_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, meta: Dict):
+        """原子替换元数据文件，读取进程只会看到完整写入的交易日"""
+        meta['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        meta_path = os.path.join(self.panel_dir, META_FILE)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+    def _open_arrays(self, meta: Dict, mode: str = 'r+') -> Dict[str, np.memmap]:
+        return {
+            name: np.memmap(self._path(name, meta['generation']), dtype=dtype, mode=mode,
+                            shape=(meta['date_capacity'], meta['symbol_capacity']))
+            for name, (_, dtype) in PANEL_FIELDS.items()
+        }
+
+    def _write_bars(self, arrays: Dict[str, np.memmap], bars: pd.DataFrame, factors: pd.DataFrame,
+                    dates: np.ndarray, symbol_index: pd.Index):
+        """把一批日线写入矩阵对应的行列"""
+        if bars.empty:
+            return
+        rows = np.searchsorted(dates, pd.to_datetime(bars['trade_date']).values.astype('datetime64[D]'))
+        cols = symbol_index.get_indexer(bars['symbol'])
+        factor = factor_as_of(bars, factors)
+
+        for name, (column, _) in PANEL_FIELDS.items():
+            if column is None:
+                values = factor
+            else:
+                values = bars[column].to_numpy(dtype=np.float64)
+                if name in PRICE_FIELDS:
+                    values = values * factor
+            arrays[name][rows, cols] = values
+
+    def build(self, start_date: date = None, chunk_days: int = 250) -> int:
+        """
+        全量构建价格面板（写入新一代文件，完成后切换元数据）
+
+        Args:
+            start_date: 面板起始日期，None表示全部历史
+            chunk_days: 每次从数据库读取的交易日数，控制内存占用
+
+        Returns:
+            交易日数
+        """
+        checked_at = self.data_storage.get_db_time()
+        trade_dates = self.data_storage.get_trade_dates(start_date)
+        symbols = self.data_storage.get_daily_symbols(start_date)
+        if not trade_dates:
+            logger.warning("没有日线数据，跳过构建价格面板")
+            return 0
+
+        os.makedirs(self.panel_dir, exist_ok=True)
+        old_meta = self._read_meta()
+        generation = old_meta['generation'] + 1 if old_meta else 1
+
+        meta = {
+            'generation': generation,
+            'date_capacity': _capacity(len(trade_dates), DATE_BLOCK),
+            'symbol_capacity': _capacity(len(symbols), SYMBOL_BLOCK, headroom=1.25),
+            'dates': [d.isoformat() for d in trade_dates],
+            'symbols': symbols,
+            'fields': {name: dtype for name, (_, dtype) in PANEL_FIELDS.items()},
+            # 此后写入的已有交易日的日线在下次追加时检测
+            'checked_at': checked_at.isoformat(),
+        }
+
+        arrays = self._open_arrays(meta, mode='w+')
+        for array in arrays.values():
+            array[:] = np.nan
+
+        dates = np.array(meta['dates'], dtype='datetime64[D]')
+        symbol_index = pd.Index(symbols)
+        factors = self.data_storage.get_adj_factors()
+
+        for start in range(0, len(trade_dates), chunk_days):
+            chunk = trade_dates[start:start + chunk_days]
+            bars = self.data_storage.get_daily_bars(start_date=chunk[0], end_date=chunk[-1])
+            self._write_bars(arrays, bars, factors, dates, symbol_index)
+            logger.info(f"价格面板构建进度: {min(start + chunk_days, len(trade_dates))}/{len(trade_dates)} 个交易日")
+
+        for array in arrays.values():
+            array.flush()
+        self._write_meta(meta)
+
+        if old_meta:
+            self._remove_generation(old_meta['generation'])
+
+        logger.info(f"价格面板构建完成: {len(trade_dates)} 个交易日 × {len(symbols)} 只股票")
+        return len(trade_dates)
+
+    def append(self) -> int:
+        """
+        增量追加面板最后一个交易日之后的日线
+
+        上次追加或构建之后面板中已有交易日的日线被写入过（补缺口、重新导入、补采）时整体重建
+
+        Returns:
+            追加的交易日数（重建时为面板的交易日数）
+        """
+        meta = self._read_meta()
+        if meta is None:
+            return self.build()
+
+        checked_at = self.data_storage.get_db_time()
+        first_date = date.fromisoformat(meta['dates'][0])
+        last_date = date.fromisoformat(meta['dates'][-1])
+        if meta.get('checked_at'):
+            rewritten = self.data_storage.get_daily_written_since(
+                datetime.fromisoformat(meta['checked_at']), first_date, last_date)
+            if rewritten is not None:
+                logger.info(f"价格面板中已有交易日的日线被重新写入（最早 {rewritten}），重建价格面板")
+                return self.build(start_date=first_date)
+
+        new_dates = [d for d in self.data_storage.get_trade_dates(start_date=last_date) if d > last_date]
+        meta['checked_at'] = checked_at.isoformat()
+        if not new_dates:
+            self._write_meta(meta)
+            logger.info("价格面板已是最新")
+            return 0
+
+        bars = self.data_storage.get_daily_bars(start_date=new_dates[0], end_date=new_dates[-1])
+        new_symbols = sorted(set(bars['symbol']) - set(meta['symbols']))
+        if len(meta['symbols']) + len(new_symbols) > meta['symbol_capacity']:
+            logger.info("股票数量超出价格面板容量，重建面板")
+            return self.build(start_date=first_date)
+
+        total_dates = len(meta['dates']) + len(new_dates)
+        if total_dates > meta['date_capacity']:
+            self._grow_dates(meta, _capacity(total_dates, DATE_BLOCK))
+
+        meta['dates'] = meta['dates'] + [d.isoformat() for d in new_dates]
+        meta['symbols'] = meta['symbols'] + new_symbols
+
+        arrays = self._open_arrays(meta)
+        factors = self.data_storage.get_adj_factors(bars['symbol'].unique().tolist())
+        self._write_bars(arrays, bars, factors, np.array(meta['dates'], dtype='datetime64[D]'),
+                         pd.Index(meta['symbols']))
+        for array in arrays.values():
+            array.flush()
+
+        # 数据写入完成后再发布元数据
+        self._write_meta(meta)
+        logger.info(f"价格面板追加 {len(new_dates)} 个交易日, 新增 {len(new_symbols)} 只股票")
+        return len(new_dates)
+
+    def _grow_dates(self, meta: Dict, date_capacity: int):
+        """扩展交易日容量：在文件末尾追加NaN行，已有数据和读取进程的映射不变"""
+        for name, (_, dtype) in PANEL_FIELDS.items():
+            row_bytes = meta['symbol_capacity'] * np.dtype(dtype).itemsize
+            nan_rows = np.full((date_capacity - meta['date_capacity'], meta['symbol_capacity']), np.nan, dtype=dtype)
+            with open(self._path(name, meta['generation']), 'r+b') as f:
+                f.seek(meta['date_capacity'] * row_bytes)
+                f.write(nan_rows.tobytes())
+        meta['date_capacity'] = date_capacity
+
+    def _remove_generation(self, generation: int):
+        """删除旧一代文件（已打开的读取进程仍可访问已映射的数据）"""
+        for name in PANEL_FIELDS:
+            try:
+                os.remove(self._path(name, generation))
+            except OSError:
+                pass
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+请求限速模块
+
+令牌桶限速器：令牌按固定速率补充，桶容量决定允许的突发请求数。
+多个线程共享同一个限速器时，总请求速率不超过设定值（数据源按IP限频，同一进程内的所有请求应共享限速）。
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """线程安全的令牌桶限速器"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: 每秒请求数，0或负数表示不限速
+            burst: 桶容量（允许连续发出的请求数）
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        获取令牌，不足时等待
+
+        Returns:
+            本次等待的秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 先扣减令牌（可以为负）再在锁外等待，等待中的线程按到达顺序排队
+            self._tokens -= tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+        return delay
@@ -3,8 +3,12 @@
 定时任务调度模块
 """
 import schedule
+import threading
 import time
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time as dt_time, timedelta
+from functools import partial
+from typing import List
+import pandas as pd
 from loguru import logger
 import os
 import sys
@@ -12,86 +16,251 @@ import sys
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from src.config import Config
 from src.data_fetcher import StockDataFetcher
 from src.data_storage import DataStorage
+from src.bar_resampler import BarResampler
+from src.price_adjust import detect_corporate_actions
+from src.price_panel import PanelBuilder, PricePanel
+from src.factor_engine import FactorEngine
+from src.covariance import CovarianceEngine
+from src.job_runner import JobRunner
+from src.pipeline import Pipeline, StageSkip, STAGE_FAILED
+from src.market_rules import intraday_trigger_times, next_trigger_time
+from src.batch_importer import BatchImporter
+from src.import_worker import ImportWorker
+from src.import_jobs import ImportJobStore
+from src.collect_priority import CollectionPrioritizer, DATA_TYPE_WEIGHTS, make_catchup_job_name
+from src.metrics import start_metrics_server
 
 
 class TaskScheduler:
     """任务调度器"""
     
+    # 各任务的超时时间（秒）
+    JOB_TIMEOUTS = {
+        'daily_data_collection': 4 * 3600,
+        'transaction_detail_collection': 25 * 60,
+        'transaction_close_sweep': 85 * 60,
+        'update_stock_list': 30 * 60,
+        'tick_archive': 4 * 3600,
+        'catchup_collection': 6 * 3600,
+    }
+    
+    # 收盘后日线和成交明细采集时间
+    DAILY_COLLECTION_TIME = dt_time(15, 30)
+    
+    # 盘中采集：每次采集用到下一个触发时间之前的这部分时间，剩余时间留作余量
+    POLL_BUDGET_RATIO = 0.8
+    # 单只股票采集耗时的指数加权平均系数
+    POLL_RATE_ALPHA = 0.3
+    
     def __init__(self):
         self.data_fetcher = StockDataFetcher()
         self.data_storage = DataStorage()
+        self.bar_resampler = BarResampler()
+        self.job_runner = JobRunner(self.data_storage)
+        self._stop_event = threading.Event()
+        self._due_at = {}
+        self._intraday_triggers = intraday_trigger_times(Config.TRANSACTION_TASK_INTERVAL)
+        # 盘中采集和收盘补采是两个任务，共用轮转位置和耗时估计，同一时间只允许一个执行
+        self._poll_lock = threading.Lock()
+        self._poll_cursor = 0
+        self._seconds_per_symbol = None
+        self.prioritizer = CollectionPrioritizer(self.data_fetcher, self.data_storage, ImportJobStore())
         logger.info("任务调度器初始化完成")
     
-    def daily_data_collection_task(self):
-        """每日数据采集任务"""
+    def build_daily_pipeline(self) -> Pipeline:
+        """
+        收盘后处理流水线：
+            calendar ─┬─ universe ─ ticks ─ rollups
+                      │                └──────────────┐
+                      └─ daily_snapshot ─ adj_factors ┴─ exports
+                                               └─ panel ─┬─ factors
+                                                         └─ covariance
+        成交明细采集（耗时最长）与日线、复权因子、价格面板、技术指标并行
+        """
+        pipeline = Pipeline('daily_pipeline', max_workers=Config.PIPELINE_WORKERS, data_storage=self.data_storage)
+        pipeline.add_stage('calendar', self._stage_calendar)
+        pipeline.add_stage('universe', self._stage_universe, deps=['calendar'], retries=2)
+        pipeline.add_stage('daily_snapshot', self._stage_daily_snapshot, deps=['calendar'], retries=2)
+        pipeline.add_stage('adj_factors', self._stage_adj_factors, deps=['daily_snapshot'], retries=2)
+        pipeline.add_stage('panel', self._stage_panel, deps=['adj_factors'], retries=1)
+        pipeline.add_stage('factors', self._stage_factors, deps=['panel'], retries=1)
+        pipeline.add_stage('covariance', self._stage_covariance, deps=['panel'], retries=1)
+        pipeline.add_stage('ticks', self._stage_ticks, deps=['universe'])
+        pipeline.add_stage('rollups', self._stage_rollups, deps=['ticks'], retries=1)
+        pipeline.add_stage('exports', self._stage_exports, deps=['adj_factors', 'ticks'], retries=1)
+        return pipeline
+    
+    def daily_data_collection_task(self, stages: List[str] = None):
+        """
+        每日数据采集任务
+        
+        Args:
+            stages: 只执行这些阶段（单独重跑失败的阶段），None表示全部
+        """
         try:
             logger.info("开始执行每日数据采集任务")
+            self.data_storage.validator.reset_metrics()
             
-            # 检查是否是交易日
-            if not self._is_trading_day():
-                logger.info("今日非交易日，跳过数据采集")
-                return
+            records = self.build_daily_pipeline().run(only=stages)
+            failed = [name for name, record in records.items() if record['status'] == STAGE_FAILED]
             
-            # 获取股票列表
-            logger.info("获取股票列表...")
-            stock_list = self.data_fetcher.get_stock_list()
-            if stock_list.empty:
-                logger.error("获取股票列表失败")
-                return
-            
-            # 保存股票基本信息（每日更新）
-            logger.info("保存股票基本信息...")
-            self.data_storage.save_stock_info(stock_list)
-            
-            # 获取今日日线数据
-            logger.info("获取今日日线数据...")
-            daily_data = self.data_fetcher.get_today_daily_data()
-            if not daily_data.empty:
-                self.data_storage.save_daily_data(daily_data)
-                logger.info(f"成功保存日线数据 {len(daily_data)} 条")
-            else:
-                logger.warning("今日没有日线数据")
-            
-            # 获取今日成交明细
-            logger.info("获取今日成交明细...")
-            transaction_details = self.data_fetcher.get_today_transaction_details()
-            if transaction_details:
-                self.data_storage.save_transaction_details(transaction_details)
-                total_records = sum(len(df) for df in transaction_details.values())
-                logger.info(f"成功保存成交明细数据 {total_records} 条")
+            logger.info(f"入库数据校验: {self.data_storage.validator.summary()}")
+            if failed:
+                message = f"每日数据采集任务部分阶段失败: {', '.join(failed)}"
+                logger.error(message)
+                self.data_storage.save_system_log("ERROR", message, "scheduler", "daily_data_collection_task")
             else:
-                logger.warning("今日没有成交明细数据")
-            
-            logger.info("每日数据采集任务完成")
+                logger.info("每日数据采集任务完成")
             
         except Exception as e:
             logger.error(f"每日数据采集任务失败: {e}")
             self.data_storage.save_system_log("ERROR", f"每日数据采集任务失败: {e}", "scheduler", "daily_data_collection_task")
+            raise
+        
+        # 有阶段失败时任务记为失败（job_run 表和运行指标）
+        if failed:
+            raise RuntimeError(message)
+    
+    def _stage_calendar(self, context):
+        """检查是否是交易日"""
+        if not self._is_trading_day():
+            raise StageSkip("今日非交易日，跳过数据采集")
+    
+    def _stage_universe(self, context) -> List[str]:
+        """获取股票列表并保存股票基本信息（每日更新）"""
+        stock_list = self.data_fetcher.get_stock_list()
+        if stock_list.empty:
+            raise RuntimeError("获取股票列表失败")
+        if not self.data_storage.save_stock_info(stock_list):
+            raise RuntimeError("保存股票基本信息失败")
+        return stock_list['symbol'].tolist()
+    
+    def _stage_daily_snapshot(self, context) -> pd.DataFrame:
+        """按优先级获取并保存今日日线数据，DAILY_BAR_DEADLINE 前来不及获取的股票推迟到夜间补采"""
+        symbols = context.get('universe') or self.data_fetcher.get_stock_list()['symbol'].tolist()
+        today = datetime.now().strftime('%Y%m%d')
+        daily_data = self.prioritizer.collect(
+            'daily', symbols, self._deadline(Config.DAILY_BAR_DEADLINE),
+            fetch=lambda symbol: self.data_fetcher.get_daily_data(symbol, today, today),
+            save=lambda frames: self.data_storage.save_daily_data(pd.concat(frames.values(), ignore_index=True)))
+        if not daily_data:
+            raise RuntimeError("今日没有日线数据")
+        daily_data = pd.concat(daily_data.values(), ignore_index=True)
+        logger.info(f"成功保存日线数据 {len(daily_data)} 条")
+        return daily_data
+    
+    def _stage_adj_factors(self, context):
+        """更新发生除权除息股票的复权因子"""
+        daily_data = context.get('daily_snapshot')
+        if daily_data is None:
+            today = date.today()
+            daily_data = self.data_storage.get_daily_bars(start_date=today, end_date=today)
+        self._update_adj_factors(daily_data)
+    
+    def _stage_panel(self, context):
+        """价格面板追加当日数据（依赖最新的复权因子）"""
+        PanelBuilder(data_storage=self.data_storage).append()
+    
+    def _stage_factors(self, context):
+        """增量计算当日技术指标"""
+        FactorEngine(data_storage=self.data_storage).update()
     
-    def transaction_detail_collection_task(self):
-        """成交明细采集任务（盘中执行）"""
+    def _stage_covariance(self, context):
+        """增量更新协方差矩阵"""
+        CovarianceEngine().update()
+    
+    def _stage_ticks(self, context) -> dict:
+        """获取并保存今日成交明细"""
+        symbols = context.get('universe') or self.data_fetcher.get_stock_list()['symbol'].tolist()
+        if Config.DISTRIBUTED_COLLECTION:
+            transaction_details = self._collect_transactions_distributed(symbols)
+        else:
+            # 按优先级获取，TICK_DEADLINE 前来不及获取的股票推迟到夜间补采
+            today = datetime.now().strftime('%Y%m%d')
+            transaction_details = self.prioritizer.collect(
+                'transaction', symbols, self._deadline(Config.TICK_DEADLINE),
+                fetch=lambda symbol: self.data_fetcher.get_transaction_detail(symbol, today),
+                save=self.data_storage.save_transaction_details)
+        if not transaction_details:
+            logger.warning("今日没有成交明细数据")
+        else:
+            logger.info(f"成功保存成交明细数据 {sum(len(df) for df in transaction_details.values())} 条")
+        return transaction_details
+    
+    def _stage_rollups(self, context):
+        """
+        由收盘后的完整成交明细聚合分钟K线
+        
+        单独重跑时从数据库读取当日成交明细：写入时按资金流水位去重，盘中轮询和收盘后采集的成交只保存一次
+        """
+        transaction_details = context.get('ticks')
+        if transaction_details is None:
+            today = date.today()
+            transaction_details = self.data_storage.get_transaction_details(start_date=today, end_date=today)
+        if len(transaction_details) == 0:
+            raise StageSkip("今日没有成交明细数据")
+        minute_bars = self.bar_resampler.resample_many(transaction_details)
+        if not self.data_storage.save_minute_bars(minute_bars):
+            raise RuntimeError("保存分钟K线失败")
+    
+    def _stage_exports(self, context):
+        """增量同步DuckDB分析库（未安装duckdb时跳过）"""
+        try:
+            from src.analytics import AnalyticsEngine
+            analytics = AnalyticsEngine()
+        except ImportError as e:
+            raise StageSkip(str(e))
         try:
-            logger.info("开始执行成交明细采集任务")
+            analytics.sync()
+        finally:
+            analytics.close()
+    
+    def transaction_detail_collection_task(self, sweep: bool = False):
+        """
+        成交明细采集任务（盘中按交易时段触发，含收盘后补采）
+        
+        Args:
+            sweep: 是否为收盘补采。补采按自己的超时时间确定可用时间（到下一次采集为止），
+                时间不够覆盖全部股票时只采集轮转到的部分，其余股票由午后的盘中采集
+                或15:30收盘后采集的成交明细阶段覆盖
+        
+        收盘补采等待仍在运行的盘中采集结束后开始；盘中采集遇到正在运行的收盘补采时跳过本次触发
+        """
+        if sweep:
+            if not self._poll_lock.acquire(timeout=self.JOB_TIMEOUTS['transaction_detail_collection']):
+                raise RuntimeError("等待盘中成交明细采集结束超时")
+        elif not self._poll_lock.acquire(blocking=False):
+            logger.warning("收盘补采正在运行，跳过本次成交明细采集")
+            return
+        
+        try:
+            logger.info(f"开始执行成交明细{'收盘补采' if sweep else '采集'}任务")
             
-            # 检查是否是交易日和交易时间
-            if not self._is_trading_time():
-                logger.info("当前非交易时间，跳过成交明细采集")
+            # 触发时间已对齐交易时段，这里只检查交易日
+            if not self._is_trading_day():
+                logger.info("今日非交易日，跳过成交明细采集")
                 return
             
             # 获取股票列表
             stock_list = self.data_fetcher.get_stock_list()
             if stock_list.empty:
-                logger.error("获取股票列表失败")
-                return
+                raise RuntimeError("获取股票列表失败")
             
-            # 获取成交明细（只获取部分活跃股票）
-            symbols = stock_list['symbol'].head(100).tolist()  # 限制数量避免请求过多
+            # 本次采集的股票数按下一个触发时间之前的可用时间确定，轮流覆盖全部股票
+            all_symbols = stock_list['symbol'].tolist()
+            symbols = self._next_poll_symbols(all_symbols, self._poll_budget(datetime.now(), sweep))
+            if sweep and len(symbols) < len(all_symbols):
+                logger.warning(f"收盘补采时间只够覆盖 {len(symbols)}/{len(all_symbols)} 只股票，其余股票由后续采集覆盖")
+            started = time.monotonic()
             transaction_details = self.data_fetcher.get_today_transaction_details(symbols)
+            self._update_poll_rate(time.monotonic() - started, len(symbols))
             
             if transaction_details:
-                self.data_storage.save_transaction_details(transaction_details)
+                if not self.data_storage.save_transaction_details(transaction_details):
+                    raise RuntimeError("保存成交明细数据失败")
                 total_records = sum(len(df) for df in transaction_details.values())
                 logger.info(f"成功保存成交明细数据 {total_records} 条")
             else:
@@ -102,6 +271,162 @@ class TaskScheduler:
         except Exception as e:
             logger.error(f"成交明细采集任务失败: {e}")
             self.data_storage.save_system_log("ERROR", f"成交明细采集任务失败: {e}", "scheduler", "transaction_detail_collection_task")
+            raise
+        finally:
+            self._poll_lock.release()
+    
+    def _collect_transactions_distributed(self, symbols) -> dict:
+        """
+        分布式采集今日成交明细：每只股票一个单元写入 import_job_unit 表（按采集优先级领取），
+        本机作为工作进程之一参与领取，其他主机运行 batch_import.py --worker --wait；
+        所有单元结束后从数据库读取当日成交明细（写入时已按资金流水位去重，不含盘中轮询的重复成交）
+        """
+        today = date.today()
+        job_name = f"daily_{today:%Y%m%d}"
+        importer = BatchImporter(self.data_fetcher, self.data_storage)
+        weights = self.prioritizer.symbol_weights(symbols) * DATA_TYPE_WEIGHTS['transaction']
+        created = importer.job_store.create_units(job_name, 'transaction',
+                                                  [(symbol, today, today) for symbol in symbols], resume=True,
+                                                  priorities=weights.to_dict())
+        logger.info(f"分布式采集任务 {job_name}: 新增 {created} 个单元，共 {len(symbols)} 只股票")
+        
+        ImportWorker(importer).run(job_name=job_name, stop_event=self._stop_event)
+        logger.info(f"分布式采集任务 {job_name} 结束:\n{importer.job_store.summary(job_name).to_string(index=False)}")
+        
+        details = self.data_storage.get_transaction_details(start_date=today, end_date=today)
+        return {symbol: frame for symbol, frame in details.groupby('symbol', sort=False)}
+    
+    def _poll_budget(self, now: datetime, sweep: bool = False) -> float:
+        """
+        本次盘中采集可用的秒数：到下一个触发时间（最后一次补采为收盘后采集时间）的一部分，
+        不超过任务超时时间（收盘补采使用补采任务的超时时间）
+        """
+        timeout = self.JOB_TIMEOUTS['transaction_close_sweep' if sweep else 'transaction_detail_collection']
+        next_trigger = next_trigger_time(now.time(), self._intraday_triggers) or self.DAILY_COLLECTION_TIME
+        available = min((datetime.combine(now.date(), next_trigger) - now).total_seconds(), timeout)
+        return max(available, 0.0) * self.POLL_BUDGET_RATIO
+    
+    def _next_poll_symbols(self, symbols, budget: float):
+        """
+        按单只股票采集耗时的估计值确定本次采集的股票数，从上次结束的位置继续轮转
+        
+        Args:
+            symbols: 全部股票代码
+            budget: 可用秒数
+        """
+        if not symbols:
+            return []
+        seconds_per_symbol = self._seconds_per_symbol or Config.REQUEST_DELAY
+        count = int(min(max(budget / seconds_per_symbol, 1), len(symbols)))
+        
+        start = self._poll_cursor % len(symbols)
+        selected = (symbols[start:] + symbols[:start])[:count]
+        self._poll_cursor = (start + count) % len(symbols)
+        logger.info(f"本次采集 {count}/{len(symbols)} 只股票（可用 {budget:.0f} 秒，"
+                    f"单只估计 {seconds_per_symbol:.2f} 秒）")
+        return selected
+    
+    def _update_poll_rate(self, elapsed: float, count: int):
+        """更新单只股票采集耗时的指数加权平均"""
+        if count <= 0:
+            return
+        observed = elapsed / count
+        if self._seconds_per_symbol is None:
+            self._seconds_per_symbol = observed
+        else:
+            self._seconds_per_symbol += self.POLL_RATE_ALPHA * (observed - self._seconds_per_symbol)
+    
+    def tick_archive_task(self):
+        """成交明细归档任务：把保留期之前的完整月份归档为本地文件并从数据库删除"""
+        try:
+            logger.info("开始执行成交明细归档任务")
+            results = self.data_storage.tick_archive.archive()
+            logger.info(f"成交明细归档任务完成: 归档 {results['files']} 个文件, {results['rows']} 条记录")
+        except Exception as e:
+            logger.error(f"成交明细归档任务失败: {e}")
+            self.data_storage.save_system_log("ERROR", f"成交明细归档任务失败: {e}", "scheduler", "tick_archive_task")
+            raise
+    
+    def catchup_collection_task(self):
+        """
+        夜间补采任务：执行收盘后采集推迟的单元，补采了日线时重建价格面板和衍生数据
+        
+        补采股票的分钟K线由数据库中的当日成交明细重新聚合，其中已有的盘中轮询成交在补采写入时按水位跳过，不会重复计入
+        """
+        try:
+            today = date.today()
+            job_name = make_catchup_job_name(today)
+            importer = BatchImporter(self.data_fetcher, self.data_storage)
+            if importer.job_store.unfinished_count(job_name) == 0:
+                logger.info(f"补采任务 {job_name} 没有待执行的单元")
+                return
+            
+            logger.info(f"开始执行补采任务 {job_name}")
+            ImportWorker(importer).run(job_name=job_name, stop_event=self._stop_event)
+            logger.info(f"补采任务 {job_name} 结束:\n{importer.job_store.summary(job_name).to_string(index=False)}")
+            
+            ticks = importer.job_store.unit_results(job_name, 'transaction')
+            symbols = ticks.loc[(ticks['status'] == 'done') & (ticks['row_count'] > 0), 'symbol'].tolist()
+            if symbols:
+                details = self.data_storage.get_transaction_details(symbols=symbols, start_date=today, end_date=today)
+                self.data_storage.save_minute_bars(self.bar_resampler.resample_many(details))
+            
+            daily = importer.job_store.unit_results(job_name, 'daily')
+            if (daily['status'] == 'done').any():
+                self._rebuild_daily_derivatives()
+            
+        except Exception as e:
+            logger.error(f"补采任务失败: {e}")
+            self.data_storage.save_system_log("ERROR", f"补采任务失败: {e}", "scheduler", "catchup_collection_task")
+            raise
+    
+    def _rebuild_daily_derivatives(self):
+        """
+        补采的日线属于价格面板中已有的交易日：追加时检测到重新写入的日线并重建价格面板，
+        技术指标和协方差矩阵随面板重建从头计算
+        """
+        daily_data = self.data_storage.get_daily_bars(start_date=date.today(), end_date=date.today())
+        self._update_adj_factors(daily_data)
+        try:
+            PricePanel()
+        except FileNotFoundError:
+            logger.info("价格面板不存在，跳过重建")
+            return
+        self._stage_panel(None)
+        self._stage_factors(None)
+        self._stage_covariance(None)
+    
+    @staticmethod
+    def _deadline(deadline_time: str) -> datetime:
+        """今日的截止时间"""
+        return datetime.combine(date.today(), datetime.strptime(deadline_time, '%H:%M').time())
+    
+    def _update_adj_factors(self, daily_data):
+        """增量更新复权因子：只获取当日除权除息和尚无因子记录的股票"""
+        today = date.today()
+        
+        if self.data_fetcher.data_source == 'tushare' and self.data_fetcher.pro:
+            # tushare一次请求即可获取全市场当日因子
+            factors = self.data_fetcher.get_adj_factors(trade_date=today.strftime('%Y%m%d'))
+            if not self.data_storage.save_adj_factors(factors):
+                raise RuntimeError("保存复权因子失败")
+            return
+        
+        prev_close = self.data_storage.get_prev_close(today)
+        symbols = set(detect_corporate_actions(daily_data, prev_close))
+        
+        known_symbols = set(self.data_storage.get_adj_factors()['symbol'])
+        symbols.update(set(daily_data['symbol']) - known_symbols)
+        
+        if not symbols:
+            logger.info("今日没有需要更新复权因子的股票")
+            return
+        
+        logger.info(f"更新 {len(symbols)} 只股票的复权因子")
+        for symbol in sorted(symbols):
+            factors = self.data_fetcher.get_adj_factors(symbol)
+            self.data_storage.save_adj_factors(factors)
+            time.sleep(0.1)
     
     def _is_trading_day(self) -> bool:
         """检查是否是交易日"""
@@ -117,41 +442,49 @@ class TaskScheduler:
         
         return True
     
-    def _is_trading_time(self) -> bool:
-        """检查是否是交易时间"""
-        now = datetime.now()
-        weekday = now.weekday()
-        
-        # 周末不是交易日
-        if weekday >= 5:
-            return False
-        
-        # 交易时间：9:30-11:30, 13:00-15:00
-        current_time = now.time()
-        morning_start = datetime.strptime("09:30", "%H:%M").time()
-        morning_end = datetime.strptime("11:30", "%H:%M").time()
-        afternoon_start = datetime.strptime("13:00", "%H:%M").time()
-        afternoon_end = datetime.strptime("15:00", "%H:%M").time()
-        
-        return (morning_start <= current_time <= morning_end) or \
-               (afternoon_start <= current_time <= afternoon_end)
+    def _add_job(self, job: schedule.Job, name: str, func):
+        """注册任务：到点后由调度主循环提交到线程池执行"""
+        self.job_runner.register(name, func, timeout=self.JOB_TIMEOUTS.get(name))
+        job.do(self._dispatch, name).tag(name)
+    
+    def _dispatch(self, name: str):
+        """提交任务到线程池，立即返回"""
+        self.job_runner.submit(name, self._due_at.pop(name, None))
     
     def setup_schedule(self):
         """设置定时任务"""
         try:
             # 每日收盘后执行数据采集（15:30）
-            schedule.every().day.at("15:30").do(self.daily_data_collection_task)
+            self._add_job(schedule.every().day.at(self.DAILY_COLLECTION_TIME.strftime("%H:%M")),
+                          'daily_data_collection', self.daily_data_collection_task)
             
-            # 交易时间内每30分钟执行一次成交明细采集
-            schedule.every(30).minutes.do(self.transaction_detail_collection_task)
+            # 盘中成交明细采集：从每个半场开盘起按间隔触发，收盘后补采一次（补采单独计时）
+            for trigger, sweep in self._intraday_triggers:
+                if sweep:
+                    self._add_job(schedule.every().day.at(trigger.strftime("%H:%M")), 'transaction_close_sweep',
+                                  partial(self.transaction_detail_collection_task, sweep=True))
+                else:
+                    self._add_job(schedule.every().day.at(trigger.strftime("%H:%M")), 'transaction_detail_collection',
+                                  self.transaction_detail_collection_task)
             
             # 每日开盘前更新股票列表（9:00）
-            schedule.every().day.at("09:00").do(self._update_stock_list)
+            self._add_job(schedule.every().day.at("09:00"), 'update_stock_list', self._update_stock_list)
+            
+            # 每日晚间归档保留期之前的成交明细（20:00）
+            self._add_job(schedule.every().day.at("20:00"), 'tick_archive', self.tick_archive_task)
+            
+            # 夜间补采收盘后采集推迟的单元
+            self._add_job(schedule.every().day.at(Config.CATCHUP_TASK_TIME), 'catchup_collection',
+                          self.catchup_collection_task)
             
             logger.info("定时任务设置完成")
             logger.info("- 每日15:30执行数据采集")
-            logger.info("- 交易时间每30分钟执行成交明细采集")
+            trigger_text = ", ".join(f"{trigger:%H:%M}{'(收盘补采)' if sweep else ''}"
+                                     for trigger, sweep in self._intraday_triggers)
+            logger.info(f"- 成交明细采集: {trigger_text}")
             logger.info("- 每日09:00更新股票列表")
+            logger.info("- 每日20:00归档历史成交明细")
+            logger.info(f"- 每日{Config.CATCHUP_TASK_TIME}补采收盘后推迟的股票")
             
         except Exception as e:
             logger.error(f"设置定时任务失败: {e}")
@@ -161,36 +494,57 @@ class TaskScheduler:
         try:
             logger.info("开始更新股票列表")
             stock_list = self.data_fetcher.get_stock_list()
-            if not stock_list.empty:
-                self.data_storage.save_stock_info(stock_list)
-                logger.info("股票列表更新完成")
-            else:
-                logger.error("获取股票列表失败")
+            if stock_list.empty:
+                raise RuntimeError("获取股票列表失败")
+            if not self.data_storage.save_stock_info(stock_list):
+                raise RuntimeError("保存股票列表失败")
+            logger.info("股票列表更新完成")
         except Exception as e:
             logger.error(f"更新股票列表失败: {e}")
+            raise
+    
+    def _run_due_jobs(self):
+        """提交所有到点的任务（提交后立即返回，不等待任务完成）"""
+        for job in sorted(job for job in schedule.jobs if job.should_run):
+            # 记录计划时间用于计算启动延迟，job.run() 之后next_run即更新为下一次
+            self._due_at[next(iter(job.tags))] = job.next_run
+            job.run()
     
     def run_scheduler(self):
-        """运行调度器"""
+        """运行调度器：休眠到下一个任务到点（或运行中任务的超时截止时间），不做固定间隔轮询"""
         try:
             logger.info("启动定时任务调度器")
             self.setup_schedule()
+            start_metrics_server()
             
-            while True:
-                schedule.run_pending()
-                time.sleep(60)  # 每分钟检查一次
+            while not self._stop_event.is_set():
+                self._run_due_jobs()
+                
+                timeout_wait = self.job_runner.check_timeouts()
+                idle = schedule.idle_seconds()
+                waits = [wait for wait in (idle, timeout_wait) if wait is not None]
+                wait = max(min(waits), 0) if waits else None
+                self._stop_event.wait(wait)
                 
         except KeyboardInterrupt:
             logger.info("收到中断信号，停止调度器")
         except Exception as e:
             logger.error(f"调度器运行失败: {e}")
+        finally:
+            self.job_runner.shutdown(wait=False)
+    
+    def stop(self):
+        """停止调度主循环（可在其他线程调用）"""
+        self._stop_event.set()
     
-    def run_once(self):
-        """执行一次数据采集（用于测试）"""
+    def run_once(self, stages: List[str] = None):
+        """执行一次数据采集（用于测试或单独重跑失败的阶段）"""
         try:
             logger.info("执行一次性数据采集")
-            self.daily_data_collection_task()
+            self.daily_data_collection_task(stages)
         except Exception as e:
             logger.error(f"一次性数据采集失败: {e}")
+            raise
 
 
 if __name__ == "__main__":
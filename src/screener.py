@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+全市场选股模块
+
+在内存中的最新截面（价格面板 + stock_daily_factor）上用NumPy计算选股表达式，例如：
+
+    close > ma20 and volume > 2 * volume_ma5 and pct_change > 5 and board == 'CHINEXT'
+    startswith(symbol, '30') and 3 < pct_change < 9.5
+
+表达式用Python语法书写，经 ast 解析后只允许白名单内的节点：
+    - 比较: < <= > >= == != in, 支持链式比较
+    - 逻辑: and or not
+    - 算术: + - * /, 一元负号
+    - 函数: abs(x), startswith(field, 'prefix')
+字段与常量的范围比较使用预先排序的索引二分查找（np.searchsorted），只访问命中的行；
+字段之间的比较逐元素向量化计算。缺失值（NaN）不满足任何比较，含缺失值的比较结果为未知，
+逻辑运算按三值逻辑处理：not 只翻转已知的行，停牌或退市股票的缺失字段不会因取反而命中。
+"""
+import ast
+import operator
+import warnings
+from datetime import date
+from typing import Callable, Dict, List
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from src.market_rules import board_of
+from src.price_panel import PricePanel, PRICE_FIELDS
+from src.factor_engine import FACTOR_COLUMNS
+
+# 截面字符串字段
+STRING_FIELDS = ('symbol', 'board')
+
+_COMPARE_OPS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+# 常量在左侧时翻转比较方向
+_MIRRORED = {ast.Lt: ast.Gt, ast.LtE: ast.GtE, ast.Gt: ast.Lt, ast.GtE: ast.LtE, ast.Eq: ast.Eq, ast.NotEq: ast.NotEq}
+
+
+class CrossSection:
+    """某个交易日的全市场截面，数值字段预先建立排序索引"""
+
+    def __init__(self, trade_date: date, symbols: np.ndarray, fields: Dict[str, np.ndarray]):
+        self.trade_date = trade_date
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.fields = {'symbol': self.symbols, 'board': board_of(self.symbols.astype(str))}
+        self.fields.update({name: np.asarray(values, dtype=np.float64) for name, values in fields.items()})
+
+        # 排序索引：{字段: (非NaN行号按值升序, 对应的有序值)}
+        self._sorted = {}
+        for name, values in self.fields.items():
+            if name in STRING_FIELDS:
+                continue
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind='mergesort')]
+            self._sorted[name] = (order, values[order])
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def field(self, name: str) -> np.ndarray:
+        if name not in self.fields:
+            raise ValueError(f"未知字段: {name}，可用字段: {', '.join(sorted(self.fields))}")
+        return self.fields[name]
+
+    def range_mask(self, name: str, op: type, value: float) -> np.ndarray:
+        """字段与常量比较，通过排序索引二分查找命中的行"""
+        if name not in self._sorted:
+            raise ValueError(f"字段 {name} 不支持范围比较")
+        order, values = self._sorted[name]
+
+        if op is ast.Gt:
+            hits = order[np.searchsorted(values, value, side='right'):]
+        elif op is ast.GtE:
+            hits = order[np.searchsorted(values, value, side='left'):]
+        elif op is ast.Lt:
+            hits = order[:np.searchsorted(values, value, side='left')]
+        elif op is ast.LtE:
+            hits = order[:np.searchsorted(values, value, side='right')]
+        elif op is ast.Eq:
+            hits = order[np.searchsorted(values, value, side='left'):np.searchsorted(values, value, side='right')]
+        else:
+            # 不等于：非NaN行中排除等于value的区间
+            lo, hi = np.searchsorted(values, value, side='left'), np.searchsorted(values, value, side='right')
+            hits = np.concatenate([order[:lo], order[hi:]])
+
+        mask = np.zeros(len(self), dtype=bool)
+        mask[hits] = True
+        return mask
+
+    @classmethod
+    def from_panel(cls, panel: PricePanel = None, data_storage=None, trade_date: date = None) -> 'CrossSection':
+        """
+        由价格面板和技术指标表构建截面
+
+        价格为当日不复权口径，pct_change为相对前一交易日的涨跌幅（%），
+        volume_ma5 为前5个交易日的平均成交量（不含当日）。
+        """
+        panel = panel or PricePanel()
+        if trade_date is None:
+            row = len(panel.dates) - 1
+        else:
+            row = panel.date_slice(end_date=trade_date).stop - 1
+        if row < 0:
+            raise ValueError("价格面板中没有可用的交易日")
+        as_of = pd.Timestamp(panel.dates[row]).date()
+
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            adj_factor = np.asarray(panel.field('adj_factor')[row], dtype=np.float64)
+            fields = {
+                name: np.asarray(panel.field(name)[row], dtype=np.float64) / adj_factor
+                for name in PRICE_FIELDS
+            }
+            fields['volume'] = np.asarray(panel.field('volume')[row], dtype=np.float64)
+            fields['amount'] = np.asarray(panel.field('amount')[row], dtype=np.float64)
+
+            close = panel.field('close')
+            fields['pct_change'] = (
+                (np.asarray(close[row], dtype=np.float64) / close[row - 1] - 1) * 100
+                if row > 0 else np.full(len(panel.symbols), np.nan)
+            )
+            fields['volume_ma5'] = np.nanmean(panel.field('volume')[max(0, row - 5):row], axis=0) \
+                if row > 0 else np.full(len(panel.symbols), np.nan)
+
+        factors = cls._load_factors(data_storage, as_of)
+        for name in FACTOR_COLUMNS:
+            if name in factors.columns:
+                fields[name] = factors[name].reindex(panel.symbols).to_numpy(dtype=np.float64)
+            else:
+                fields[name] = np.full(len(panel.symbols), np.nan)
+
+        # 当日没有交易的股票（停牌或未上市）不进入截面
+        traded = np.isfinite(fields['close'])
+        section = cls(as_of, panel.symbols[traded], {name: values[traded] for name, values in fields.items()})
+        logger.info(f"选股截面构建完成: {as_of}, {len(section)} 只股票")
+        return section
+
+    @staticmethod
+    def _load_factors(data_storage, trade_date: date) -> pd.DataFrame:
+        if data_storage is None:
+            from src.data_storage import DataStorage
+            data_storage = DataStorage()
+        factors = data_storage.get_daily_factors(start_date=trade_date, end_date=trade_date)
+        if factors.empty:
+            logger.warning(f"{trade_date} 没有技术指标数据，指标字段为空")
+            return pd.DataFrame()
+        return factors.drop_duplicates('symbol', keep='last').set_index('symbol')
+
+
+def _known(values) -> np.ndarray:
+    """值不是缺失值（NaN）的行"""
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        return ~np.isnan(values)
+    return np.ones(values.shape, dtype=bool)
+
+
+def _condition(result):
+    """
+    条件结果统一为 (命中, 已知) 两个布尔数组，命中的行一定已知
+
+    比较、逻辑运算返回该形式；函数或字段直接作为条件时缺失值为未知。
+    """
+    if isinstance(result, tuple):
+        return result
+    known = _known(result)
+    return np.asarray(result, dtype=bool) & known, known
+
+
+def _and(left, right):
+    """三值逻辑与：任一侧已知为假时结果已知为假"""
+    (left_hit, left_known), (right_hit, right_known) = left, right
+    known = (left_known & right_known) | (left_known & ~left_hit) | (right_known & ~right_hit)
+    return left_hit & right_hit, known
+
+
+def _or(left, right):
+    """三值逻辑或：任一侧命中时结果命中"""
+    (left_hit, left_known), (right_hit, right_known) = left, right
+    known = (left_known & right_known) | left_hit | right_hit
+    return left_hit | right_hit, known
+
+
+class _Compiler:
+    """把表达式AST编译为 fn(cross_section) -> ndarray 的闭包"""
+
+    def compile(self, expression: str) -> Callable:
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"选股表达式语法错误: {e.msg}: {expression}")
+        evaluate = self._visit(tree.body)
+
+        def resolve(cs):
+            result = evaluate(cs)
+            # 条件只保留已知命中的行
+            return result[0] if isinstance(result, tuple) else result
+        return resolve
+
+    def _visit(self, node) -> Callable:
+        method = getattr(self, f"_visit_{type(node).__name__}", None)
+        if method is None:
+            raise ValueError(f"选股表达式不支持: {ast.dump(node)}")
+        return method(node)
+
+    @staticmethod
+    def _constant(node):
+        """数值或字符串常量（含负数），非常量返回None"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) \
+                and not isinstance(node.value, bool):
+            return node.value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) \
+                and isinstance(node.operand, ast.Constant) and isinstance(node.operand.value, (int, float)):
+            return -node.operand.value
+        return None
+
+    def _visit_Constant(self, node):
+        value = self._constant(node)
+        if value is None:
+            raise ValueError(f"选股表达式不支持的常量: {node.value!r}")
+        return lambda cs: value
+
+    def _visit_Name(self, node):
+        name = node.id
+        return lambda cs: cs.field(name)
+
+    def _visit_BoolOp(self, node):
+        parts = [self._visit(value) for value in node.values]
+        combine = _and if isinstance(node.op, ast.And) else _or
+
+        def evaluate(cs):
+            result = _condition(parts[0](cs))
+            for part in parts[1:]:
+                result = combine(result, _condition(part(cs)))
+            return result
+        return evaluate
+
+    def _visit_UnaryOp(self, node):
+        operand = self._visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            def negate(cs):
+                # 未知的行（缺失值）取反后仍为未知
+                hit, known = _condition(operand(cs))
+                return ~hit & known, known
+            return negate
+        if isinstance(node.op, ast.USub):
+            return lambda cs: -operand(cs)
+        raise ValueError("选股表达式只支持 not 和负号")
+
+    def _visit_BinOp(self, node):
+        op = _BINARY_OPS.get(type(node.op))
+        if op is None:
+            raise ValueError("选股表达式只支持 + - * / 运算")
+        left, right = self._visit(node.left), self._visit(node.right)
+
+        def evaluate(cs):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return op(left(cs), right(cs))
+        return evaluate
+
+    def _visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ValueError("选股表达式只支持 abs(x) 和 startswith(field, 'prefix')")
+
+        if node.func.id == 'abs' and len(node.args) == 1:
+            argument = self._visit(node.args[0])
+            return lambda cs: np.abs(argument(cs))
+
+        if node.func.id == 'startswith' and len(node.args) == 2:
+            field = self._visit(node.args[0])
+            prefix = self._constant(node.args[1])
+            if not isinstance(prefix, str):
+                raise ValueError("startswith 的第二个参数必须是字符串")
+            return lambda cs: np.char.startswith(np.asarray(field(cs), dtype=str), prefix)
+
+        raise ValueError(f"选股表达式不支持的函数: {node.func.id}")
+
+    def _visit_Compare(self, node):
+        operands = [node.left] + node.comparators
+        parts = [self._compare(operands[i], op, operands[i + 1]) for i, op in enumerate(node.ops)]
+
+        def evaluate(cs):
+            result = parts[0](cs)
+            for part in parts[1:]:
+                result = _and(result, part(cs))
+            return result
+        return evaluate
+
+    def _compare(self, left, op, right) -> Callable:
+        """单个比较；数值字段与常量比较时使用排序索引"""
+        if isinstance(op, (ast.In, ast.NotIn)):
+            if not isinstance(right, (ast.Tuple, ast.List, ast.Set)):
+                raise ValueError("in 的右侧必须是常量列表，例如 board in ('STAR', 'CHINEXT')")
+            choices = [self._constant(element) for element in right.elts]
+            if any(choice is None for choice in choices):
+                raise ValueError("in 的右侧必须是常量列表")
+            field = self._visit(left)
+            negate = isinstance(op, ast.NotIn)
+
+            def contains(cs):
+                values = field(cs)
+                known = _known(values)
+                return (np.isin(values, choices) != negate) & known, known
+            return contains
+
+        op_type = type(op)
+        if op_type not in _COMPARE_OPS:
+            raise ValueError("选股表达式不支持的比较运算")
+
+        left_value, right_value = self._constant(left), self._constant(right)
+        if isinstance(left, ast.Name) and isinstance(right_value, (int, float)):
+            name, constant = left.id, float(right_value)
+        elif isinstance(right, ast.Name) and isinstance(left_value, (int, float)):
+            name, constant, op_type = right.id, float(left_value), _MIRRORED[op_type]
+        else:
+            name = None
+
+        if name is not None and name not in STRING_FIELDS:
+            return lambda cs: (cs.range_mask(name, op_type, constant), _known(cs.field(name)))
+
+        compare = _COMPARE_OPS[op_type]
+        left_fn, right_fn = self._visit(left), self._visit(right)
+
+        def evaluate(cs):
+            left_values, right_values = left_fn(cs), right_fn(cs)
+            known = np.broadcast_to(_known(left_values) & _known(right_values), (len(cs),))
+            with np.errstate(invalid='ignore'):
+                return np.asarray(compare(left_values, right_values), dtype=bool) & known, known
+        return evaluate
+
+
+class Screener:
+    """全市场选股器"""
+
+    def __init__(self, cross_section: CrossSection = None, panel: PricePanel = None, data_storage=None):
+        self.panel = panel
+        self.data_storage = data_storage
+        self.cross_section = cross_section
+        self._compiled = {}
+
+    def refresh(self, trade_date: date = None) -> CrossSection:
+        """重新构建截面（新交易日数据入库后调用）"""
+        if self.panel is not None:
+            self.panel.refresh()
+        self.cross_section = CrossSection.from_panel(self.panel, self.data_storage, trade_date)
+        return self.cross_section
+
+    def compile(self, expression: str) -> Callable:
+        """编译选股表达式（结果缓存）"""
+        if expression not in self._compiled:
+            self._compiled[expression] = _Compiler().compile(expression)
+        return self._compiled[expression]
+
+    def screen(self, expression: str, columns: List[str] = None, sort_by: str = None,
+               ascending: bool = False, limit: int = None) -> pd.DataFrame:
+        """
+        执行选股
+
+        Args:
+            expression: 选股表达式
+            columns: 结果中包含的字段，默认为 close, pct_change, volume, amount
+            sort_by: 排序字段
+            ascending: 是否升序
+            limit: 返回的最大股票数
+
+        Returns:
+            命中的股票，索引为股票代码
+        """
+        if self.cross_section is None:
+            self.refresh()
+        cs = self.cross_section
+
+        mask = np.asarray(self.compile(expression)(cs), dtype=bool)
+        if mask.shape != (len(cs),):
+            raise ValueError(f"选股表达式的结果不是条件: {expression}")
+        rows = np.flatnonzero(mask)
+
+        columns = list(columns or ['close', 'pct_change', 'volume', 'amount'])
+        if sort_by and sort_by not in columns:
+            columns.append(sort_by)
+        result = pd.DataFrame({name: cs.field(name)[rows] for name in columns},
+                              index=pd.Index(cs.symbols[rows], name='symbol'))
+
+        if sort_by:
+            result = result.sort_values(sort_by, ascending=ascending, na_position='last')
+        if limit:
+            result = result.head(limit)
+        return result
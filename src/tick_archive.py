@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+成交明细冷数据归档模块
+
+早于保留期的完整月份成交明细按 股票 × 月份 写入本地列式文件，并从数据库删除，
+减小 stock_transaction_detail 的索引规模。归档文件格式：
+
+    magic(4字节) | 头部长度(uint32) | JSON头部 | 按8字节对齐的列数据
+
+列数据依次为各列的连续数组（列式存储），使用窄类型：
+    seconds   uint32  距当月1日0点的秒数
+    price     int32   价格 × 1000
+    volume    int32   成交量
+    amount    float64 成交额
+    direction int8    成交方向在头部字典中的编号
+
+未压缩的文件通过 np.memmap 零拷贝读取；压缩文件的列数据整体zlib压缩，解压后用 np.frombuffer 读取。
+tick_archive_index 表记录每个归档文件，读取接口据此透明地合并归档数据和数据库数据。
+"""
+import os
+import json
+import struct
+import zlib
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sqlalchemy import select, delete, distinct, extract, and_
+
+from src.config import Config
+from database.models import StockTransactionDetail, TickArchiveIndex
+
+MAGIC = b'QTA1'
+_PREAMBLE = struct.Struct('<4sI')
+_ALIGN = 8
+
+PRICE_SCALE = 1000
+
+ARCHIVE_COLUMNS = [
+    ('seconds', '<u4'),
+    ('price', '<i4'),
+    ('volume', '<i4'),
+    ('amount', '<f8'),
+    ('direction', 'i1'),
+]
+
+TICK_COLUMNS = ['symbol', 'trade_date', 'trade_time', 'price', 'volume', 'amount', 'direction']
+
+
+def _aligned(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def encode_ticks(ticks: pd.DataFrame, month: date, compress: bool = True) -> bytes:
+    """把一只股票一个月的成交明细编码为归档文件内容"""
+    trade_times = pd.to_datetime(ticks['trade_time']).values.astype('datetime64[s]')
+    seconds = (trade_times - np.datetime64(month, 's')).astype(np.int64)
+    order = np.argsort(seconds, kind='mergesort')
+
+    direction_codes, directions = pd.factorize(ticks['direction'].to_numpy()[order])
+
+    arrays = {
+        'seconds': seconds[order],
+        'price': np.rint(ticks['price'].to_numpy(dtype=np.float64)[order] * PRICE_SCALE),
+        'volume': ticks['volume'].to_numpy(dtype=np.int64)[order],
+        'amount': ticks['amount'].to_numpy(dtype=np.float64)[order],
+        'direction': direction_codes,
+    }
+
+    columns = []
+    blocks = []
+    offset = 0
+    for name, dtype in ARCHIVE_COLUMNS:
+        block = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+        padded = _aligned(len(block))
+        columns.append({'name': name, 'dtype': dtype, 'offset': offset})
+        blocks.append(block + b'\0' * (padded - len(block)))
+        offset += padded
+
+    payload = b''.join(blocks)
+    if compress:
+        payload = zlib.compress(payload, 6)
+
+    header = json.dumps({
+        'rows': len(ticks),
+        'month': month.isoformat(),
+        'compressed': compress,
+        'columns': columns,
+        'directions': [str(value) for value in directions],
+    }).encode('utf-8')
+    preamble = _PREAMBLE.pack(MAGIC, len(header)) + header
+    return preamble + b'\0' * (_aligned(len(preamble)) - len(preamble)) + payload
+
+
+class TickArchive:
+    """成交明细归档存储"""
+
+    def __init__(self, archive_dir: str = None, db_manager=None, compress: bool = None):
+        if db_manager is None:
+            from database import db_manager
+        self.db_manager = db_manager
+        self.archive_dir = archive_dir or Config.TICK_ARCHIVE_DIR
+        self.compress = Config.TICK_ARCHIVE_COMPRESS if compress is None else compress
+
+    # ---------- 文件读写 ----------
+
+    def _write_file(self, symbol: str, month: date, ticks: pd.DataFrame, version: int) -> Tuple[str, int]:
+        """写入归档文件（先写临时文件再原子替换），返回相对路径和文件大小"""
+        rel_path = os.path.join(month.strftime('%Y%m'), f"{symbol}.v{version}.qta")
+        path = os.path.join(self.archive_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        content = encode_ticks(ticks, month, self.compress)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return rel_path, len(content)
+
+    def _open_columns(self, rel_path: str) -> Dict:
+        """打开归档文件，返回头部和各列数组（未压缩时为内存映射视图）"""
+        buffer = np.memmap(os.path.join(self.archive_dir, rel_path), dtype=np.uint8, mode='r')
+        magic, header_len = _PREAMBLE.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是有效的成交明细归档文件: {rel_path}")
+
+        header = json.loads(bytes(buffer[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+        data_offset = _aligned(_PREAMBLE.size + header_len)
+        rows = header['rows']
+
+        if header['compressed']:
+            payload = zlib.decompress(buffer[data_offset:])
+            base = 0
+        else:
+            payload = buffer
+            base = data_offset
+
+        columns = {
+            column['name']: np.frombuffer(payload, dtype=column['dtype'], count=rows,
+                                          offset=base + column['offset'])
+            for column in header['columns']
+        }
+        return {'header': header, 'columns': columns}
+
+    @staticmethod
+    def _row_range(header: Dict, seconds: np.ndarray, start_date: date = None, end_date: date = None):
+        """按日期范围在已排序的秒数列上二分查找行范围"""
+        month = date.fromisoformat(header['month'])
+        lo, hi = 0, len(seconds)
+        if start_date and start_date > month:
+            lo = int(np.searchsorted(seconds, (start_date - month).days * 86400, side='left'))
+        if end_date:
+            hi = int(np.searchsorted(seconds, ((end_date - month).days + 1) * 86400, side='left'))
+        return lo, max(lo, hi)
+
+    def read_file(self, rel_path: str, symbol: str, start_date: date = None,
+                  end_date: date = None) -> pd.DataFrame:
+        """读取归档文件中指定日期范围的成交明细"""
+        archive = self._open_columns(rel_path)
+        header, columns = archive['header'], archive['columns']
+        lo, hi = self._row_range(header, columns['seconds'], start_date, end_date)
+
+        month = np.datetime64(header['month'], 's')
+        trade_time = month + columns['seconds'][lo:hi].astype('timedelta64[s]')
+        directions = np.array(header['directions'] + [None], dtype=object)
+
+        return pd.DataFrame({
+            'symbol': symbol,
+            'trade_date': pd.to_datetime(trade_time.astype('datetime64[D]')).date,
+            'trade_time': pd.to_datetime(trade_time),
+            'price': columns['price'][lo:hi] / PRICE_SCALE,
+            'volume': columns['volume'][lo:hi].astype(np.int64),
+            'amount': columns['amount'][lo:hi].copy(),
+            'direction': directions[columns['direction'][lo:hi]],
+        }, columns=TICK_COLUMNS)
+
+    # ---------- 读取接口 ----------
+
+    def get_entries(self, symbols: List[str] = None, start_date: date = None,
+                    end_date: date = None) -> List[Dict]:
+        """查询与日期范围有交集的归档文件"""
+        stmt = select(TickArchiveIndex.symbol, TickArchiveIndex.file_path,
+                      TickArchiveIndex.start_date, TickArchiveIndex.end_date,
+                      TickArchiveIndex.row_count)
+        if symbols:
+            stmt = stmt.where(TickArchiveIndex.symbol.in_(symbols))
+        if start_date:
+            stmt = stmt.where(TickArchiveIndex.end_date >= start_date)
+        if end_date:
+            stmt = stmt.where(TickArchiveIndex.start_date <= end_date)
+
+        with self.db_manager.engine.connect() as conn:
+            rows = conn.execute(stmt.order_by(TickArchiveIndex.symbol, TickArchiveIndex.month)).mappings().all()
+        return [dict(row) for row in rows]
+
+    def read(self, symbols: List[str] = None, start_date: date = None, end_date: date = None) -> pd.DataFrame:
+        """读取归档的成交明细"""
+        frames = [
+            self.read_file(entry['file_path'], entry['symbol'], start_date, end_date)
+            for entry in self.get_entries(symbols, start_date, end_date)
+        ]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=TICK_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def count(self, trade_date: date = None) -> int:
+        """归档的成交笔数，指定日期时只读取秒数列统计"""
+        entries = self.get_entries(start_date=trade_date, end_date=trade_date)
+        if trade_date is None:
+            return sum(entry['row_count'] for entry in entries)
+
+        total = 0
+        for entry in entries:
+            archive = self._open_columns(entry['file_path'])
+            lo, hi = self._row_range(archive['header'], archive['columns']['seconds'], trade_date, trade_date)
+            total += hi - lo
+        return total
+
+    # ---------- 归档任务 ----------
+
+    @staticmethod
+    def default_cutoff(today: date = None, keep_months: int = None) -> date:
+        """归档截止日期：保留当月及之前 keep_months 个完整月份"""
+        today = today or date.today()
+        keep_months = Config.TICK_ARCHIVE_MONTHS if keep_months is None else keep_months
+        months = today.year * 12 + today.month - 1 - keep_months
+        return date(months // 12, months % 12 + 1, 1)
+
+    def archive(self, cutoff: date = None) -> Dict:
+        """
+        归档截止日期之前的全部成交明细
+
+        Args:
+            cutoff: 截止日期（会被调整为当月1日，只归档完整月份）
+
+        Returns:
+            归档统计 {'files': 文件数, 'rows': 记录数, 'failed': 失败数}
+        """
+        cutoff = _month_start(cutoff or self.default_cutoff())
+        table = StockTransactionDetail
+        stmt = select(
+            distinct(table.symbol), extract('year', table.trade_date), extract('month', table.trade_date)
+        ).where(table.trade_date < cutoff)
+
+        with self.db_manager.engine.connect() as conn:
+            pairs = conn.execute(stmt).all()
+
+        results = {'files': 0, 'rows': 0, 'failed': 0}
+        logger.info(f"开始归档 {cutoff} 之前的成交明细: {len(pairs)} 个股票月份")
+
+        for symbol, year, month in sorted(pairs):
+            try:
+                rows = self.archive_symbol_month(symbol, date(int(year), int(month), 1))
+                if rows:
+                    results['files'] += 1
+                    results['rows'] += rows
+            except Exception as e:
+                logger.error(f"归档股票 {symbol} {int(year)}-{int(month):02d} 成交明细失败: {e}")
+                results['failed'] += 1
+
+        logger.info(f"成交明细归档完成: {results}")
+        return results
+
+    def archive_symbol_month(self, symbol: str, month: date) -> int:
+        """
+        归档一只股票一个月的成交明细
+
+        新版本文件写入成功后，在同一事务中更新索引并删除数据库中的记录；
+        事务失败时索引仍指向旧版本文件，新文件在下次归档时被覆盖。
+        """
+        table = StockTransactionDetail
+        month_end = _next_month(month)
+        in_month = and_(table.symbol == symbol, table.trade_date >= month, table.trade_date < month_end)
+
+        session = self.db_manager.get_session()
+        try:
+            ticks = pd.read_sql(
+                select(table.id, *[getattr(table, col) for col in TICK_COLUMNS])
+                .where(in_month).order_by(table.trade_time, table.id),
+                session.connection()
+            )
+            if ticks.empty:
+                return 0
+            max_id = int(ticks['id'].max())
+
+            existing = session.query(TickArchiveIndex).filter(
+                TickArchiveIndex.symbol == symbol, TickArchiveIndex.month == month
+            ).one_or_none()
+            old_path = existing.file_path if existing else None
+            version = existing.version + 1 if existing else 1
+
+            merged = ticks[TICK_COLUMNS]
+            if existing:
+                merged = pd.concat([self.read_file(old_path, symbol), merged], ignore_index=True)
+
+            rel_path, file_size = self._write_file(symbol, month, merged, version)
+            trade_dates = pd.to_datetime(merged['trade_date'])
+
+            self.db_manager.upsert(session, TickArchiveIndex, [{
+                'symbol': symbol,
+                'month': month,
+                'start_date': trade_dates.min().date(),
+                'end_date': trade_dates.max().date(),
+                'row_count': len(merged),
+                'file_path': rel_path,
+                'file_size': file_size,
+                'version': version,
+            }], index_elements=['symbol', 'month'])
+            session.execute(delete(table).where(in_month, table.id <= max_id))
+            session.commit()
+
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        if old_path and old_path != rel_path:
+            try:
+                os.remove(os.path.join(self.archive_dir, old_path))
+            except OSError as e:
+                logger.warning(f"删除旧归档文件失败: {old_path}: {e}")
+
+        logger.debug(f"归档股票 {symbol} {month:%Y-%m} 成交明细 {len(ticks)} 条 -> {rel_path}")
+        return len(ticks)
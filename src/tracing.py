@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+耗时分段和性能剖析模块
+
+热点路径上的代码块用 span('名称') 包围（数据源请求、列转换、记录转换、事务提交、流水线阶段等）：
+    - 未启用时 span() 只做一次标志判断并返回共享的空上下文，对正常运行几乎没有开销
+    - 启用后按名称汇总调用次数、总耗时、自身耗时（扣除同一线程内嵌套的子分段）和最大耗时，
+      进程退出时输出各分段的汇总表
+    - --profile 同时启动性能剖析：cprofile 模式对所有线程做确定性剖析并保存 .prof 文件
+      （可用 snakeviz 等工具查看），sample 模式由后台线程定时采样所有线程的调用栈，
+      保存为折叠栈格式（可用 flamegraph.pl / speedscope 生成火焰图），对运行速度的影响更小
+"""
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional
+from loguru import logger
+
+from src.config import Config
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+_enabled = False
+_stats: Dict[str, List[float]] = {}
+_stats_lock = threading.Lock()
+_local = threading.local()
+_started_at = time.perf_counter()
+
+
+class _NoopSpan:
+    """未启用时的空分段（所有调用共享同一个实例）"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """计时分段：退出时把耗时计入名称对应的汇总，并从父分段的自身耗时中扣除"""
+
+    __slots__ = ('name', 'started', 'child_seconds')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.child_seconds = 0.0
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_seconds += elapsed
+        with _stats_lock:
+            # [次数, 总耗时, 自身耗时, 最大耗时]
+            stat = _stats.get(self.name)
+            if stat is None:
+                stat = _stats[self.name] = [0, 0.0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] += elapsed - self.child_seconds
+            if elapsed > stat[3]:
+                stat[3] = elapsed
+        return False
+
+
+def span(name: str):
+    """
+    计时分段
+
+    Examples:
+        with span('store.commit'):
+            session.commit()
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name)
+
+
+def traced(name: str):
+    """把整个函数作为一个分段的装饰器"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(report_at_exit: bool = True):
+    """启用分段计时（report_at_exit 为 True 时进程退出时输出汇总表）"""
+    global _enabled, _started_at
+    if _enabled:
+        return
+    _enabled = True
+    _started_at = time.perf_counter()
+    if report_at_exit:
+        atexit.register(log_summary)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    """清空已汇总的分段"""
+    with _stats_lock:
+        _stats.clear()
+
+
+def summary():
+    """
+    各分段的耗时汇总，按自身耗时降序
+
+    Returns:
+        span, calls, total_s, self_s, mean_ms, max_ms, self_pct（自身耗时占运行时长的百分比，多线程时合计可超过100）
+    """
+    # 入口脚本启动时就会导入本模块，pandas 只在输出汇总时导入
+    import pandas as pd
+
+    with _stats_lock:
+        rows = [(name, *stat) for name, stat in _stats.items()]
+    frame = pd.DataFrame(rows, columns=['span', 'calls', 'total_s', 'self_s', 'max_s'])
+    wall = max(time.perf_counter() - _started_at, 1e-9)
+    frame['mean_ms'] = frame['total_s'] / frame['calls'].clip(lower=1) * 1000
+    frame['max_ms'] = frame['max_s'] * 1000
+    frame['self_pct'] = frame['self_s'] / wall * 100
+    frame = frame.sort_values('self_s', ascending=False, kind='stable')
+    return frame[['span', 'calls', 'total_s', 'self_s', 'mean_ms', 'max_ms', 'self_pct']].reset_index(drop=True)
+
+
+def log_summary():
+    """输出分段汇总表"""
+    frame = summary()
+    if frame.empty:
+        logger.info("没有记录到耗时分段")
+        return
+    wall = time.perf_counter() - _started_at
+    table = frame.round({'total_s': 3, 'self_s': 3, 'mean_ms': 2, 'max_ms': 2, 'self_pct': 1}).to_string(index=False)
+    logger.info(f"耗时分段汇总（运行 {wall:.1f} 秒）\n{table}")
+
+
+class _ThreadProfiles:
+    """cProfile 只剖析启用它的线程：当前线程和之后启动的每个线程各用一个 Profile，结束时合并"""
+
+    def __init__(self):
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _new_profile(self) -> cProfile.Profile:
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+        return profile
+
+    def _thread_hook(self, frame, event, arg):
+        # threading.setprofile 的函数在新线程的第一个事件时调用，随后由该线程的 Profile 接管
+        self._new_profile()
+
+    def start(self):
+        threading.setprofile(self._thread_hook)
+        self._new_profile()
+
+    def stop(self, path: str) -> str:
+        threading.setprofile(None)
+        with self._lock:
+            profiles = list(self._profiles)
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            try:
+                stats.add(profile)
+            except TypeError:
+                # 线程在第一个事件前结束时 Profile 为空
+                continue
+        stats.dump_stats(path)
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats('cumulative').print_stats(30)
+        return output.getvalue()
+
+
+class _StackSampler:
+    """后台线程定时采样所有线程的调用栈，按折叠栈格式计数"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self, path: str) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        # 各函数出现在栈中的样本数（含调用的子函数）
+        inclusive = Counter()
+        for stack, count in self.samples.items():
+            for name in set(stack.split(';')):
+                inclusive[name] += count
+        total = max(sum(self.samples.values()), 1)
+        lines = [f"{count:>8} {count / total * 100:6.1f}%  {name}" for name, count in inclusive.most_common(30)]
+        return f"采样 {total} 次（间隔 {self.interval * 1000:.0f} 毫秒）\n" + '\n'.join(lines)
+
+
+def start_profiling(mode: str = 'cprofile', output_dir: str = None) -> Optional[str]:
+    """
+    启用分段计时并开始性能剖析，进程退出时保存剖析结果并输出汇总
+
+    Args:
+        mode: cprofile 或 sample
+        output_dir: 剖析文件目录，默认为 PROFILE_DIR
+
+    Returns:
+        剖析文件路径
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"不支持的剖析模式: {mode}，可选 {', '.join(PROFILE_MODES)}")
+    output_dir = output_dir or Config.PROFILE_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'run'
+    suffix = 'prof' if mode == 'cprofile' else 'folded'
+    path = os.path.join(output_dir, f"{script}_{datetime.now():%Y%m%d_%H%M%S}.{suffix}")
+
+    profiler = _ThreadProfiles() if mode == 'cprofile' else _StackSampler(Config.PROFILE_SAMPLE_INTERVAL)
+
+    def finish():
+        try:
+            report = profiler.stop(path)
+            logger.info(f"性能剖析结果已保存到 {path}\n{report}")
+        except Exception as e:
+            logger.error(f"保存性能剖析结果失败: {e}")
+        log_summary()
+
+    # 分段汇总在剖析结束后由 finish 输出
+    enable(report_at_exit=False)
+    atexit.register(finish)
+    profiler.start()
+    logger.info(f"性能剖析已启动（{mode}），结果将保存到 {path}")
+    return path
+
+
+def setup_tracing(profile: str = None):
+    """入口脚本调用：指定 profile 时开始性能剖析，否则按 TRACE_ENABLED 决定是否只启用分段计时"""
+    if profile:
+        start_profiling(profile)
+    elif Config.TRACE_ENABLED:
+        enable()
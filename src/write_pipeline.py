@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+批量写入流水线模块
+
+获取线程把数据放入有界队列后立即继续请求，由一个后台写入线程合并为大批量写入数据库：
+    - 累计行数达到 batch_rows，或队列空闲超过 flush_interval 秒时写入一次
+    - 队列满时 put 阻塞，写入跟不上时获取线程自动放慢（背压），内存占用有上限
+    - 只有一个写入线程，SQLite 下不会出现多个写入事务争用锁
+    - 按调用方提供的标签（如交易板块）统计写入和失败的行数
+"""
+import queue
+import threading
+from typing import Callable, Dict, List
+import pandas as pd
+from loguru import logger
+
+from src.config import Config
+from src.metrics import get_registry
+
+_STOP = object()
+
+_metrics = get_registry()
+WRITE_QUEUE_DEPTH = _metrics.gauge('write_queue_depth', '后台写入队列中等待写入的数据块数', ['pipeline'])
+WRITE_BATCH_SECONDS = _metrics.histogram('write_batch_seconds', '后台写入每批数据的耗时（秒）', ['pipeline'])
+
+
+class WritePipeline:
+    """后台批量写入器"""
+
+    def __init__(self, save: Callable[[pd.DataFrame], bool], batch_rows: int = None,
+                 max_pending: int = None, flush_interval: float = 1.0, name: str = 'write-pipeline'):
+        """
+        Args:
+            save: 写入一批数据的函数，返回是否成功（如 DataStorage.save_daily_data）
+            batch_rows: 每次写入的行数
+            max_pending: 队列中最多等待写入的数据块数
+            flush_interval: 队列空闲多少秒后写入已累计的数据
+        """
+        self.save = save
+        self.batch_rows = batch_rows or Config.WRITE_BATCH_ROWS
+        self.flush_interval = flush_interval
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_pending or Config.WRITE_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def start(self) -> 'WritePipeline':
+        """启动后台写入线程"""
+        WRITE_QUEUE_DEPTH.labels(self.name).set_function(self._queue.qsize)
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def put(self, frame: pd.DataFrame, tag: str = None):
+        """提交一块数据（队列满时阻塞）"""
+        if frame is None or frame.empty:
+            return
+        self._queue.put((tag, frame))
+
+    def close(self) -> Dict[str, Dict[str, int]]:
+        """写入剩余数据并停止后台线程，返回各标签的写入统计"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            WRITE_QUEUE_DEPTH.labels(self.name).set_function(None)
+        return self.stats
+
+    def __enter__(self) -> 'WritePipeline':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _run(self):
+        """后台线程：累计到 batch_rows 行或队列空闲时写入"""
+        pending: List = []
+        rows = 0
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not _STOP:
+                pending.append(item)
+                rows += len(item[1])
+                if rows < self.batch_rows:
+                    continue
+
+            if pending:
+                self._write(pending)
+                pending, rows = [], 0
+            if item is _STOP:
+                return
+
+    def _write(self, items: List):
+        """合并写入一批数据，并按标签统计行数"""
+        counts: Dict[str, int] = {}
+        for tag, frame in items:
+            counts[tag] = counts.get(tag, 0) + len(frame)
+        try:
+            with WRITE_BATCH_SECONDS.labels(self.name).time():
+                ok = self.save(pd.concat([frame for _, frame in items], ignore_index=True))
+        except Exception as e:
+            logger.error(f"批量写入失败: {e}")
+            ok = False
+
+        with self._lock:
+            for tag, count in counts.items():
+                tag_stats = self.stats.setdefault(tag, {'rows': 0, 'failed_rows': 0, 'batches': 0})
+                tag_stats['rows' if ok else 'failed_rows'] += count
+                tag_stats['batches'] += 1
@@ -4,7 +4,13 @@
 """
 import sys
 import os
-from datetime import datetime
+import multiprocessing
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime
+import pandas as pd
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -12,7 +18,11 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from src.config import Config
 from src.data_fetcher import StockDataFetcher
 from src.data_storage import DataStorage
-from database import db_manager
+from src.gap_planner import GapPlanner
+from src.pipeline import Pipeline, StageSkip
+from src.import_jobs import ImportJobStore
+from src.import_worker import ImportWorker
+from database import db_manager, DatabaseManager
 
 
 def test_database_connection():
@@ -120,6 +130,222 @@ def test_system_integration():
         return False
 
 
+class _RecordingImporter:
+    """工作进程测试用的导入器：处理单元时把单元号追加到记录文件，不请求数据源"""
+
+    def __init__(self, manager, record_path: str):
+        self.job_store = ImportJobStore(manager)
+        self.record_path = record_path
+        self.unit_handlers = {'daily': self._handle}
+
+    def _handle(self, unit) -> int:
+        with open(self.record_path, 'a') as f:
+            f.write(f"{unit['id']}\n")
+        time.sleep(0.01)
+        return 1
+
+
+def _recording_worker(job_name: str, record_path: str):
+    """工作进程测试的子进程入口（与 run_workers 一样每个进程独立连接数据库）"""
+    manager = DatabaseManager(backend='sqlite')
+    ImportWorker(_RecordingImporter(manager, record_path), batch_size=5, poll_seconds=0.1).run(job_name=job_name)
+    manager.close()
+
+
+def test_import_workers():
+    """测试多个工作进程领取同一任务（临时SQLite数据库）"""
+    print("\n=== 测试导入工作进程 ===")
+    work_dir = tempfile.mkdtemp(prefix='qf_workers_')
+    sqlite_path = os.environ.get('SQLITE_PATH')
+    os.environ['SQLITE_PATH'] = os.path.join(work_dir, 'workers.db')
+    manager = DatabaseManager(backend='sqlite')
+    try:
+        manager.create_tables()
+        store = ImportJobStore(manager)
+        today = date.today()
+        
+        # 4个进程领取200个单元，每个单元只处理一次
+        record_path = os.path.join(work_dir, 'claimed.txt')
+        store.create_units('test_workers', 'daily', [(f"{i:06d}", today, today) for i in range(200)])
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=_recording_worker, args=('test_workers', record_path))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        if any(process.exitcode != 0 for process in processes):
+            print("❌ 工作进程异常退出")
+            return False
+        
+        with open(record_path) as f:
+            counts = Counter(int(line) for line in f if line.strip())
+        repeated = [unit_id for unit_id, count in counts.items() if count > 1]
+        if len(counts) != 200 or repeated or store.unfinished_count('test_workers') != 0:
+            print(f"❌ 单元领取异常: 处理 {len(counts)}/200 个，重复 {len(repeated)} 个")
+            return False
+        print("✅ 4个工作进程处理200个单元，每个单元只领取一次")
+        
+        # 租约未到期的单元不能被领取，到期后由其他工作进程重新领取
+        store.create_units('test_lease', 'daily', [(f"{i:06d}", today, today) for i in range(3)])
+        held = [unit['id'] for unit in store.claim_units('crashed', 'test_lease', limit=10, lease_seconds=1)]
+        if store.claim_units('survivor', 'test_lease', limit=10):
+            print("❌ 租约未到期的单元被重复领取")
+            return False
+        time.sleep(1.5)
+        reclaimed = [unit['id'] for unit in store.claim_units('survivor', 'test_lease', limit=10)]
+        if sorted(reclaimed) != sorted(held) or len(held) != 3:
+            print(f"❌ 租约到期的单元没有被重新领取: {held} -> {reclaimed}")
+            return False
+        if store.mark_done(held[0], 1, 'crashed') or not store.mark_done(held[0], 1, 'survivor'):
+            print("❌ 失去租约的工作进程仍能更新单元状态")
+            return False
+        print("✅ 租约到期的单元被重新领取，原领取者不能再更新状态")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 导入工作进程测试失败: {e}")
+        return False
+    finally:
+        manager.close()
+        if sqlite_path is None:
+            os.environ.pop('SQLITE_PATH', None)
+        else:
+            os.environ['SQLITE_PATH'] = sqlite_path
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class _GapFixture:
+    """缺口检测测试用的交易日历、股票信息、已保存日线和已完成单元"""
+
+    calendar = [date(2024, 1, d) for d in (2, 3, 4, 5, 9, 10, 11, 12, 15)]
+
+    def get_trade_calendar(self):
+        return self.calendar
+
+    def get_stock_listing(self, symbols=None):
+        return pd.DataFrame({
+            'symbol': ['000001', '000002', '000003'],
+            'list_date': [date(2020, 1, 1), date(2024, 1, 10), date(2020, 1, 1)],
+            'delist_date': [None, None, date(2024, 1, 5)],
+        })
+
+    def get_daily_symbols(self, start_date=None):
+        return ['000001', '000002', '000003']
+
+    def get_data_keys(self, data_type, start_date, end_date, symbols=None):
+        absent = (date(2024, 1, 4), date(2024, 1, 11), date(2024, 1, 12))
+        stored = [('000001', d) for d in self.calendar if d not in absent]
+        stored += [('000002', date(2024, 1, 10)), ('000003', date(2024, 1, 2))]
+        return pd.DataFrame(stored, columns=['symbol', 'trade_date'])
+
+    def done_ranges(self, data_type, symbols=None):
+        return pd.DataFrame([('000001', date(2024, 1, 12), date(2024, 1, 12))],
+                            columns=['symbol', 'start_date', 'end_date'])
+
+
+def test_gap_planner():
+    """测试缺口检测（不访问数据库和数据源）"""
+    print("\n=== 测试缺口检测 ===")
+    try:
+        fixture = _GapFixture()
+        planner = GapPlanner(fixture, fixture, fixture)
+        
+        def spans(**kwargs):
+            plan = planner.plan('daily', date(2024, 1, 2), date(2024, 1, 15), **kwargs)
+            return [(row.symbol, row.start_date.day, row.end_date.day, row.missing_days, row.span_days)
+                    for row in plan.itertuples()]
+        
+        # 交易日历外的日期（1月8日）不算缺失；上市前和退市后（不含退市日）不算缺失；已请求过的日期不再请求
+        expected = [('000001', 4, 4, 1, 1), ('000001', 11, 11, 1, 1), ('000002', 11, 15, 3, 3), ('000003', 3, 4, 2, 2)]
+        if spans() != expected:
+            print(f"❌ 缺失区间错误: {spans()}")
+            return False
+        print("✅ 缺失区间按交易日历、上市/退市日期和已完成单元计算")
+        
+        if spans(skip_attempted=False)[1] != ('000001', 11, 12, 2, 2):
+            print(f"❌ 不排除已请求日期时的缺失区间错误: {spans(skip_attempted=False)}")
+            return False
+        # 4日和11日之间相隔3个交易日，merge_gap=3时合并为一个区间
+        if spans(merge_gap=3)[0] != ('000001', 4, 11, 2, 5) or spans(merge_gap=2)[0] != ('000001', 4, 4, 1, 1):
+            print(f"❌ 合并区间错误: {spans(merge_gap=3)}")
+            return False
+        print("✅ 间隔不超过 merge_gap 个交易日的缺失区间合并")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 缺口检测测试失败: {e}")
+        return False
+
+
+def test_pipeline():
+    """测试阶段流水线的依赖、并行、重试和跳过（不访问数据库）"""
+    print("\n=== 测试阶段流水线 ===")
+    try:
+        attempts = Counter()
+        
+        def slow(value, seconds):
+            def stage(context):
+                time.sleep(seconds)
+                return value
+            return stage
+        
+        def flaky(context):
+            attempts['flaky'] += 1
+            if attempts['flaky'] == 1:
+                raise RuntimeError("第一次失败")
+            time.sleep(0.3)
+            return 2
+        
+        def broken(context):
+            raise RuntimeError("总是失败")
+        
+        def skip(context):
+            raise StageSkip("无需执行")
+        
+        pipeline = Pipeline('test_pipeline', max_workers=4)
+        pipeline.add_stage('start', lambda context: None)
+        pipeline.add_stage('left', slow(1, 0.2), deps=['start'])
+        pipeline.add_stage('right', flaky, deps=['start'], retries=1, retry_delay=0.01)
+        pipeline.add_stage('broken', broken, deps=['left'])
+        pipeline.add_stage('after_broken', slow(0, 0), deps=['broken'])
+        pipeline.add_stage('skip', skip, deps=['right'])
+        pipeline.add_stage('after_skip', slow(0, 0), deps=['skip'])
+        pipeline.add_stage('join', lambda context: time.sleep(0.1) or context['left'] + context['right'],
+                           deps=['left', 'right'])
+        
+        context = {}
+        records = pipeline.run(context)
+        statuses = {name: record['status'] for name, record in records.items()}
+        expected = {'start': 'success', 'left': 'success', 'right': 'success', 'broken': 'failed',
+                    'after_broken': 'skipped', 'skip': 'skipped', 'after_skip': 'skipped', 'join': 'success'}
+        if statuses != expected or records['right']['attempts'] != 2 or context['join'] != 3:
+            print(f"❌ 阶段状态错误: {statuses}")
+            return False
+        print("✅ 失败阶段重试，失败或跳过阶段的下游阶段记为跳过")
+        
+        # 互不依赖的阶段并行执行，right 重试后才完成，关键路径经过 right
+        if abs(records['left']['start'] - records['right']['start']) > 0.1 or records['join']['end'] > 0.6:
+            print(f"❌ 互不依赖的阶段没有并行执行: {records}")
+            return False
+        if pipeline.critical_path(records) != ['start', 'right', 'join']:
+            print(f"❌ 关键路径错误: {pipeline.critical_path(records)}")
+            return False
+        print("✅ 互不依赖的阶段并行执行，关键路径正确")
+        
+        # 单独重跑时其余阶段视为已完成
+        records = pipeline.run(context, only=['join'])
+        if list(records) != ['join'] or records['join']['status'] != 'success':
+            print(f"❌ 单独重跑阶段错误: {records}")
+            return False
+        print("✅ 单独重跑指定的阶段")
+        return True
+        
+    except Exception as e:
+        print(f"❌ 阶段流水线测试失败: {e}")
+        return False
+
+
 def main():
     """主测试函数"""
     print("量化金融系统测试")
@@ -141,7 +367,10 @@ def main():
         test_database_connection,
         test_data_fetcher,
         test_data_storage,
-        test_system_integration
+        test_system_integration,
+        test_import_workers,
+        test_gap_planner,
+        test_pipeline
     ]
     
     passed = 0